@@ -0,0 +1,197 @@
+"""
+Zip writing for the offline bundle.
+
+Deflating thousands of assets and many multi-megabyte .ini files is the
+slowest part of a release, and zipfile does it on one core. Here members are
+deflated in a process pool and then written into the archive in their
+original order, so the result is byte-for-byte what ZipFile.write() would
+have produced serially at the same compression level.
+
+When the previous archive is available, members whose path, size and CRC32
+are unchanged are not compressed at all: their raw deflate stream is copied
+straight across from the old archive, so a release costs time in proportion
+to what changed. The deflate level is recorded in the archive's comment, and
+nothing is reused from an archive built at another level, so the result is
+always what a build from scratch at that level would give.
+
+Not every member is deflated. Formats that are compressed already, such as
+the PNG thumbnails, are stored: deflating them costs time and makes them no
+smaller. The .ini, SVG and STL files, and anything else, are deflated at the
+level given for the archive.
+
+zipfile has no public way to add already-compressed data, so the member's
+compressor is swapped for one that hands back the precompressed stream
+while zipfile still computes the CRC, sizes and headers itself. Should a
+Python version lack the private attributes this relies on, the member is
+deflated again instead, which gives the same bytes, only more slowly.
+"""
+
+import logging
+import os
+import shutil
+import struct
+import zlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Same read size ZipFile.write() uses
+READ_SIZE = 1024 * 8
+# Local file header: signature, versions, flags, method, time, date, CRC,
+# sizes, then the lengths of the file name and extra field
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+# Suffixes of formats that are compressed already and are stored as they are
+STORED_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.zip', '.gz', '.bz2', '.xz', '.3mf'}
+
+
+class _Precompressed:
+    """Stand-in for a zlib compressobj that returns data deflated elsewhere."""
+
+    def __init__(self, data):
+        self._data = data
+
+    def compress(self, data):
+        data, self._data = self._data, b''
+        return data
+
+    def flush(self):
+        return self._data
+
+
+def member_compression(arcname, compresslevel=None):
+    """(compress_type, compresslevel) of a member: stored if its suffix is in STORED_SUFFIXES."""
+    if os.path.splitext(arcname)[1].lower() in STORED_SUFFIXES:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, compresslevel
+
+
+def deflate_file(path, compresslevel=None):
+    """Raw-deflate a file exactly as zipfile would for a ZIP_DEFLATED member."""
+    level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    parts = []
+    with open(path, 'rb') as f:
+        while chunk := f.read(READ_SIZE):
+            parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+    return b''.join(parts)
+
+
+def crc32_file(path):
+    """CRC32 of a file, as stored in zip headers."""
+    crc = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def read_raw_member(zf, zinfo):
+    """Return the still-compressed bytes of a member of an open ZipFile."""
+    fp = zf.fp
+    fp.seek(zinfo.header_offset)
+    header = LOCAL_HEADER.unpack(fp.read(LOCAL_HEADER.size))
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f'Bad local file header for {zinfo.filename}')
+    name_length, extra_length = header[-2:]
+    fp.seek(name_length + extra_length, os.SEEK_CUR)
+    return fp.read(zinfo.compress_size)
+
+
+def find_reusable(previous, members):
+    """Map arcnames to ZipInfos of `previous` whose content matches the member file.
+
+    Only deflated members are worth reusing; stored ones are as quick to write again.
+    """
+    reusable = {}
+    for path, arcname in members:
+        if member_compression(arcname)[0] != zipfile.ZIP_DEFLATED:
+            continue
+        try:
+            zinfo = previous.getinfo(arcname)
+        except KeyError:
+            continue
+        if (zinfo.compress_type == zipfile.ZIP_DEFLATED
+                and not zinfo.flag_bits & 0x1
+                and zinfo.file_size == os.path.getsize(path)
+                and zinfo.CRC == crc32_file(path)):
+            reusable[arcname] = zinfo
+    return reusable
+
+
+def level_comment(compresslevel=None):
+    """Archive comment recording the deflate level its members were compressed with."""
+    level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+    # zlib's default level is 6
+    if level == zlib.Z_DEFAULT_COMPRESSION:
+        level = 6
+    return f'deflate level {level}'.encode()
+
+
+def write_precompressed(zf, path, arcname, data, compresslevel=None):
+    """Add a file to zf using its already-deflated contents, or deflate it again if zipfile cannot take them."""
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    try:
+        zinfo._compresslevel = compresslevel
+    except AttributeError:
+        zf.write(path, arcname, zipfile.ZIP_DEFLATED, compresslevel)
+        return
+    with open(path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+        # Without a compressor to swap, the writer deflates src itself
+        if hasattr(dest, '_compressor'):
+            dest._compressor = _Precompressed(data)
+        shutil.copyfileobj(src, dest, READ_SIZE)
+
+
+def write_members(zf, members, compresslevel=None, workers=None, previous=None):
+    """Write (path, arcname) members into an archive, compressed as member_compression() says.
+
+    Members found unchanged in the `previous` archive (a path) are copied
+    across still compressed, if it was built at the same level. The rest are deflated with ZipFile.write() when
+    workers=1, otherwise in parallel, and everything is assembled in the
+    order given. Stored members are streamed from their file by
+    ZipFile.write(). Returns a dict with the number of reused, compressed
+    and stored members.
+    """
+    workers = workers or os.cpu_count() or 1
+    reused = {}
+    old_zf = None
+    if previous and os.path.exists(previous):
+        try:
+            old_zf = zipfile.ZipFile(previous)
+            if old_zf.comment == level_comment(compresslevel):
+                reused = find_reusable(old_zf, members)
+            else:
+                logging.info(f'Not reusing {previous}, it was built at another deflate level')
+        except (zipfile.BadZipFile, OSError) as e:
+            logging.warning(f'Not reusing {previous}: {e}')
+    zf.comment = level_comment(compresslevel)
+    compression = {arcname: member_compression(arcname, compresslevel) for _, arcname in members}
+    fresh = [(path, arcname) for path, arcname in members
+             if arcname not in reused and compression[arcname][0] == zipfile.ZIP_DEFLATED]
+    stored = sum(1 for compress_type, _ in compression.values() if compress_type == zipfile.ZIP_STORED)
+
+    pool = None
+    if workers > 1 and len(fresh) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        paths = [path for path, _ in fresh]
+        levels = [compression[arcname][1] for _, arcname in fresh]
+        compressed = pool.map(deflate_file, paths, levels,
+                              chunksize=max(1, len(paths) // (workers * 8)))
+    try:
+        for path, arcname in members:
+            compress_type, level = compression[arcname]
+            if arcname in reused:
+                data = read_raw_member(old_zf, reused[arcname])
+                write_precompressed(zf, path, arcname, data, level)
+            elif pool is None or compress_type == zipfile.ZIP_STORED:
+                zf.write(path, arcname, compress_type, level)
+            else:
+                write_precompressed(zf, path, arcname, next(compressed), level)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if old_zf is not None:
+            old_zf.close()
+    return {'reused': len(reused), 'compressed': len(fresh), 'stored': stored}
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the build and release steps on synthetic upstream bundles.
+
+prusa-upstream/ is often not checked out, and even when it is it only has
+the size it happens to have today. This script generates upstream-like
+bundles from a seed: versioned .ini files with tens of thousands of
+[filament:], [print:] and [printer:] sections, an index.idx, a few thousand
+assets and a set of Smartbox overlays that apply cleanly to them. It then
+runs each stage on them in a scratch directory, timing it and measuring its
+peak Python memory, and writes the results as JSON. It also measures how
+much memory every upstream version takes loaded at once, as plain dicts and
+in the compact profile_store.ProfileStore.
+
+The same seed and size always produce the same bundle (its digest is in the
+results), so two result files can be compared stage by stage:
+
+    python bench.py --sizes small medium
+    python bench.py --sizes medium --compare build/bench/bench-20250101-120000.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import build
+import release
+import version
+from archive import write_members
+from cache import BuildCache
+from ini_model import IniModel
+from ini_text import strip_comments
+from profile_store import load_upstream
+from vendors import Vendor
+
+# Bundle sizes: upstream .ini versions, sections in the latest one, assets
+SIZES = {
+    'small': {'versions': 3, 'sections': 2000, 'assets': 200},
+    'medium': {'versions': 6, 'sections': 10000, 'assets': 1000},
+    'large': {'versions': 10, 'sections': 40000, 'assets': 3000},
+}
+RESULTS_DIR = Path('build/bench')
+# Version given to the merged configuration, so no git history is needed
+BENCH_VERSION = '9.9.9'
+
+OPTIONS = {
+    'filament': ['bed_temperature', 'cooling', 'extrusion_multiplier', 'fan_always_on',
+                 'filament_colour', 'filament_cost', 'filament_density', 'filament_diameter',
+                 'filament_max_volumetric_speed', 'filament_retract_length', 'filament_type',
+                 'filament_vendor', 'first_layer_temperature', 'max_fan_speed', 'min_fan_speed',
+                 'start_filament_gcode', 'temperature'],
+    'print': ['bottom_solid_layers', 'bridge_speed', 'external_perimeter_speed', 'fill_density',
+              'fill_pattern', 'first_layer_height', 'gap_fill_speed', 'infill_speed', 'layer_height',
+              'perimeter_speed', 'perimeters', 'support_material', 'top_solid_layers',
+              'travel_speed'],
+    'printer': ['bed_shape', 'end_gcode', 'machine_max_acceleration_e', 'max_print_height',
+                'nozzle_diameter', 'printer_model', 'printer_notes', 'printer_variant',
+                'retract_length', 'retract_speed', 'start_gcode', 'wipe'],
+}
+# Share of the sections of each kind
+KIND_WEIGHTS = {'filament': 5, 'print': 3, 'printer': 2}
+
+
+def random_value(rng, option):
+    """A plausible value for an option, including the odd '#' that is not a comment."""
+    if option == 'filament_colour':
+        return f'#{rng.randrange(0x1000000):06X}'
+    if option.endswith('gcode'):
+        return f'"M104 S{rng.randrange(180, 280)} ; set temperature\\nG28 ; home"'
+    if option in ('filament_type', 'filament_vendor', 'fill_pattern', 'printer_model'):
+        return rng.choice(['PLA', 'PETG', 'ASA', 'Generic', 'gyroid', 'MK4S', 'XL'])
+    if option == 'printer_notes':
+        return 'Do not remove the keywords below.\\nPRINTER_VENDOR_PRUSA3D PRINTER_MODEL_MK4S'
+    return str(round(rng.uniform(0, 300), rng.choice([0, 2])))
+
+
+def make_section(rng, kind, name, parents):
+    body = [f'[{kind}:{name}]']
+    if parents:
+        body.append(f"inherits = {'; '.join(parents)}")
+    for option in sorted(rng.sample(OPTIONS[kind], rng.randrange(4, len(OPTIONS[kind])))):
+        if rng.random() < 0.05:
+            body.append(f'# {option} tuned for the {kind} profile')
+        body.append(f'{option} = {random_value(rng, option)}')
+    return '\n'.join(body) + '\n\n'
+
+
+def generate_profiles(rng, sections):
+    """Generate the sections of the newest upstream version, grouped by where they go in the file.
+
+    Older versions use a prefix of the concrete profiles, so like the real
+    upstream files most of their content is shared with the newer ones.
+    """
+    kinds = [kind for kind, weight in KIND_WEIGHTS.items() for _ in range(weight)]
+    names = {kind: [] for kind in KIND_WEIGHTS}
+    abstract = {kind: [f'*{kind}{i}*' for i in range(8)] for kind in KIND_WEIGHTS}
+    models = [f'[printer_model:MODEL{model}]\nname = Original Prusa MODEL{model}\n'
+              f'variants = 0.4; 0.6\ntechnology = FFF\nthumbnail = MODEL{model}_thumbnail.png\n\n'
+              for model in range(max(1, sections // 500))]
+    # [printer:*common*] goes last, the overlays are inserted before it
+    head = []
+    for kind in ('filament', 'print'):
+        head.append(make_section(rng, kind, '*common*', []))
+        for name in abstract[kind]:
+            head.append(make_section(rng, kind, name, ['*common*']))
+    printer_head = [make_section(rng, 'printer', '*common*', [])]
+    for name in abstract['printer']:
+        printer_head.append(make_section(rng, 'printer', name, ['*common*']))
+    concrete = []
+    for i in range(sections):
+        kind = rng.choice(kinds)
+        name = f'{kind.title()} {i:05d} @MODEL{rng.randrange(8)}'
+        # Inherit from an abstract profile, and sometimes also an earlier concrete one
+        parents = [rng.choice(abstract[kind])]
+        if names[kind] and rng.random() < 0.3:
+            parents.insert(0, rng.choice(names[kind]))
+        concrete.append((kind, name, make_section(rng, kind, name, parents)))
+        names[kind].append(name)
+    return {'models': models, 'head': head, 'printer_head': printer_head, 'concrete': concrete}
+
+
+def render_ini(rng, profiles, config_version, count, revised=0.02):
+    """Render one upstream version with the first `count` concrete profiles.
+
+    A `revised` share of them get an extra option, as profiles tuned in that
+    release. Returns the text and the concrete filament sections by name.
+    """
+    parts = [
+        '# Print profiles for the Prusa Research printers.\n\n',
+        '[vendor]\n# Vendor name will be shown by the Config Wizard.\nname = Prusa Research\n'
+        f'config_version = {config_version}\n'
+        'config_update_url = https://files.prusa3d.com/wp-content/uploads/repository/PrusaSlicer-settings-master/live/PrusaResearch/\n\n',
+        *profiles['models'],
+        *profiles['head'],
+    ]
+    filaments = {}
+    printers = []
+    for kind, name, text in profiles['concrete'][:count]:
+        if rng.random() < revised:
+            text = text[:-1] + f'compatible_printers_condition = nozzle_diameter[0]!={rng.choice(["0.25", "0.8"])}\n\n'
+        if kind == 'filament':
+            filaments[name] = text
+        if kind == 'printer':
+            printers.append(text)
+        else:
+            parts.append(text)
+    parts.extend(profiles['printer_head'])
+    parts.extend(printers)
+    parts.append('[obsolete_presets]\nprint="0.05mm DETAIL"\nfilament="Prusa ABS"\n')
+    return ''.join(parts), filaments
+
+
+def generate_bundle(root, versions, sections, assets, seed=0):
+    """Write a synthetic checkout (prusa-upstream/PrusaResearch and Smartbox/) under root.
+
+    Older versions get proportionally fewer sections. Returns the sha256 of
+    everything generated, to confirm two runs benchmarked the same input.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    upstream = root / 'prusa-upstream/PrusaResearch'
+    overlay_dir = root / 'Smartbox'
+    upstream.mkdir(parents=True)
+    overlay_dir.mkdir()
+    digest = hashlib.sha256()
+
+    def write(path, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        path.write_bytes(data)
+        digest.update(path.name.encode() + b'\0' + data)
+
+    index_lines = ['min_slic3r_version = 2.8.1']
+    profiles = generate_profiles(rng, sections)
+    for minor in range(versions):
+        config_version = f'2.{minor}.0'
+        count = max(10, sections * (minor + 1) // versions)
+        text, filaments = render_ini(rng, profiles, config_version, count)
+        write(upstream / f'{config_version}.ini', text)
+        index_lines.insert(1, f'{config_version} Synthetic release {minor}.')
+    write(upstream / 'index.idx', '\n'.join(index_lines) + '\n')
+
+    for i in range(assets):
+        kind = rng.choice(['png', 'svg', 'stl'])
+        if kind == 'png':
+            data = b'\x89PNG\r\n\x1a\n' + rng.randbytes(rng.randrange(2000, 20000))
+        elif kind == 'svg':
+            data = '<svg>' + ''.join(f'<path d="M{rng.randrange(250)} {rng.randrange(210)}"/>'
+                                     for _ in range(rng.randrange(50, 500))) + '</svg>'
+        else:
+            data = 'solid bed\n' + ''.join(f'facet normal 0 0 {rng.randrange(2)}\n'
+                                           for _ in range(rng.randrange(100, 2000))) + 'endsolid\n'
+        write(upstream / f'asset{i:05d}.{kind}', data)
+
+    # Overlays against the latest version: replace a few of its filaments,
+    # the way the Smartbox overlays replace upstream profiles, and add more
+    replaced = rng.sample(sorted(filaments), min(5, len(filaments)))
+    for i, name in enumerate(replaced):
+        write(overlay_dir / f'replaced{i}.rm.ini', filaments[name])
+        write(overlay_dir / f'replaced{i}.add.ini',
+              make_section(rng, 'filament', name, ['*filament0*']))
+    for i in range(20):
+        parent = rng.choice(sorted(filaments))
+        text = make_section(rng, 'filament', f'Smartbox {i}', ['*filament1*'])
+        text += make_section(rng, 'filament', f'Smartbox {i} @XL', [f'Smartbox {i}', parent])
+        write(overlay_dir / f'smartbox{i}.add.ini', text)
+    return digest.hexdigest()
+
+
+def measure(run, setup=None, repeat=1):
+    """Time run() `repeat` times, then run it once more under tracemalloc for its peak memory.
+
+    setup() is called before every run and is not measured.
+    """
+    wall = []
+    cpu = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        run()
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(time.process_time() - start_cpu)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'wall': min(wall), 'cpu': min(cpu), 'wall_all': wall, 'peak_memory': peak}
+
+
+def bench_stages(repeat=1, workers=None):
+    """Benchmark each stage on the bundle in the current directory."""
+    upstream_files = sorted(f for f in Path('prusa-upstream/PrusaResearch').iterdir() if f.is_file())
+    ini_files = [f for f in upstream_files if f.suffix == '.ini']
+    overlays = version.read_overlays()
+    latest_ini = build.find_latest_ini(ini_files)
+    latest_text = latest_ini.read_text(encoding='utf-8')
+    filaments = version.get_smartbox_filaments(overlays)
+    index_content = version.generate_index_idx(BENCH_VERSION, filaments, '2.0.0')
+
+    def clean_build():
+        # As left by the version step
+        shutil.rmtree('build', ignore_errors=True)
+        Path('build').mkdir()
+        Path('build/index.idx').write_text(index_content, encoding='utf-8')
+
+    def unstage_latest_ini():
+        Path('build/PrusaResearch', latest_ini.name).unlink(missing_ok=True)
+
+    def bundle_assets():
+        # The assets are no longer copied into build/ but listed and streamed
+        # from prusa-upstream/ into the offline zip; this is that part alone
+        asset_members = [(path, arcname) for path, arcname in release.bundle_members(Vendor())
+                         if not arcname.endswith('.ini')]
+        with zipfile.ZipFile('build/bench-assets.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
+            write_members(zf, asset_members, workers=workers)
+
+    def remove_assets_zip():
+        Path('build/bench-assets.zip').unlink(missing_ok=True)
+
+    def prepare_archive():
+        release.create_manifest()
+        release.create_vendor_indices(index_content)
+        Path('build/prusa-fff-offline.zip').unlink(missing_ok=True)
+
+    def validate():
+        if not release.validate_archive(upstream_files):
+            raise RuntimeError('The benchmark archive failed validation')
+
+    stages = [
+        ('strip_comments', lambda: strip_comments(latest_text), None),
+        ('merge_configuration', lambda: build.merge_configuration(latest_ini, BENCH_VERSION, overlays), None),
+        ('process_files', lambda: build.process_files(BENCH_VERSION, ini_files, overlays, BuildCache()),
+         clean_build),
+        ('generate_index_idx', lambda: version.generate_index_idx(BENCH_VERSION, filaments, '2.0.0'), None),
+        ('stage_ini_files', lambda: release.copy_prusa_research_files(upstream_files), unstage_latest_ini),
+        ('bundle_assets', bundle_assets, remove_assets_zip),
+        ('create_offline_archive', lambda: release.create_offline_archive(workers=workers), prepare_archive),
+        # With the previous archive in place every member is reused
+        ('create_offline_archive_incremental', lambda: release.create_offline_archive(workers=workers), None),
+        ('validate_archive', validate, None),
+    ]
+    results = {}
+    for name, run, setup in stages:
+        results[name] = measure(run, setup, repeat)
+        logging.warning(f"{name}: {results[name]['wall']:.3f}s wall, "
+                        f"{results[name]['peak_memory'] / 2**20:.1f} MiB peak")
+    results['create_offline_archive']['archive_bytes'] = Path('build/prusa-fff-offline.zip').stat().st_size
+    return results
+
+
+def retained_memory(load):
+    """Python memory still allocated by load()'s result while it is alive, and the time it took."""
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = load()
+        elapsed = time.perf_counter() - start
+        retained = tracemalloc.get_traced_memory()[0]
+        del result
+    finally:
+        tracemalloc.stop()
+    return {'bytes': retained, 'seconds': elapsed}
+
+
+def bench_store(upstream_dir='prusa-upstream/PrusaResearch'):
+    """Memory of every upstream version loaded at once: plain dicts against ProfileStore."""
+    ini_files = sorted(Path(upstream_dir).glob('*.ini'))
+
+    def load_dicts():
+        versions = {}
+        for path in ini_files:
+            model = IniModel(strip_comments(path.read_text(encoding='utf-8')))
+            versions[path.stem] = {section.key: dict(section.items()) for section in model.sections}
+        return versions
+
+    results = {
+        'file_bytes': sum(path.stat().st_size for path in ini_files),
+        'dicts': retained_memory(load_dicts),
+        'store': retained_memory(lambda: load_upstream(upstream_dir)),
+        'store_stats': load_upstream(upstream_dir).stats(),
+    }
+    logging.warning(f"profile_store: {results['file_bytes'] / 2**20:.1f} MiB of .ini files take "
+                    f"{results['dicts']['bytes'] / 2**20:.1f} MiB as dicts, "
+                    f"{results['store']['bytes'] / 2**20:.1f} MiB in ProfileStore")
+    return results
+
+
+def compare(previous, current):
+    """Print the change in wall time and peak memory per stage between two result files."""
+    before = {(r['size'], name): stage for r in previous['runs'] for name, stage in r['stages'].items()}
+    for run in current['runs']:
+        for name, stage in run['stages'].items():
+            old = before.get((run['size'], name))
+            if old is None:
+                continue
+            print(f"{run['size']:>8} {name:<36} {old['wall']:8.3f}s -> {stage['wall']:8.3f}s "
+                  f"({stage['wall'] / old['wall']:5.2f}x)  "
+                  f"{old['peak_memory'] / 2**20:7.1f} -> {stage['peak_memory'] / 2**20:7.1f} MiB")
+            if 'archive_bytes' in old and 'archive_bytes' in stage:
+                print(f"{'':>8} {'archive size':<36} {old['archive_bytes']:,} -> {stage['archive_bytes']:,} bytes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic upstream bundles.')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best is reported')
+    parser.add_argument('--workers', type=int, help='processes used to compress the archive')
+    parser.add_argument('--output', type=Path, help=f'result file (default: {RESULTS_DIR}/bench-<time>.json)')
+    parser.add_argument('--compare', type=Path, help='earlier result file to compare against')
+    parser.add_argument('--keep', action='store_true', help='keep the generated bundles')
+    args = parser.parse_args(argv)
+
+    # The scripts log every file they touch; only the benchmark's own summary is wanted
+    logging.getLogger().setLevel(logging.WARNING)
+    started = datetime.now()
+    output = (args.output or RESULTS_DIR / f"bench-{started.strftime('%Y%m%d-%H%M%S')}.json").resolve()
+    previous_results = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous_results = json.load(f)
+
+    results = {
+        'started': started.isoformat(timespec='seconds'),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runs': [],
+    }
+    cwd = Path.cwd()
+    for size in args.sizes:
+        workdir = Path(tempfile.mkdtemp(prefix=f'bench-{size}-'))
+        try:
+            logging.warning(f'Generating {size} bundle in {workdir}')
+            start = time.perf_counter()
+            bundle_digest = generate_bundle(workdir, seed=args.seed, **SIZES[size])
+            generate_time = time.perf_counter() - start
+            os.chdir(workdir)
+            try:
+                stages = bench_stages(args.repeat, args.workers)
+                store = bench_store()
+            finally:
+                os.chdir(cwd)
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        results['runs'].append({
+            'size': size,
+            'params': SIZES[size],
+            'bundle_sha256': bundle_digest,
+            'generate_time': generate_time,
+            'stages': stages,
+            'profile_store': store,
+        })
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {output}')
+
+    if previous_results:
+        compare(previous_results, results)
+
+
+if __name__ == '__main__':
+    main()
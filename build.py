@@ -1,54 +1,74 @@
 import os
-import re
 import logging
 import sys
-from pathlib import Path
+
+import metrics
+from cache import BuildCache, hash_file
+from catalog import write_catalog
+from compatibility import CompatibilityMatrix, check_overlays
+from fileops import copy_file, copy_files, describe_copy
+from ini_model import IniModel, describe_differences, format_key
+from ini_text import find_latest_ini, read_stripped, strip_comments
+from profiles import ProfileResolver
+from section_index import content_digest, load_index, section_body
+from vendors import Vendor
+from version import generate as generate_version_info, read_overlays
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def parse_version(filename):
-    match = re.match(r'(\d+)\.(\d+)\.(\d+)', os.path.basename(filename))
-    if match:
-        return tuple(map(int, match.groups()))
-    return (0, 0, 0)
+def remove_sections(model, removals):
+    """Remove every section of `removals` from `model`.
 
-def find_latest_ini():
-    prusa_dir = Path('prusa-upstream/PrusaResearch')
-    ini_files = [f for f in prusa_dir.glob('*.ini') if re.match(r'\d+\.\d+\.\d+\.ini$', f.name)]
-    latest = max(ini_files, key=lambda x: parse_version(x))
-    logging.info(f'Found latest ini file: {latest}')
-    return latest
+    Each section must exist in the model with the same options and values.
+    They are compared by fingerprint, so the order of the options and
+    whitespace around keys and values do not matter. Returns a list of the
+    problems found; if there are any, nothing is removed.
+    """
+    problems = []
+    if removals.preamble.strip():
+        problems.append('content outside of any section')
+    for section in removals.sections:
+        existing = model.get(section.key)
+        digest = section.fingerprint()
+        if existing is None:
+            problem = f'{format_key(section.key)} not found'
+            # Upstream may have renamed the profile without changing it
+            renamed = model.find_fingerprint(digest)
+            if renamed:
+                problem += f', but {format_key(renamed[0])} has the same options'
+            problems.append(problem)
+        elif existing.fingerprint() != digest:
+            differences = describe_differences(section, existing)
+            problems.append(f'{format_key(section.key)} differs: {"; ".join(differences)}')
+    if not problems:
+        for section in removals.sections:
+            model.remove(section.key)
+    return problems
 
-def strip_comments(text):
-    # Strip comments while preserving empty lines and color-related comments
-    lines = []
-    for line in text.splitlines():
-        if 'colour' in line.lower():
-            # Preserve lines containing 'color' as is
-            lines.append(line.rstrip())
+def check_removals(index, overlays):
+    """Sections of the .rm.ini files that the upstream section index does not have.
+    
+    Only whether each section exists is checked, one lookup per section
+    before the upstream file is read at all; remove_sections() compares
+    their options during the merge. Returns the problems found per file.
+    """
+    problems = {}
+    for path, content in overlays.items():
+        if not path.name.endswith('.rm.ini'):
             continue
-            
-        # Find position of first # that isn't escaped
-        comment_pos = -1
-        i = 0
-        while i < len(line):
-            if line[i] == '#' and (i == 0 or line[i-1] != '\\'):
-                comment_pos = i
-                break
-            i += 1
-            
-        if comment_pos != -1:
-            # Take only the part before the comment and strip whitespace
-            stripped_line = line[:comment_pos].rstrip()
-            lines.append(stripped_line)
-        else:
-            # No comment found, preserve the line as is
-            lines.append(line.rstrip())
-            
-    return '\n'.join(lines)
+        for section in IniModel(content).sections:
+            if section.key in index:
+                continue
+            problem = f'{format_key(section.key)} not found'
+            # Upstream may have renamed the profile without changing it
+            renamed = index.find_digest(content_digest(section_body(section.raw())))
+            if renamed:
+                problem += f', but {format_key(renamed[0])} has the same content'
+            problems.setdefault(path, []).append(problem)
+    return problems
 
 def create_versioned_ini(content, version):
     """Create a versioned .ini filename based on our version."""
@@ -57,131 +77,220 @@ def create_versioned_ini(content, version):
     base_version = version.split('-')[0]  # "9.3.0" from "9.3.0-dev.42"
     return f'{base_version}.ini'
 
-def process_files():
-    logging.info('Starting file processing')
+def merge_model(latest_ini, version, overlays=None):
+    """Apply the Smartbox removals and additions to the latest upstream ini.
     
-    # Generate version information
-    logging.info('Generating version information')
-    import subprocess
-    try:
-        result = subprocess.run([sys.executable, 'version.py'], check=True, capture_output=True, text=True)
-        logging.info('Version generation completed')
-    except subprocess.CalledProcessError as e:
-        logging.error(f'Version generation failed: {e.stderr}')
-        sys.exit(1)
+    overlays maps each Smartbox/*.ini path to its text, see
+    version.read_overlays(). The upstream file is stripped and indexed as
+    bytes, never decoded as a whole; returns the merged IniModel.
+    """
+    if overlays is None:
+        overlays = read_overlays()
     
-    # Read the generated version
-    try:
-        with open('build/version.txt', 'r') as f:
-            version = f.read().strip()
-        logging.info(f'Using version: {version}')
-    except FileNotFoundError:
-        logging.error('Version file not found, using fallback')
-        version = '9.3.0'
-    Path('build').mkdir(exist_ok=True)
-    logging.info('Created build directory')
-    
-    latest_ini = find_latest_ini()
-    with open(latest_ini, 'r', encoding='utf-8') as f:
-        content = f.read()
+    # First strip comments from the base content, then index it by section
+    with metrics.stage('strip_comments'):
+        content = read_stripped(latest_ini)
     logging.info(f'Read content from {latest_ini}')
+    model = IniModel(content)
     
-    # First strip comments from the base content
-    content = strip_comments(content)
-    
-    smartbox = Path('Smartbox')
-    rm_files = list(smartbox.glob('*.rm.ini'))
+    rm_files = [path for path in overlays if path.name.endswith('.rm.ini')]
     logging.info(f'Found {len(rm_files)} removal files')
     
     for rm_file in rm_files:
-        with open(rm_file, 'r', encoding='utf-8') as f:
-            rm_content = f.read()
+        rm_content = overlays[rm_file]
         # Strip comments from removal content before comparison
-        rm_content_stripped = strip_comments(rm_content)
-        if rm_content_stripped in content:
-            content = content.replace(rm_content_stripped, '')
+        problems = remove_sections(model, IniModel(strip_comments(rm_content)))
+        if not problems:
             logging.info(f'Removed content from {rm_file}')
         else:
+            for problem in problems:
+                logging.error(f'{rm_file}: {problem}')
             logging.error(f'Content from {rm_file} not found in base configuration')
             logging.error(f'Build failed: Cannot remove content that does not exist')
             sys.exit(1)
     
-    # Find the position of [printer:*common*]
-    obsolete_pos = content.find('[printer:*common*]')
-    if obsolete_pos == -1:
-        obsolete_pos = len(content)  # If section not found, append at end
-        
     # Process addition files
-    add_files = list(smartbox.glob('*.add.ini'))
+    add_files = [path for path in overlays if path.name.endswith('.add.ini')]
     logging.info(f'Found {len(add_files)} addition files')
     
     additional_content = []
     for add_file in add_files:
-        with open(add_file, 'r', encoding='utf-8') as f:
-            add_content = f.read()
+        add_content = overlays[add_file]
         # Strip comments from additional content before adding
         add_content_stripped = strip_comments(add_content)
         if add_content_stripped.strip():  # Only add if there's non-empty content
             additional_content.append(add_content_stripped)
             logging.info(f'Added content from {add_file}')
     
-    # Combine all additional content with proper spacing
+    # Combine all additional content with proper spacing and insert it
+    # before [printer:*common*], or at the end if that section is missing
     if additional_content:
         combined_additions = '\n\n\n\n\n'.join(additional_content) + '\n\n\n\n\n'
-        # Insert before [obsolete_presets]
-        content = content[:obsolete_pos] + combined_additions + content[obsolete_pos:]
+        model.insert_before(('printer', '*common*'), IniModel(combined_additions))
+        for key in model.duplicates:
+            logging.warning(f'Duplicate section {format_key(key)} in merged configuration')
     
     # Update config_version to our version
-    import re
-    config_version_pattern = r'config_version\s*=\s*[^\n]+'
-    if re.search(config_version_pattern, content):
-        content = re.sub(config_version_pattern, f'config_version = {version}', content)
+    vendor = model.get(('vendor', ''))
+    if vendor is not None and vendor.set('config_version', version):
         logging.info(f'Updated config_version to {version}')
     else:
         logging.warning('config_version not found in content')
     
-    # Copy ALL original .ini files to maintain Prusa structure
-    prusa_build_dir = Path('build/PrusaResearch')
+    # Flatten every profile so that an unknown or cyclic parent in `inherits`
+    # fails the build here rather than when PrusaSlicer loads the bundle
+    with metrics.stage('resolve_profiles'):
+        resolved, errors = ProfileResolver(model).check_all()
+    if errors:
+        for error in errors:
+            logging.error(error)
+        logging.error('Build failed: Profile inheritance could not be resolved')
+        sys.exit(1)
+    logging.info(f'Resolved inheritance for {resolved} profiles')
+    
+    return model
+
+def merge_configuration(latest_ini, version, overlays=None):
+    """The merged configuration as text, see merge_model()."""
+    return merge_model(latest_ini, version, overlays).serialize()
+
+def write_merged(model, version, vendor=None):
+    """Write the merged model under its version and as PrusaResearch.ini.
+    
+    It is written once, straight from the model, and then linked (or
+    copied) to the other two places.
+    """
+    vendor = vendor or Vendor()
+    versioned_filename = create_versioned_ini('', version)
+    prusa_build_dir = vendor.build_dir
+    output_path = vendor.output_dir / versioned_filename
+    
+    # Replace rather than overwrite, the copies may be hardlinks into prusa-upstream/
+    (prusa_build_dir / versioned_filename).unlink(missing_ok=True)
+    with open(prusa_build_dir / versioned_filename, 'wb') as f:
+        model.write(f)
+    logging.info(f'Created new version: {prusa_build_dir / versioned_filename}')
+    
+    # The final content with versioned filename in root build dir, and the
+    # standard PrusaResearch.ini for backwards compatibility
+    for path in (output_path, vendor.merged_ini):
+        method, _ = copy_file(prusa_build_dir / versioned_filename, path)
+        logging.info(f'Wrote {path} ({method})')
+
+def write_compatibility(model, overlays, vendor, resolver=None):
+    """Save which printers offer each filament, failing if an overlay filament reaches none."""
+    with metrics.stage('compatibility'):
+        matrix = CompatibilityMatrix.evaluate(model, resolver)
+    for error in matrix.errors:
+        logging.warning(f'compatible_printers_condition of {error}')
+    problems = check_overlays(matrix, overlays)
+    if problems:
+        for problem in problems:
+            logging.error(problem)
+        logging.error('Build failed: Overlay profiles would not be shown for any printer')
+        sys.exit(1)
+    matrix.write(vendor.compatibility_path)
+    logging.info(f'Wrote compatibility of {len(matrix.profiles)} filaments with '
+                 f'{len(matrix.printers)} printers to {vendor.compatibility_path}')
+
+def copy_upstream_ini_files(ini_files, prusa_build_dir, cache=None):
+    """Copy ALL original .ini files to maintain Prusa structure."""
     prusa_build_dir.mkdir(parents=True, exist_ok=True)
+    hasher = cache.file_hash if cache else hash_file
+    stats = copy_files([(f, prusa_build_dir / f.name) for f in ini_files], hasher=hasher)
+    logging.info(f'Copied {len(ini_files)} .ini files to {prusa_build_dir}/: {describe_copy(stats)}')
+
+def copy_ini_files(ini_files, cache, vendor):
+    """The copy stage: link the upstream .ini files into build/<Vendor>/ unless they are there.
     
-    prusa_source_dir = Path('prusa-upstream/PrusaResearch')
-    ini_files = list(prusa_source_dir.glob('*.ini'))
-    
-    for ini_file in ini_files:
-        if ini_file.name == latest_ini.name:
-            # Copy the original file first
-            import shutil
-            shutil.copy2(ini_file, prusa_build_dir / ini_file.name)
-            # Then create our new versioned file with modified content
-            new_versioned_filename = create_versioned_ini('', version)
-            with open(prusa_build_dir / new_versioned_filename, 'w', encoding='utf-8') as f:
-                f.write(content)
-            logging.info(f'Copied original {ini_file.name} and created new version: {new_versioned_filename}')
-        else:
-            # Copy older versions as-is
-            import shutil
-            shutil.copy2(ini_file, prusa_build_dir / ini_file.name)
+    Returns the stage's cache key, which the merge depends on.
+    """
+    prusa_build_dir = vendor.build_dir
+    with metrics.stage('copy') as record:
+        copy_key = cache.key('copy', ini_files)
+        record['cached'] = cache.fresh('copy', copy_key, [prusa_build_dir / f.name for f in ini_files])
+        if not record['cached']:
+            copy_upstream_ini_files(ini_files, prusa_build_dir, cache)
+            # Without output hashes: the assets stage replaces the latest
+            # .ini with the merged one, which is no reason to copy again
+            cache.store('copy', copy_key)
+    return copy_key
+
+def merge_files(version, ini_files, overlays, copy_key, cache=None, vendor=None):
+    """The merge stage: write the merged configuration and what is derived from it, unless up to date.
     
-    logging.info(f'Copied {len(ini_files)} .ini files to build/PrusaResearch/')
+    Runs in a worker process when scheduled by pipeline.py, so it takes
+    nothing that cannot be pickled; cache is then loaded afresh.
+    """
+    cache = cache or BuildCache()
+    vendor = vendor or Vendor()
+    latest_ini = find_latest_ini(ini_files)
+    if latest_ini is None:
+        vendor.report_missing_upstream()
+        sys.exit(1)
+    vendor.output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Write the final content with versioned filename in root build dir
+    # The merged file is written next to the original copies, under our own
+    # version, so it has to be redone whenever those copies are
     versioned_filename = create_versioned_ini('', version)
-    output_path = f'build/{versioned_filename}'
+    output_path = vendor.output_dir / versioned_filename
+    merge_outputs = [output_path, vendor.merged_ini, vendor.build_dir / versioned_filename,
+                     vendor.compatibility_path, vendor.catalog_path]
+    with metrics.stage('merge') as record:
+        merge_key = cache.key('merge', [latest_ini, *overlays], [version, copy_key])
+        record['cached'] = cache.fresh('merge', merge_key, merge_outputs)
+        if not record['cached']:
+            # Fail on a removal upstream does not have before parsing the whole file
+            for rm_file, problems in check_removals(load_index(latest_ini, cache), overlays).items():
+                for problem in problems:
+                    logging.error(f'{rm_file}: {problem}')
+                logging.error(f'Content from {rm_file} not found in base configuration')
+                logging.error(f'Build failed: Cannot remove content that does not exist')
+                sys.exit(1)
+            model = merge_model(latest_ini, version, overlays)
+            resolver = ProfileResolver(model)
+            write_compatibility(model, overlays, vendor, resolver)
+            with metrics.stage('catalog'):
+                write_catalog(model, vendor.catalog_path, resolver)
+            write_merged(model, version, vendor)
+            cache.store('merge', merge_key, merge_outputs)
+
+def process_files(version=None, ini_files=None, overlays=None, cache=None, vendor=None):
+    """Build the merged configuration and copy the upstream .ini files into build/.
+    
+    version, the upstream .ini listing and the overlay texts are generated
+    or read here unless a caller already has them. vendor selects the
+    bundle to build, PrusaResearch by default (see vendors.py). The merged
+    configuration is left in build/, in vendor.merged_ini and its links.
+    """
+    logging.info('Starting file processing')
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    logging.info(f'Wrote final output to {output_path}')
+    vendor = vendor or Vendor()
+    if ini_files is None:
+        ini_files = vendor.ini_files
+    if overlays is None:
+        overlays = read_overlays(vendor.overlay_dir)
+    cache = cache or BuildCache()
     
-    # Also create the standard PrusaResearch.ini for backwards compatibility
-    with open('build/PrusaResearch.ini', 'w', encoding='utf-8') as f:
-        f.write(content)
-    logging.info('Wrote backward compatibility file to build/PrusaResearch.ini')
+    # Generate version information
+    if version is None:
+        logging.info('Generating version information')
+        version = generate_version_info(ini_files, overlays, cache)['version']
+        logging.info('Version generation completed')
+    logging.info(f'Using version: {version}')
+    vendor.output_dir.mkdir(parents=True, exist_ok=True)
+    
+    copy_key = copy_ini_files(ini_files, cache, vendor)
+    merge_files(version, ini_files, overlays, copy_key, cache, vendor)
     
     # Verify the generated index.idx file exists
-    if os.path.exists('build/index.idx'):
+    if os.path.exists(vendor.index_path):
         logging.info('Generated index.idx file is ready')
     else:
         logging.warning('Generated index.idx not found, this should not happen')
 
 if __name__ == '__main__':
-    process_files()
\ No newline at end of file
+    try:
+        process_files()
+    finally:
+        metrics.write_report()
\ No newline at end of file
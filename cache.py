@@ -0,0 +1,185 @@
+"""
+Content-hash cache that lets build stages be skipped when nothing changed.
+
+Each stage (version, merge, copy, vendor_indices, offline zip) computes a key
+from the content hashes of its inputs, the hash of the build scripts
+themselves and any extra values such as the computed version string. If the
+key matches the one recorded by the last successful run, and the stage's
+outputs are still there, the stage is skipped. A stage can also have the
+content hashes of its outputs recorded, for files a later stage might
+replace: it then runs again if they no longer match.
+
+File hashes are memoized by (size, mtime) so an unchanged file is only
+stat()ed, never re-read. Everything lives under build/.cache; deleting that
+directory forces a full rebuild.
+
+Stages scheduled concurrently (see scheduler.py) share one BuildCache
+between threads, and stages run in worker processes load their own. Saving
+only writes the entries this BuildCache changed on top of what is on disk,
+so the stages recorded by another process are kept.
+
+read_sidecar() and write_sidecar() keep what is derived from a single file,
+such as section_index.py's index or lint.py's schema, in a JSON file named
+after that file's hash.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path('build/.cache')
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the sha256 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_sidecar(path, format_version):
+    """The data saved by write_sidecar(), or None if it is missing, unreadable or of another format."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('format') != format_version:
+        return None
+    return data
+
+
+def write_sidecar(path, format_version, data):
+    """Save data, a dict, as JSON alongside its format number.
+
+    Sidecars are named after the hash of the file they describe, so a file
+    that changes gets a new one, and bumping the format drops the old ones.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written aside and renamed, so a concurrent build never reads half of it
+    partial = path.with_suffix(f'.{os.getpid()}.part')
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump({'format': format_version, **data}, f, separators=(',', ':'), ensure_ascii=False)
+    partial.replace(path)
+
+
+def script_digest():
+    """Hash of the build scripts, so changing the pipeline invalidates every stage."""
+    digest = hashlib.sha256()
+    for script in sorted(Path(__file__).resolve().parent.glob('*.py')):
+        digest.update(script.name.encode())
+        digest.update(script.read_bytes())
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """Persistent record of stage keys and memoized file hashes."""
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = Path(root)
+        self._hashes = self._load('hashes.json')
+        self._stages = self._load('stages.json')
+        self._scripts = script_digest()
+        self._dirty = False
+        # Keys changed since the last save, per file
+        self._changed = {'hashes.json': set(), 'stages.json': set()}
+        self._lock = threading.Lock()
+
+    def _load(self, name):
+        try:
+            with open(self.root / name, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            for name, data in (('hashes.json', self._hashes), ('stages.json', self._stages)):
+                merged = self._load(name)
+                for key in self._changed[name]:
+                    if key in data:
+                        merged[key] = data[key]
+                    else:
+                        merged.pop(key, None)
+                self._changed[name].clear()
+                # Written aside and renamed, so another process never reads half of it
+                partial = self.root / f'.{name}.{os.getpid()}.{threading.get_ident()}'
+                with open(partial, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, separators=(',', ':'))
+                partial.replace(self.root / name)
+            self._dirty = False
+
+    def file_hash(self, path):
+        """Content hash of a file, reusing the memoized hash if size and mtime match."""
+        path = Path(path)
+        stat = path.stat()
+        entry = self._hashes.get(str(path))
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hash_file(path)
+        with self._lock:
+            self._hashes[str(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+            self._changed['hashes.json'].add(str(path))
+            self._dirty = True
+        return digest
+
+    def key(self, stage, inputs=(), values=()):
+        """Compute the cache key of a stage from its input files and extra values."""
+        digest = hashlib.sha256()
+        digest.update(stage.encode())
+        digest.update(self._scripts.encode())
+        for value in values:
+            digest.update(b'\0' + str(value).encode())
+        for path in sorted(str(p) for p in inputs):
+            digest.update(b'\0' + path.encode() + b'\0' + self.file_hash(path).encode())
+        return digest.hexdigest()
+
+    def fresh(self, stage, key, outputs=()):
+        """True if the stage last ran with the same key and its outputs are as it left them.
+
+        Every output must exist, and those whose hashes store() recorded must
+        still have that content.
+        """
+        entry = self._stages.get(stage)
+        recorded = {}
+        if isinstance(entry, list):
+            entry, recorded = entry
+        if entry != key:
+            return False
+        missing = [str(p) for p in outputs if not Path(p).exists()]
+        if missing:
+            logging.info(f'Cache miss for {stage}: {len(missing)} outputs missing')
+            return False
+        changed = [path for path, digest in recorded.items()
+                   if not Path(path).is_file() or self.file_hash(path) != digest]
+        if changed:
+            logging.info(f'Cache miss for {stage}: {len(changed)} outputs changed since it ran')
+            return False
+        logging.info(f'Skipping {stage}: inputs unchanged')
+        if self._dirty:
+            self._save()
+        return True
+
+    def store(self, stage, key, outputs=()):
+        """Record a successful run of a stage, with the content hashes of outputs if given."""
+        entry = key
+        if outputs:
+            entry = [key, {str(path): self.file_hash(path) for path in outputs}]
+        with self._lock:
+            self._stages[stage] = entry
+            self._changed['stages.json'].add(stage)
+        self._save()
+
+    def forget(self, stage):
+        """Drop the record of a stage, so that it runs again next time."""
+        with self._lock:
+            self._stages.pop(stage, None)
+            self._changed['stages.json'].add(stage)
+        self._save()
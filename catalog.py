@@ -0,0 +1,129 @@
+"""
+SQLite catalog of every profile of the merged bundle, fully resolved.
+
+Label printers, job estimators and other tools that need a filament's
+density, cost or temperatures should not have to parse the merged .ini
+themselves. build.py saves every section of it to build/profiles.sqlite,
+with `inherits` already applied, as one row per profile and one row per
+option:
+
+    profiles(id, type, name, vendor, inherits, abstract)
+    options(profile_id, key, value)
+
+`vendor` is the filament_vendor of filaments and the bundle's vendor name
+for everything else. Profiles are indexed by type, name and vendor and
+options by key, so a lookup such as
+
+    SELECT value FROM profile_options
+    WHERE type = 'filament' AND name = 'Eono PVB @PG' AND key = 'filament_density';
+
+takes a millisecond. The file is written to a temporary path in a single
+transaction, its indexes built after the rows are in, and then renamed over
+the previous one, so a reader never sees it half written.
+"""
+
+import logging
+import os
+import sqlite3
+from pathlib import Path
+
+from profiles import INHERITING_TYPES, ProfileResolver
+
+CATALOG_PATH = Path('build/profiles.sqlite')
+
+SCHEMA = '''
+CREATE TABLE bundle (
+    vendor TEXT,
+    config_version TEXT
+);
+CREATE TABLE profiles (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    vendor TEXT,
+    inherits TEXT,
+    abstract INTEGER NOT NULL
+);
+CREATE TABLE options (
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (profile_id, key)
+) WITHOUT ROWID;
+'''
+
+# Created once the rows are in, which is much faster than keeping them up to date
+INDEXES = '''
+CREATE UNIQUE INDEX profiles_type_name ON profiles(type, name);
+CREATE INDEX profiles_name ON profiles(name);
+CREATE INDEX profiles_vendor ON profiles(vendor);
+CREATE INDEX options_key ON options(key);
+CREATE VIEW profile_options AS
+    SELECT profiles.type, profiles.name, profiles.vendor, options.key, options.value
+    FROM profiles JOIN options ON options.profile_id = profiles.id;
+'''
+
+
+def profile_rows(model, resolver):
+    """Yield (profile row, option rows) for every live section of the model, in file order.
+
+    Duplicate sections are skipped, as PrusaSlicer loads only the first.
+    """
+    vendor_section = model.get(('vendor', ''))
+    bundle_vendor = vendor_section.get('name') if vendor_section else None
+    seen = set()
+    for profile_id, section in enumerate(model, 1):
+        if section.key in seen:
+            continue
+        seen.add(section.key)
+        if section.kind in INHERITING_TYPES:
+            # `inherits` leads the section, so get() stops right away
+            inherits = section.get('inherits')
+            options = resolver.resolve(section.key)
+        else:
+            inherits = None
+            options = dict(section.items())
+        vendor = options.get('filament_vendor', bundle_vendor) if section.kind == 'filament' else bundle_vendor
+        abstract = section.name.startswith('*')
+        row = (profile_id, section.kind, section.name, vendor, inherits, abstract)
+        option_rows = [(profile_id, key, value) for key, value in options.items()]
+        if section.kind in INHERITING_TYPES:
+            resolver.release(section.key)
+        yield row, option_rows
+
+
+def write_catalog(model, path=CATALOG_PATH, resolver=None):
+    """Save every profile of an IniModel, flattened, to an SQLite file. Returns the number of profiles."""
+    path = Path(path)
+    resolver = resolver or ProfileResolver(model)
+    partial = path.with_name(f'.{path.name}.{os.getpid()}')
+    partial.unlink(missing_ok=True)
+    connection = sqlite3.connect(partial)
+    try:
+        # A fresh file renamed into place at the end needs no journal
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(SCHEMA)
+        with connection:
+            vendor_section = model.get(('vendor', ''))
+            connection.execute('INSERT INTO bundle VALUES (?, ?)', (
+                vendor_section.get('name') if vendor_section else None,
+                vendor_section.get('config_version') if vendor_section else None))
+            profiles = []
+
+            def option_rows():
+                for row, rows in profile_rows(model, resolver):
+                    profiles.append(row)
+                    yield from rows
+
+            # One executemany() per table, the options streamed as they are resolved
+            connection.executemany('INSERT INTO options VALUES (?, ?, ?)', option_rows())
+            connection.executemany('INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?)', profiles)
+            count = len(profiles)
+        connection.executescript(INDEXES)
+        connection.execute('ANALYZE')
+    finally:
+        connection.close()
+    partial.replace(path)
+    logging.info(f'Wrote {count} profiles to {path}')
+    return count
@@ -0,0 +1,272 @@
+"""
+Profile-level changelog between the merged bundle and the previous release.
+
+The previous release's merged PrusaResearch .ini is taken from, in order:
+an explicitly given offline zip or .ini, the prusa-fff-offline.zip of the
+latest release tag before the current version if it is already in
+build/.cache/releases/, or the prusa-fff-offline.zip left in build/ by the
+last local build. Only when none of those will do is GitHub asked, once:
+for the tag's zip, which is kept in build/.cache/releases/, or, without a
+tag, for the latest published release, which is read and thrown away since
+"latest" moves on.
+
+Both files are split into sections with the section model (ini_model.py).
+A section whose text is identical in both is skipped without being parsed
+any further, so only the handful of profiles that actually changed have
+their options compared; comparing tens of thousands of sections takes a
+fraction of a second. Sections whose options are equal but reordered or
+re-spaced count as unchanged too.
+
+The result is written to build/changelog.json and summarised in a
+"Profile Changes" section of build/release_notes.md.
+"""
+
+import json
+import logging
+import re
+import shutil
+import tempfile
+import urllib.request
+import zipfile
+from pathlib import Path, PurePosixPath
+
+import gitmeta
+from cache import CACHE_DIR
+from ini_model import IniModel, format_key
+from ini_text import parse_version
+from vendors import MAIN_VENDOR
+
+RELEASE_URL = 'https://github.com/Smartbox-Assistive-Technology/PrusaSlicer-settings-prusa-fff/releases/download/{tag}/prusa-fff-offline.zip'
+LATEST_URL = 'https://github.com/Smartbox-Assistive-Technology/PrusaSlicer-settings-prusa-fff/releases/latest/download/prusa-fff-offline.zip'
+RELEASES_DIR = CACHE_DIR / 'releases'
+LOCAL_ARCHIVE = Path('build/prusa-fff-offline.zip')
+CHANGELOG_PATH = Path('build/changelog.json')
+RELEASE_NOTES_PATH = Path('build/release_notes.md')
+DOWNLOAD_TIMEOUT = 30
+# Profiles listed under each heading of the release notes; changelog.json has all of them
+NOTES_LIMIT = 25
+NOTES_START = '<!-- profile-changes -->'
+NOTES_END = '<!-- /profile-changes -->'
+
+
+def previous_tag(version, tags):
+    """The highest 2.x.y release tag older than version, or None."""
+    current = parse_version(version)
+    releases = [(parse_version(tag), tag) for tag in tags if re.match(r'^v?2\.\d+\.\d+$', tag)]
+    older = [release for release in releases if release[0] < current]
+    return max(older)[1] if older else None
+
+
+def download(url, path):
+    """Fetch url into path. Returns False, after logging why, if it cannot be fetched."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.part')
+    try:
+        with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response, open(partial, 'wb') as f:
+            shutil.copyfileobj(response, f)
+    except OSError as e:
+        partial.unlink(missing_ok=True)
+        logging.warning(f'Could not download {url}: {e}')
+        return False
+    partial.replace(path)
+    return True
+
+
+def read_bundle_ini(path, vendor=MAIN_VENDOR):
+    """Text of the merged vendor .ini in an offline zip, or of an .ini file itself."""
+    path = Path(path)
+    if not zipfile.is_zipfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    with zipfile.ZipFile(path) as zf:
+        # The merged configuration replaces the highest x.y.z.ini of the vendor
+        names = [PurePosixPath(name) for name in zf.namelist()
+                 if name.startswith(f'{vendor}/') and re.match(r'\d+\.\d+\.\d+\.ini$', PurePosixPath(name).name)]
+        if not names:
+            return None
+        latest = max(names, key=lambda name: parse_version(name.name))
+        return zf.read(str(latest)).decode('utf-8')
+
+
+def read_release(path, version):
+    """(label, ini text) of the bundle at path, or None if it has no configuration or is this version."""
+    text = read_bundle_ini(path)
+    if text is None:
+        logging.warning(f'No {MAIN_VENDOR} configuration found in {path}')
+        return None
+    vendor = IniModel(text).get(('vendor', ''))
+    label = vendor.get('config_version') if vendor else None
+    # A bundle of this very version (a rebuild) is no previous release
+    if label == version:
+        return None
+    logging.info(f'Comparing against {label or "unknown version"} from {path}')
+    return label or str(path), text
+
+
+def find_previous_release(version, path=None):
+    """Return (label, ini text) of the release to compare against, or None if there is none."""
+    if path is not None:
+        return read_release(Path(path), version) if Path(path).exists() else None
+
+    refs = gitmeta.read_refs()
+    tag = previous_tag(version, gitmeta.tag_names(refs) if refs else [])
+    cached = RELEASES_DIR / f'{tag}.zip' if tag else None
+    for candidate in (cached, LOCAL_ARCHIVE):
+        if candidate is not None and candidate.exists():
+            release = read_release(candidate, version)
+            if release:
+                return release
+
+    url = RELEASE_URL.format(tag=tag) if tag else LATEST_URL
+    logging.info(f'No previous release found locally, downloading {url}')
+    if tag:
+        return read_release(cached, version) if download(url, cached) else None
+    with tempfile.TemporaryDirectory() as tmp:
+        latest = Path(tmp) / 'latest.zip'
+        return read_release(latest, version) if download(url, latest) else None
+
+
+def option_changes(old_section, new_section):
+    """{option: {'old': ..., 'new': ...}} for every option that differs; None marks a missing one."""
+    old = dict(old_section.items())
+    new = dict(new_section.items())
+    changes = {}
+    for option in sorted(old.keys() | new.keys()):
+        if old.get(option) != new.get(option):
+            changes[option] = {'old': old.get(option), 'new': new.get(option)}
+    return changes
+
+
+def compare(previous, current):
+    """Profile-level differences between two merged .ini texts."""
+    old_model = IniModel(previous)
+    new_model = IniModel(current)
+    added = []
+    changed = []
+    unchanged = 0
+    for key, section in new_model.index.items():
+        old_section = old_model.index.get(key)
+        if old_section is None:
+            added.append(format_key(key))
+            continue
+        # Identical text needs no parsing; most sections stop here
+        if old_section.text == section.text:
+            unchanged += 1
+            continue
+        changes = option_changes(old_section, section)
+        if changes:
+            changed.append({'profile': format_key(key), 'options': changes})
+        else:
+            unchanged += 1
+    removed = [format_key(key) for key in old_model.index if key not in new_model.index]
+    return {
+        'summary': {
+            'added': len(added),
+            'removed': len(removed),
+            'changed': len(changed),
+            'unchanged': unchanged,
+        },
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+    }
+
+
+def format_value(value):
+    if value is None:
+        return '*(unset)*'
+    if len(value) > 60:
+        value = value[:57] + '...'
+    return f'`{value}`' if value else '*(empty)*'
+
+
+def render_notes(changelog):
+    """Markdown section for the release notes, listing at most NOTES_LIMIT profiles per heading."""
+    summary = changelog['summary']
+    notes = [NOTES_START]
+    if changelog['previous'] is None:
+        notes.append("## 🔍 Profile Changes")
+        notes.append("")
+        notes.append("No previous release to compare against.")
+        notes.append("")
+        notes.append(NOTES_END)
+        return '\n'.join(notes)
+    notes.append(f"## 🔍 Profile Changes since {changelog['previous']}")
+    notes.append("")
+    if not (summary['added'] or summary['removed'] or summary['changed']):
+        notes.append("No profile changes.")
+        notes.append("")
+        notes.append(NOTES_END)
+        return '\n'.join(notes)
+    notes.append(f"{summary['added']} added, {summary['removed']} removed and {summary['changed']} changed "
+                 f"profiles; {summary['unchanged']} unchanged.")
+    notes.append("")
+
+    def listing(title, profiles):
+        notes.append(f"### {title}")
+        for profile in profiles[:NOTES_LIMIT]:
+            notes.append(f"- **{profile}**")
+        if len(profiles) > NOTES_LIMIT:
+            notes.append(f"- ... and {len(profiles) - NOTES_LIMIT} more")
+        notes.append("")
+
+    if changelog['added']:
+        listing("Added Profiles", changelog['added'])
+    if changelog['removed']:
+        listing("Removed Profiles", changelog['removed'])
+    if changelog['changed']:
+        notes.append("### Changed Profiles")
+        for entry in changelog['changed'][:NOTES_LIMIT]:
+            notes.append(f"- **{entry['profile']}**")
+            for option, change in entry['options'].items():
+                notes.append(f"  - {option}: {format_value(change['old'])} → {format_value(change['new'])}")
+        if len(changelog['changed']) > NOTES_LIMIT:
+            notes.append(f"- ... and {len(changelog['changed']) - NOTES_LIMIT} more")
+        notes.append("")
+    notes.append("Every change is listed in `changelog.json`.")
+    notes.append("")
+    notes.append(NOTES_END)
+    return '\n'.join(notes)
+
+
+def update_release_notes(changelog, path=RELEASE_NOTES_PATH):
+    """Put the profile changes into the release notes, before Installation, replacing earlier ones."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        notes = f.read()
+    start = notes.find(NOTES_START)
+    if start != -1:
+        end = notes.find(NOTES_END, start)
+        notes = notes[:start] + notes[end + len(NOTES_END):].lstrip('\n')
+    section = render_notes(changelog) + '\n\n'
+    anchor = notes.find('## 📦 Installation')
+    if anchor == -1:
+        notes = notes.rstrip('\n') + '\n\n' + section
+    else:
+        notes = notes[:anchor] + section + notes[anchor:]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(notes)
+
+
+def generate(version, current, previous_path=None, output=CHANGELOG_PATH):
+    """Compare the merged configuration against the previous release and save the changelog.
+
+    Without a previous release, as for the first one, the changelog has
+    `previous` set to null and lists no changes, so that there is still a
+    changelog.json to publish.
+    """
+    previous = find_previous_release(version, previous_path)
+    if previous is None:
+        logging.warning('No previous release found, writing an empty profile changelog')
+        changelog = {'previous': None, 'current': version, **compare('', '')}
+    else:
+        label, previous_text = previous
+        changelog = {'previous': label, 'current': version, **compare(previous_text, current)}
+        summary = changelog['summary']
+        logging.info(f"Profile changes since {label}: {summary['added']} added, {summary['removed']} removed, "
+                     f"{summary['changed']} changed")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(changelog, f, indent=2, ensure_ascii=False)
+    return changelog
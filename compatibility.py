@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Which printers each filament of the merged bundle is offered for.
+
+PrusaSlicer shows a filament for a printer when the printer's name is in the
+filament's `compatible_printers` list or, if that list is empty, when its
+`compatible_printers_condition` holds for the printer's options, e.g.
+
+    printer_notes=~/.*PRINTER_MODEL_MK4.*/ and nozzle_diameter[0]==0.4
+
+Each distinct condition is parsed once into a tree of Python closures
+(compile_condition()), and the option values a condition reads are looked up
+and converted once per printer. Thousands of filaments share a few hundred
+conditions through `inherits`, so filaments are grouped by their
+compatibility settings and each group is evaluated once against every
+printer. As in PrusaSlicer, a condition can also read `printer_preset` and
+`num_extruders`, and an option a printer does not set reads as empty; an
+option no printer sets is reported as an error of the condition, which then
+matches no printer. The resulting matrix answers both "which printers see
+Eono PVB @PG?" and "which filaments does this printer offer?":
+
+    python compatibility.py --filament "Eono PVB @PG"
+    python compatibility.py --printer "Original Prusa MK4S 0.4 nozzle"
+
+The build saves the matrix as build/compatibility.json and fails when a
+filament added by an overlay matches no printer at all.
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+from ini_model import IniModel
+from profiles import ProfileResolver
+
+COMPATIBILITY_PATH = Path('build/compatibility.json')
+
+TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<number>\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+)
+      | (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>==|!=|<>|<=|>=|=~|!~|&&|\|\||[<>!()\[\]-])
+    )''', re.VERBOSE)
+# The /regex/ after =~ and !~, where a slash can be escaped
+REGEX_RE = re.compile(r'\s*/((?:[^/\\]|\\.)*)/')
+QUOTED_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+class ConditionError(Exception):
+    """Raised for a condition that cannot be parsed or refers to an unknown option."""
+
+
+def is_abstract(name):
+    """Profiles named *like this* only exist to be inherited from."""
+    return name.startswith('*')
+
+
+def parse_printer_list(value):
+    """Printer names of a `compatible_printers` value, `"A";"B"` or plain `A;B`."""
+    names = [name.replace('\\"', '"') for name in QUOTED_RE.findall(value)]
+    if not names:
+        names = [name.strip() for name in value.split(';')]
+    return [name for name in names if name]
+
+
+# Results of comparisons, as (text, number) values like everything else
+TRUE = ('1', 1.0)
+FALSE = ('0', 0.0)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def derived_options(name, options):
+    """Options PrusaSlicer adds to a printer's config for its conditions: the preset name and extruder count."""
+    nozzles = options.get('nozzle_diameter', '')
+    return {
+        'printer_preset': name,
+        'num_extruders': str(len(nozzles.split(','))) if nozzles.strip() else '1',
+    }
+
+
+class Printer:
+    """A printer profile's flattened options, converted once per (option, index) as conditions read them."""
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = {**options, **derived_options(name, options)}
+        self._values = {}
+
+    def value(self, option, index=None):
+        """(text, number or None) of an option, of one element if index is given."""
+        cached = self._values.get((option, index))
+        if cached is not None:
+            return cached
+        # PrusaSlicer evaluates against the full config, where an option this
+        # printer does not set has its default; empty is the nearest to that
+        text = self.options.get(option, '')
+        if index is not None:
+            elements = text.split(',')
+            text = elements[index].strip() if index < len(elements) else ''
+        if len(text) >= 2 and text[0] == text[-1] == '"':
+            text = text[1:-1]
+        cached = (text, _number(text))
+        self._values[(option, index)] = cached
+        return cached
+
+
+def _compare(op, left, right):
+    # Numbers compare as numbers, anything else as text
+    if left[1] is not None and right[1] is not None:
+        left, right = left[1], right[1]
+    else:
+        left, right = left[0], right[0]
+    if op == '==':
+        return left == right
+    if op in ('!=', '<>'):
+        return left != right
+    if op == '<':
+        return left < right
+    if op == '>':
+        return left > right
+    if op == '<=':
+        return left <= right
+    return left >= right
+
+
+def _truth(value):
+    text, number = value
+    if number is not None:
+        return number != 0
+    return text.lower() not in ('', 'false')
+
+
+def _negate(value):
+    text, number = value
+    return (f'-{text}', -number if number is not None else None)
+
+
+class _Parser:
+    """Recursive descent parser producing a closure that takes a Printer."""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.token = None
+        # Names of the options the condition reads
+        self.options = set()
+        self.advance()
+
+    def fail(self, message):
+        raise ConditionError(f'{message} at position {self.pos} of "{self.text}"')
+
+    def advance(self):
+        if self.text[self.pos:].strip() == '':
+            self.token = None
+            self.pos = len(self.text)
+            return
+        match = TOKEN_RE.match(self.text, self.pos)
+        if not match:
+            self.fail('unexpected character')
+        self.pos = match.end()
+        self.token = (match.lastgroup, match.group(match.lastgroup))
+
+    def accept(self, *values):
+        if self.token is not None and self.token[0] in ('op', 'name') and self.token[1] in values:
+            value = self.token[1]
+            self.advance()
+            return value
+        return None
+
+    def expect(self, value):
+        if not self.accept(value):
+            self.fail(f'expected {value}')
+
+    def parse(self):
+        node = self.parse_or()
+        if self.token is not None:
+            self.fail(f'unexpected {self.token[1]}')
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.accept('or', '||'):
+            nodes.append(self.parse_and())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda printer: TRUE if any(_truth(node(printer)) for node in nodes) else FALSE
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.accept('and', '&&'):
+            nodes.append(self.parse_not())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda printer: TRUE if all(_truth(node(printer)) for node in nodes) else FALSE
+
+    def parse_not(self):
+        if self.accept('not', '!'):
+            node = self.parse_not()
+            return lambda printer: FALSE if _truth(node(printer)) else TRUE
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_value()
+        if self.token is not None and self.token[1] in ('=~', '!~'):
+            # The regex is not a token, it is read straight after the operator
+            op = self.token[1]
+            match = REGEX_RE.match(self.text, self.pos)
+            if not match:
+                self.fail(f'expected /regex/ after {op}')
+            try:
+                # PrusaSlicer matches the whole value
+                pattern = re.compile(match.group(1).replace('\\/', '/'))
+            except re.error as e:
+                self.fail(f'invalid regex ({e})')
+            self.pos = match.end()
+            self.advance()
+            negate = op == '!~'
+            return lambda printer: TRUE if (pattern.fullmatch(left(printer)[0]) is None) == negate else FALSE
+        op = self.accept('==', '!=', '<>', '<', '>', '<=', '>=')
+        if op is None:
+            return left
+        right = self.parse_value()
+        return lambda printer: TRUE if _compare(op, left(printer), right(printer)) else FALSE
+
+    def parse_value(self):
+        if self.accept('('):
+            node = self.parse_or()
+            self.expect(')')
+            return node
+        if self.accept('-'):
+            node = self.parse_value()
+            return lambda printer: _negate(node(printer))
+        if self.token is None:
+            self.fail('unexpected end')
+        kind, value = self.token
+        if kind == 'number':
+            self.advance()
+            constant = (value, float(value))
+            return lambda printer: constant
+        if kind == 'string':
+            self.advance()
+            text = re.sub(r'\\(.)', r'\1', value[1:-1])
+            constant = (text, _number(text))
+            return lambda printer: constant
+        if kind == 'name':
+            self.advance()
+            if value in ('true', 'false'):
+                constant = TRUE if value == 'true' else FALSE
+                return lambda printer: constant
+            if value in ('and', 'or', 'not'):
+                self.fail(f'unexpected {value}')
+            index = None
+            if self.accept('['):
+                if self.token is None or self.token[0] != 'number':
+                    self.fail('expected an index')
+                index = int(float(self.token[1]))
+                self.advance()
+                self.expect(']')
+            self.options.add(value)
+            return lambda printer: printer.value(value, index)
+        self.fail(f'unexpected {value}')
+
+
+_compiled = {}
+
+
+def compile_condition(text):
+    """(function of a Printer returning whether the condition holds, names of the options it reads).
+
+    Compiled once per distinct text.
+    """
+    compiled = _compiled.get(text)
+    if compiled is None:
+        parser = _Parser(text)
+        node = parser.parse()
+        compiled = (lambda printer: _truth(node(printer)), frozenset(parser.options))
+        _compiled[text] = compiled
+    return compiled
+
+
+class CompatibilityMatrix:
+    """Printers each profile of one type (filament by default) is compatible with."""
+
+    def __init__(self, printers, profiles, errors=()):
+        # printers is the list of printer names; profiles maps each profile
+        # name to the frozenset of compatible printer names, shared by
+        # every profile with the same compatibility settings
+        self.printers = printers
+        self.profiles = profiles
+        self.errors = list(errors)
+
+    @classmethod
+    def evaluate(cls, model, resolver=None, kind='filament'):
+        """Evaluate every non-abstract profile of kind against every printer of an IniModel."""
+        resolver = resolver or ProfileResolver(model)
+        printers = [Printer(section.name, resolver.resolve(section.key)) for section in model
+                    if section.kind == 'printer' and not is_abstract(section.name)]
+        printer_names = frozenset(printer.name for printer in printers)
+        known = frozenset().union(*(printer.options for printer in printers))
+
+        groups = {}
+        for section in model:
+            if section.kind != kind or is_abstract(section.name):
+                continue
+            options = resolver.resolve(section.key)
+            settings = (options.get('compatible_printers', '').strip(),
+                        options.get('compatible_printers_condition', '').strip())
+            groups.setdefault(settings, []).append(section.name)
+
+        profiles = {}
+        errors = []
+        for (listed, condition), names in groups.items():
+            if listed:
+                matched = printer_names & frozenset(parse_printer_list(listed))
+            elif condition:
+                matched, error = cls._match(condition, printers, known)
+                if error is not None:
+                    others = f' and {len(names) - 1} more' if len(names) > 1 else ''
+                    errors.append(f'[{kind}:{names[0]}]{others}: {error}')
+            else:
+                matched = printer_names
+            for name in names:
+                profiles[name] = matched
+        return cls([printer.name for printer in printers], profiles, errors)
+
+    @staticmethod
+    def _match(condition, printers, known):
+        """(names of the printers a condition holds for, the error or None).
+
+        known is every option any printer sets; an option outside it is a
+        mistake in the condition, not a difference between printers.
+        """
+        try:
+            test, options = compile_condition(condition)
+        except ConditionError as e:
+            # PrusaSlicer offers such a profile for no printer
+            return frozenset(), e
+        unknown = sorted(options - known)
+        if unknown:
+            return frozenset(), ConditionError(f'unknown option {", ".join(unknown)} in "{condition}"')
+        return frozenset(printer.name for printer in printers if test(printer)), None
+
+    def printers_for(self, name):
+        """Names of the printers that offer a profile, in file order."""
+        matched = self.profiles[name]
+        return [printer for printer in self.printers if printer in matched]
+
+    def profiles_for(self, printer):
+        """Names of the profiles a printer offers."""
+        return [name for name, matched in self.profiles.items() if printer in matched]
+
+    def to_json(self):
+        # Each distinct set of printers is stored once
+        groups = {}
+        profiles = {}
+        for name, matched in self.profiles.items():
+            profiles[name] = groups.setdefault(matched, len(groups))
+        indices = {printer: i for i, printer in enumerate(self.printers)}
+        return {
+            'printers': self.printers,
+            'groups': [sorted(indices[printer] for printer in matched) for matched in groups],
+            'profiles': profiles,
+            'errors': self.errors,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        printers = data['printers']
+        groups = [frozenset(printers[i] for i in group) for group in data['groups']]
+        profiles = {name: groups[group] for name, group in data['profiles'].items()}
+        return cls(printers, profiles, data.get('errors', ()))
+
+    def write(self, path=COMPATIBILITY_PATH):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, separators=(',', ':'), ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path=COMPATIBILITY_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+
+def check_overlays(matrix, overlays, kind='filament'):
+    """Problems with the profiles the .add.ini overlays add: each has to match at least one printer."""
+    problems = []
+    for path, content in overlays.items():
+        if not path.name.endswith('.add.ini'):
+            continue
+        for section in IniModel(content).sections:
+            if section.kind != kind or is_abstract(section.name) or section.name not in matrix.profiles:
+                continue
+            if not matrix.profiles[section.name]:
+                problems.append(f'{path}: [{kind}:{section.name}] is compatible with no printer')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the printer/filament compatibility of the built bundle.')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--filament', help='list the printers that offer this filament')
+    group.add_argument('--printer', help='list the filaments this printer offers')
+    group.add_argument('--unmatched', action='store_true', help='list the filaments no printer offers')
+    parser.add_argument('--matrix', type=Path, default=COMPATIBILITY_PATH, help='compatibility.json to query')
+    args = parser.parse_args(argv)
+
+    if not args.matrix.exists():
+        print(f'{args.matrix} does not exist, build the bundle first')
+        sys.exit(1)
+    matrix = CompatibilityMatrix.load(args.matrix)
+    if args.filament is not None:
+        if args.filament not in matrix.profiles:
+            print(f'Unknown filament: {args.filament}')
+            sys.exit(1)
+        results = matrix.printers_for(args.filament)
+    elif args.printer is not None:
+        if args.printer not in matrix.printers:
+            print(f'Unknown printer: {args.printer}')
+            sys.exit(1)
+        results = matrix.profiles_for(args.printer)
+    else:
+        results = [name for name, matched in matrix.profiles.items() if not matched]
+    for name in results:
+        print(name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+File copying for the build and release scripts.
+
+The upstream PrusaResearch directory holds hundreds of historical .ini files
+and thousands of assets that are copied into build/ unchanged. Copies are
+made as cheaply as the filesystem allows: a reflink (copy-on-write clone)
+first, then a hardlink, and only then a chunked stream copy. Destinations
+that already match the source are left alone, and the work is spread over a
+thread pool.
+
+Hardlinked destinations share their contents with prusa-upstream/, so
+anything that later rewrites a file under build/ must replace it (unlink,
+then write) rather than write into it.
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cache import hash_file
+
+CHUNK_SIZE = 1024 * 1024
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Devices already known not to support reflinks, so they are only tried once
+_no_reflink = set()
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    device = os.stat(src).st_dev
+    if device in _no_reflink:
+        return False
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            failed = True
+        else:
+            failed = False
+    if failed:
+        _no_reflink.add(device)
+        os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _stream_copy(src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+    shutil.copystat(src, dst)
+    return os.path.getsize(dst)
+
+
+def is_unchanged(src, dst, hasher=hash_file):
+    """True if dst is the same file as src, or has the same size, mtime and hash."""
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    src_stat = os.stat(src)
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        return True
+    return (src_stat.st_size == dst_stat.st_size
+            and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+            and hasher(src) == hasher(dst))
+
+
+def copy_file(src, dst, hardlink=True, hasher=hash_file):
+    """Copy src to dst unless it is already there.
+
+    Returns a (method, bytes_moved) tuple where method is one of 'skipped',
+    'reflinked', 'linked' or 'copied'; only stream copies move bytes.
+    """
+    if is_unchanged(src, dst, hasher):
+        return 'skipped', 0
+    # Never write through an existing destination, it may be a hardlink
+    Path(dst).unlink(missing_ok=True)
+    if _reflink(src, dst):
+        return 'reflinked', 0
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'linked', 0
+        except OSError:
+            pass
+    return 'copied', _stream_copy(src, dst)
+
+
+def copy_files(pairs, hardlink=True, hasher=hash_file, workers=None):
+    """Copy many (src, dst) pairs in parallel.
+
+    Returns a dict counting the files per method plus the bytes actually moved.
+    """
+    stats = {'skipped': 0, 'reflinked': 0, 'linked': 0, 'copied': 0, 'bytes': 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda pair: copy_file(pair[0], pair[1], hardlink, hasher), pairs)
+        for method, moved in results:
+            stats[method] += 1
+            stats['bytes'] += moved
+    return stats
+
+
+def describe_copy(stats):
+    """One-line summary of copy_files() statistics for the log."""
+    return (f"{stats['copied']} copied ({stats['bytes']:,} bytes moved), "
+            f"{stats['linked'] + stats['reflinked']} linked, {stats['skipped']} unchanged")
@@ -0,0 +1,153 @@
+"""
+Git metadata for versioning, collected without a process per question.
+
+Refs (HEAD and the tag set) are read straight from .git: loose files under
+refs/ plus packed-refs, which is where a clone with thousands of upstream
+tags keeps them. What needs history takes three calls, none of which reads
+more of it than it must: `git rev-list --count` for the commit count (which
+git answers from its commit-graph), `git log -n` for the latest commits, and
+`git describe` for the nearest tag and whether HEAD carries it, so they are
+chosen exactly as `git describe` chooses them. If .git cannot be read
+directly, for example with the reftable backend, refs fall back to one
+`git show-ref` call.
+"""
+
+import subprocess
+from pathlib import Path
+
+# Fields of one commit line in collect()'s git log output
+FIELD_SEP = '\x1f'
+LOG_FORMAT = FIELD_SEP.join(['%h', '%ci', '%s'])
+
+
+def find_git_dir(start='.'):
+    """Locate the .git directory for start, following `gitdir:` files (submodules, worktrees)."""
+    path = Path(start).resolve()
+    for directory in (path, *path.parents):
+        dot_git = directory / '.git'
+        if dot_git.is_dir():
+            return dot_git
+        if dot_git.is_file():
+            target = dot_git.read_text(encoding='utf-8').strip()
+            if target.startswith('gitdir:'):
+                return (directory / target[len('gitdir:'):].strip()).resolve()
+    return None
+
+
+def _read_refs_from_disk(git_dir):
+    common_dir = git_dir
+    if (git_dir / 'commondir').exists():
+        common_dir = (git_dir / (git_dir / 'commondir').read_text(encoding='utf-8').strip()).resolve()
+    if (common_dir / 'reftable').exists():
+        return None
+
+    refs = {}
+    packed = common_dir / 'packed-refs'
+    if packed.exists():
+        for line in packed.read_text(encoding='utf-8').splitlines():
+            if line and line[0] not in '#^':
+                sha, _, name = line.partition(' ')
+                refs[name] = sha
+    # Loose refs take precedence over packed ones
+    refs_dir = common_dir / 'refs'
+    for ref_file in refs_dir.rglob('*'):
+        if ref_file.is_file():
+            value = ref_file.read_text(encoding='utf-8').strip()
+            if not value.startswith('ref:'):
+                refs[ref_file.relative_to(common_dir).as_posix()] = value
+
+    head = (git_dir / 'HEAD').read_text(encoding='utf-8').strip()
+    if head.startswith('ref:'):
+        head = refs.get(head[len('ref:'):].strip())
+    refs['HEAD'] = head
+    return refs
+
+
+def read_refs(start='.'):
+    """Return {refname: sha} for HEAD and every ref, or None outside a git repository."""
+    git_dir = find_git_dir(start)
+    if git_dir is not None:
+        try:
+            refs = _read_refs_from_disk(git_dir)
+        except (OSError, UnicodeDecodeError):
+            refs = None
+        if refs is not None:
+            return refs
+    try:
+        output = subprocess.check_output(['git', 'show-ref', '--head'], cwd=start,
+                                         text=True, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    refs = {}
+    for line in output.splitlines():
+        sha, _, name = line.partition(' ')
+        refs[name] = sha
+    return refs
+
+
+def tag_names(refs):
+    """Names of all tags in a read_refs() result."""
+    return [name[len('refs/tags/'):] for name in refs if name.startswith('refs/tags/')]
+
+
+def state(refs):
+    """Fingerprint of HEAD and the tag set, for cache keys. None if unknown."""
+    if not refs or not refs.get('HEAD'):
+        return None
+    tags = sorted(f'{refs[name]} {name}' for name in refs if name.startswith('refs/tags/'))
+    return '\n'.join([refs['HEAD'], *tags])
+
+
+def _git(args, start):
+    """Output of a git command, stripped, or None if it fails."""
+    try:
+        return subprocess.check_output(['git', *args], cwd=start, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def describe(start='.'):
+    """(nearest tag, True if it is on HEAD) as `git describe --tags` picks it, or (None, False)."""
+    output = _git(['describe', '--tags', '--long'], start)
+    if not output:
+        return None, False
+    # <tag>-<commits since the tag>-g<hash>; the tag itself may contain dashes
+    tag, distance, _ = output.rsplit('-', 2)
+    return tag, distance == '0'
+
+
+def collect(count=5, start='.'):
+    """Collect everything version.py needs from git.
+
+    Returns a dict with commit_hash, commit_count, current_tag, latest_tag,
+    recent_commits (the latest `count` commits) and tags (every tag name),
+    or None if git history is not available.
+    """
+    commit_count = _git(['rev-list', '--count', 'HEAD'], start)
+    if commit_count is None:
+        return None
+    output = _git(['log', f'-n{max(count, 1)}', f'--format={LOG_FORMAT}', 'HEAD'], start)
+    if output is None:
+        return None
+
+    commits = []
+    for line in output.splitlines():
+        fields = line.split(FIELD_SEP, 2)
+        if len(fields) == 3:
+            short_hash, date, message = fields
+            commits.append({
+                'hash': short_hash,
+                'date': date.split()[0],  # Just the date part
+                'message': message
+            })
+    latest_tag, on_head = describe(start)
+    refs = read_refs(start)
+    return {
+        'commit_hash': commits[0]['hash'] if commits else None,
+        'commit_count': commit_count,
+        'current_tag': latest_tag if on_head else None,
+        'latest_tag': latest_tag,
+        'recent_commits': commits[:count],
+        'tags': tag_names(refs) if refs else [],
+    }
@@ -0,0 +1,241 @@
+"""
+Section-indexed model of PrusaSlicer vendor bundle .ini files.
+
+The upstream PrusaResearch/<ver>.ini is several megabytes of `[type:name]`
+sections. Rather than treating it as one big string, the model parses it once
+into an ordered list of sections, each addressed by its (type, name) key and
+backed by a span into the original text. Removals, lookups and insertion
+points are dictionary lookups, and the file is only reassembled once when it
+is serialized.
+
+Sections can also be compared by fingerprint, a hash of their sorted
+key/value pairs, which ignores option order and the whitespace around keys
+and values; see fingerprint().
+
+The source can be UTF-8 bytes instead of text, as build.py reads the
+upstream file: only section headers are decoded while parsing, a section's
+text is decoded when it is asked for, and write() streams the file out as
+slices of the original bytes.
+"""
+
+import hashlib
+import re
+
+SECTION_HEADER_RE = re.compile(r'^\[(.*)\][ \t]*$', re.MULTILINE)
+SECTION_HEADER_BYTES_RE = re.compile(rb'^\[(.*)\][ \t]*$', re.MULTILINE)
+
+
+def _as_text(value):
+    return value if isinstance(value, str) else value.decode('utf-8')
+
+
+def section_key(header):
+    """Split a section header like 'filament:Eono PVB' into ('filament', 'Eono PVB')."""
+    kind, _, name = header.partition(':')
+    return (kind.strip(), name.strip())
+
+
+def format_key(key):
+    """Format a (type, name) key back into its section header."""
+    kind, name = key
+    return f'[{kind}:{name}]' if name else f'[{kind}]'
+
+
+def fingerprint(items):
+    """Canonical hash of (key, value) pairs, independent of their order."""
+    digest = hashlib.blake2b(digest_size=16)
+    for key, value in sorted(items):
+        digest.update(f'{key}\0{value}\0'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def describe_differences(expected, actual):
+    """List the option-level differences between two sections, as readable strings."""
+    expected = dict(expected.items())
+    actual = dict(actual.items())
+    differences = []
+    for key in sorted(expected.keys() | actual.keys()):
+        if key not in actual:
+            differences.append(f'{key} is missing (expected {expected[key]!r})')
+        elif key not in expected:
+            differences.append(f'unexpected {key} = {actual[key]!r}')
+        elif expected[key] != actual[key]:
+            differences.append(f'{key} is {actual[key]!r}, expected {expected[key]!r}')
+    return differences
+
+
+class Section:
+    """A single [type:name] section, stored as a span of its source text."""
+
+    __slots__ = ('kind', 'name', 'source', 'start', 'end', 'position', 'removed')
+
+    def __init__(self, kind, name, source, start, end, position):
+        self.kind = kind
+        self.name = name
+        self.source = source
+        self.start = start
+        self.end = end
+        self.position = position
+        self.removed = False
+
+    @property
+    def key(self):
+        return (self.kind, self.name)
+
+    @property
+    def text(self):
+        """Full section text, including the header and trailing blank lines."""
+        return _as_text(self.source[self.start:self.end])
+
+    def raw(self):
+        """The section as UTF-8 bytes, a view into the source when that is bytes."""
+        if isinstance(self.source, str):
+            return self.text.encode('utf-8')
+        return memoryview(self.source)[self.start:self.end]
+
+    def items(self):
+        """Yield the (key, value) pairs of the section in file order."""
+        text = self.text
+        body_start = text.find('\n')
+        if body_start == -1:
+            return
+        for line in text[body_start + 1:].split('\n'):
+            option, sep, value = line.partition('=')
+            if sep and option.strip():
+                yield option.strip(), value.strip()
+
+    def fingerprint(self):
+        """Hash of the section's sorted key/value pairs, see fingerprint()."""
+        return fingerprint(self.items())
+
+    def get(self, option, default=None):
+        """Return the value of an option, or default if the section lacks it."""
+        for key, value in self.items():
+            if key == option:
+                return value
+        return default
+
+    def set(self, option, value):
+        """Replace the value of an option in place. Returns False if it is missing."""
+        pattern = re.compile(rf'^{re.escape(option)}[ \t]*=[^\n]*', re.MULTILINE)
+        text, count = pattern.subn(lambda m: f'{option} = {value}', self.text, count=1)
+        if not count:
+            return False
+        self.source, self.start, self.end = text, 0, len(text)
+        return True
+
+    def __repr__(self):
+        return f'Section({format_key(self.key)!r})'
+
+
+class IniModel:
+    """Ordered, (type, name)-indexed collection of the sections of one .ini file."""
+
+    def __init__(self, text):
+        self.preamble = ''
+        self.sections = []
+        self.index = {}
+        self.duplicates = []
+        self._inserts = {}
+        self._fingerprints = None
+        self._parse(text)
+
+    def _parse(self, text):
+        header_re = SECTION_HEADER_RE if isinstance(text, str) else SECTION_HEADER_BYTES_RE
+        headers = list(header_re.finditer(text))
+        self.preamble = _as_text(text[:headers[0].start()] if headers else text)
+        for i, match in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+            kind, name = section_key(_as_text(match.group(1)))
+            section = Section(kind, name, text, match.start(), end, i)
+            self._register(section)
+            self.sections.append(section)
+
+    def _register(self, section):
+        if section.key in self.index:
+            self.duplicates.append(section.key)
+        else:
+            self.index[section.key] = section
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        return self.index[key]
+
+    def __iter__(self):
+        """Iterate over the live sections, including inserted ones, in file order."""
+        for position, section in enumerate(self.sections):
+            for block in self._inserts.get(position, ()):
+                yield from block
+            if not section.removed:
+                yield section
+        for block in self._inserts.get(len(self.sections), ()):
+            yield from block
+
+    def get(self, key, default=None):
+        return self.index.get(key, default)
+
+    def find_fingerprint(self, digest):
+        """Keys of the live sections with the given fingerprint.
+
+        The fingerprints of the whole file are computed on first use.
+        """
+        if self._fingerprints is None:
+            self._fingerprints = {}
+            for section in self.sections:
+                self._fingerprints.setdefault(section.fingerprint(), []).append(section)
+        return [section.key for section in self._fingerprints.get(digest, ()) if not section.removed]
+
+    def remove(self, key):
+        """Drop a section from the model."""
+        section = self.index.pop(key)
+        section.removed = True
+        return section
+
+    def restore(self, section):
+        """Put a section dropped by remove() back in its place."""
+        section.removed = False
+        self._register(section)
+
+    def insert_before(self, key, block):
+        """Insert another model's sections before the given section, or at the end if it is missing."""
+        section = self.index.get(key)
+        if section is not None and self.sections[section.position] is section:
+            position = section.position
+        else:
+            position = len(self.sections)
+        self._inserts.setdefault(position, []).append(block)
+        for added in block.sections:
+            self._register(added)
+
+    def remove_inserts(self):
+        """Take out every block added with insert_before()."""
+        for blocks in self._inserts.values():
+            for block in blocks:
+                for added in block.sections:
+                    if self.index.get(added.key) is added:
+                        del self.index[added.key]
+                    elif added.key in self.duplicates:
+                        self.duplicates.remove(added.key)
+        self._inserts = {}
+
+    def _pieces(self):
+        """The preamble and the live sections, inserted blocks included, in file order."""
+        yield self.preamble
+        for position, section in enumerate(self.sections):
+            for block in self._inserts.get(position, ()):
+                yield from block._pieces()
+            if not section.removed:
+                yield section
+        for block in self._inserts.get(len(self.sections), ()):
+            yield from block._pieces()
+
+    def serialize(self):
+        """Reassemble the model into .ini text."""
+        return ''.join(piece if isinstance(piece, str) else piece.text for piece in self._pieces())
+
+    def write(self, f):
+        """Write the model to a binary file as UTF-8, without assembling it in memory first."""
+        for piece in self._pieces():
+            f.write(piece.encode('utf-8') if isinstance(piece, str) else piece.raw())
@@ -0,0 +1,131 @@
+"""
+Text-level handling of the vendor .ini files, without parsing them.
+
+build.py strips the comments of the upstream file and of every overlay before
+they are merged; the profile store, the linter and the live rebuild in
+watch.py have to see the same text, so they all use strip_comments() or, for
+the multi-megabyte upstream file, read_stripped(), which works on the UTF-8
+bytes without decoding them.
+
+Upstream .ini files are named after their version, x.y.z.ini;
+parse_version() and find_latest_ini() pick the highest one.
+
+Only the standard library is used, so importing this module does not pull
+in the build.
+"""
+
+import logging
+import mmap
+import os
+import re
+from pathlib import Path
+
+
+def parse_version(filename):
+    """(x, y, z) of a name like 2.9.0.ini or a tag like v2.9.0, (0, 0, 0) if it has none."""
+    match = re.match(r'v?(\d+)\.(\d+)\.(\d+)', os.path.basename(filename))
+    if match:
+        return tuple(map(int, match.groups()))
+    return (0, 0, 0)
+
+
+def find_latest_ini(ini_files=None):
+    """The highest x.y.z.ini of ini_files (prusa-upstream/PrusaResearch by default), or None."""
+    if ini_files is None:
+        ini_files = Path('prusa-upstream/PrusaResearch').glob('*.ini')
+    ini_files = [f for f in ini_files if re.match(r'\d+\.\d+\.\d+\.ini$', f.name)]
+    if not ini_files:
+        return None
+    latest = max(ini_files, key=lambda x: parse_version(x))
+    logging.info(f'Found latest ini file: {latest}')
+    return latest
+
+
+COMMENT_RE = re.compile(r'#[^\n]*')
+TRAILING_WHITESPACE_RE = re.compile(r'[^\S\n]+$', re.MULTILINE)
+# Line boundaries str.splitlines() recognises besides a plain '\n'
+OTHER_LINE_BREAKS = ('\r', '\v', '\f', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029')
+LINE_BREAK_RE = re.compile('\r\n|[\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+
+# The same for UTF-8 bytes. Trailing runs of whitespace and non-ASCII bytes
+# are matched, and decoded to strip just the whitespace among them
+COMMENT_BYTES_RE = re.compile(rb'#[^\n]*')
+TRAILING_WHITESPACE_BYTES_RE = re.compile(rb'[\t\x0b\x0c\r\x1c-\x1f \x80-\xff]+$', re.MULTILINE)
+OTHER_LINE_BREAKS_BYTES = tuple(line_break.encode('utf-8') for line_break in OTHER_LINE_BREAKS)
+LINE_BREAK_BYTES_RE = re.compile(rb'\r\n|[\r\v\f\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]')
+
+
+def _strip_comment(match):
+    text = match.string
+    line_start = text.rfind('\n', 0, match.start()) + 1
+    if 'colour' in text[line_start:match.end()].lower():
+        # Preserve lines containing 'colour' as is
+        return match.group(0)
+    # Skip over escaped '#' to the first one that starts a comment
+    comment_pos = match.start()
+    while comment_pos > line_start and text[comment_pos - 1] == '\\':
+        comment_pos = text.find('#', comment_pos + 1, match.end())
+        if comment_pos == -1:
+            return match.group(0)
+    return text[match.start():comment_pos]
+
+
+def strip_comments(text):
+    # Strip comments while preserving empty lines and color-related comments.
+    # Same result as stripping every line of text.splitlines() and joining
+    # them with '\n', but done in whole-text regex passes.
+    if any(line_break in text for line_break in OTHER_LINE_BREAKS):
+        text = LINE_BREAK_RE.sub('\n', text)
+    if text.endswith('\n'):
+        text = text[:-1]
+    text = COMMENT_RE.sub(_strip_comment, text)
+    return TRAILING_WHITESPACE_RE.sub('', text)
+
+
+def _strip_comment_bytes(match):
+    # _strip_comment() for bytes, whose items are ints rather than characters
+    text = match.string
+    line_start = text.rfind(b'\n', 0, match.start()) + 1
+    if b'colour' in text[line_start:match.end()].lower():
+        return match.group(0)
+    comment_pos = match.start()
+    while comment_pos > line_start and text[comment_pos - 1:comment_pos] == b'\\':
+        comment_pos = text.find(b'#', comment_pos + 1, match.end())
+        if comment_pos == -1:
+            return match.group(0)
+    return text[match.start():comment_pos]
+
+
+def _strip_trailing_bytes(match):
+    # A run of non-ASCII bytes always starts on a character boundary
+    return match.group(0).decode('utf-8').rstrip().encode('utf-8')
+
+
+def strip_comments_bytes(data):
+    # strip_comments() for UTF-8 bytes, or an mmap of them, without decoding
+    # them. Returns the same content as strip_comments() of the text, encoded.
+    if any(data.find(line_break) != -1 for line_break in OTHER_LINE_BREAKS_BYTES):
+        data = LINE_BREAK_BYTES_RE.sub(b'\n', data)
+    end = len(data) - 1 if data[-1:] == b'\n' else len(data)
+    # Comments are few, so the text between them is joined straight from
+    # views of the input instead of being copied piece by piece
+    with memoryview(data) as view:
+        parts = []
+        last = 0
+        for match in COMMENT_BYTES_RE.finditer(data, 0, end):
+            parts += [view[last:match.start()], _strip_comment_bytes(match)]
+            last = match.end()
+        parts.append(view[last:end])
+        stripped = b''.join(parts)
+        # The views have to go before the memoryview is released
+        del parts
+    return TRAILING_WHITESPACE_BYTES_RE.sub(_strip_trailing_bytes, stripped)
+
+
+def read_stripped(path):
+    """Memory-map an upstream .ini and return its UTF-8 content with comments stripped."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return strip_comments_bytes(mapped)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Check the Smartbox overlay files against what the upstream bundle accepts.
+
+Mistakes in an overlay (a misspelt key, `filament_density = 1,23`, a value
+where PrusaSlicer expects 0 or 1) otherwise only show up once the bundle is
+loaded in the slicer. The schema they are checked against is learnt from the
+latest upstream .ini: every key seen in each section type, and what its
+values look like there:
+
+- bool: only ever 0 or 1
+- number: a number, with the lowest and highest value seen
+- percent: a number or a percentage
+- numbers: comma-separated numbers, as in per-extruder options
+- enum: one of a handful of words, e.g. filament_type
+- text: anything else
+
+Building the schema means parsing the whole upstream file, so it is saved
+under build/.cache/lint/, named after the file's hash, and only learnt again
+when upstream changes. The overlay files are then checked one after the
+other or, when there are more than PARALLEL_MIN_FILES of them, in a process
+pool, and every problem in every file is reported together:
+
+    python lint.py            # or: python pipeline.py lint
+
+Errors (unknown keys, values of the wrong type, lines that are not
+`key = value`, repeated keys or sections) fail the run. Warnings (inline
+comments and trailing whitespace, which build.py strips; values outside
+the range or set seen upstream) are reported too, and fail it with
+--strict.
+"""
+
+import argparse
+import difflib
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from cache import CACHE_DIR, BuildCache, read_sidecar, write_sidecar
+from ini_model import IniModel, SECTION_HEADER_RE, format_key, section_key
+from ini_text import find_latest_ini, read_stripped, strip_comments
+from vendors import Vendor
+from version import read_overlays
+
+SCHEMA_DIR = CACHE_DIR / 'lint'
+# Bump when the schema format or the way it is learnt changes
+SCHEMA_FORMAT = 1
+# A key with at most this many distinct words upstream, each seen at least
+# ENUM_MIN_USES times on average, is taken to be an enumeration
+ENUM_LIMIT = 12
+ENUM_MIN_USES = 3
+# Checking a file takes a few milliseconds; below this many files starting
+# worker processes costs more than it saves
+PARALLEL_MIN_FILES = 500
+
+NUMBER_RE = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+PERCENT_RE = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)%$')
+WORD_RE = re.compile(r'^[A-Za-z][\w\-.]*$')
+OPTION_RE = re.compile(r'^([^=]*?)\s*=(.*)$')
+
+
+class Problem:
+    """One finding, at a line of an overlay file."""
+
+    def __init__(self, path, line, severity, message):
+        self.path = path
+        self.line = line
+        self.severity = severity
+        self.message = message
+
+    def __str__(self):
+        return f'{self.path}:{self.line}: {self.severity}: {self.message}'
+
+
+def value_type(value):
+    """Type of a single upstream value, the most specific that fits."""
+    if value in ('0', '1'):
+        return 'bool'
+    if NUMBER_RE.match(value):
+        return 'number'
+    if PERCENT_RE.match(value):
+        return 'percent'
+    if ',' in value and all(NUMBER_RE.match(part.strip()) for part in value.split(',')):
+        return 'numbers'
+    if WORD_RE.match(value):
+        return 'word'
+    return 'text'
+
+
+def _numbers(value):
+    return [float(part.rstrip('%')) for part in value.split(',')]
+
+
+def learn_schema(model):
+    """{section type: {key: spec}} of every key in an IniModel, see the module docstring."""
+    seen = {}
+    for section in model:
+        kinds = seen.setdefault(section.kind, {})
+        for key, value in section.items():
+            kinds.setdefault(key, []).append(value)
+
+    schema = {}
+    for kind, keys in seen.items():
+        specs = schema[kind] = {}
+        for key, values in keys.items():
+            present = [value for value in values if value != '']
+            spec = {'empty': len(present) < len(values)}
+            # The narrowest type that every value seen fits
+            types = {value_type(value) for value in present}
+            kind_of_key = 'text'
+            if not types:
+                pass
+            elif types <= {'bool'}:
+                kind_of_key = 'bool'
+            elif types <= {'bool', 'number'}:
+                kind_of_key = 'number'
+            elif types <= {'bool', 'number', 'percent'}:
+                kind_of_key = 'percent'
+            elif types <= {'bool', 'number', 'numbers'}:
+                kind_of_key = 'numbers'
+            elif types <= {'bool', 'number', 'word'}:
+                words = set(present)
+                if len(words) <= ENUM_LIMIT and len(present) >= ENUM_MIN_USES * len(words):
+                    kind_of_key = 'enum'
+                    spec['values'] = sorted(words)
+            if kind_of_key in ('number', 'percent', 'numbers'):
+                numbers = [number for value in present for number in _numbers(value)]
+                spec['min'] = min(numbers)
+                spec['max'] = max(numbers)
+            spec['type'] = kind_of_key
+            specs[key] = spec
+    return schema
+
+
+def load_schema(latest_ini, cache=None):
+    """The schema of an upstream .ini, learnt on first use and then read from build/.cache/lint/."""
+    cache = cache or BuildCache()
+    path = SCHEMA_DIR / f'{cache.file_hash(latest_ini)}.json'
+    data = read_sidecar(path, SCHEMA_FORMAT)
+    if data is not None:
+        return data['schema']
+    with metrics.stage('lint_schema'):
+        schema = learn_schema(IniModel(read_stripped(latest_ini)))
+    write_sidecar(path, SCHEMA_FORMAT, {'file': str(latest_ini), 'schema': schema})
+    logging.info(f'Learnt the keys of {len(schema)} section types from {latest_ini}')
+    return schema
+
+
+def check_value(key, value, spec):
+    """(severity, message) for a value that does not fit the key's spec, or None."""
+    if value == '':
+        if not spec['empty']:
+            return 'warning', f'{key} is empty, upstream always sets it'
+        return None
+    kind = spec['type']
+    if kind == 'bool' and value not in ('0', '1'):
+        return 'error', f'{key} = {value} should be 0 or 1'
+    if kind in ('number', 'percent', 'numbers'):
+        parts = value.split(',') if kind == 'numbers' else [value]
+        pattern = PERCENT_RE if kind == 'percent' else None
+        for part in parts:
+            part = part.strip()
+            if not NUMBER_RE.match(part) and not (pattern and pattern.match(part)):
+                expected = {'number': 'a number', 'percent': 'a number or percentage',
+                            'numbers': 'comma-separated numbers'}[kind]
+                return 'error', f'{key} = {value} should be {expected}'
+        numbers = _numbers(value)
+        if min(numbers) < spec['min'] or max(numbers) > spec['max']:
+            return 'warning', (f'{key} = {value} is outside the range seen upstream '
+                               f'({spec["min"]:g} to {spec["max"]:g})')
+    if kind == 'enum' and value not in spec['values']:
+        return 'warning', f'{key} = {value} is none of {", ".join(spec["values"])}'
+    return None
+
+
+def lint_file(path, text, schema):
+    """Every problem in one overlay file, in line order."""
+    problems = []
+
+    def report(line, severity, message):
+        problems.append(Problem(path, line, severity, message))
+
+    is_removal = path.name.endswith('.rm.ini')
+    sections = set()
+    kind = None
+    keys = None
+    for number, line in enumerate(text.split('\n'), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        header = SECTION_HEADER_RE.match(line)
+        if header:
+            key = section_key(header.group(1))
+            if key in sections:
+                report(number, 'error', f'{format_key(key)} appears twice')
+            sections.add(key)
+            kind = key[0]
+            keys = set()
+            if kind not in schema:
+                report(number, 'error', f'unknown section type [{kind}]')
+            continue
+        if kind is None:
+            report(number, 'error', 'content outside of any section')
+            continue
+
+        # What build.py will make of the line
+        without_comment = strip_comments(line)
+        if without_comment != line.rstrip():
+            comment = line.rstrip()[len(without_comment):].strip()
+            report(number, 'warning', f'inline comment "{comment}" is dropped from the bundle')
+        elif without_comment != line:
+            report(number, 'warning', 'trailing whitespace')
+        option = OPTION_RE.match(without_comment)
+        if not option or not option.group(1).strip():
+            report(number, 'error', f'"{stripped}" is not a key = value line')
+            continue
+        key, value = option.group(1).strip(), option.group(2).strip()
+        if key in keys:
+            report(number, 'error', f'{key} is set twice in this section')
+        keys.add(key)
+        # Removals are compared with upstream by the build itself
+        if is_removal or kind not in schema:
+            continue
+        spec = schema[kind].get(key)
+        if spec is None:
+            message = f'unknown key {key} for [{kind}]'
+            close = difflib.get_close_matches(key, schema[kind], n=1)
+            if close:
+                message += f', did you mean {close[0]}?'
+            report(number, 'error', message)
+            continue
+        finding = check_value(key, value, spec)
+        if finding:
+            report(number, *finding)
+    return problems
+
+
+def lint_overlays(overlays, schema, workers=None):
+    """Check every overlay file, returning all problems ordered by file and line.
+
+    The checks are pure Python, so they only run in parallel in worker
+    processes, and only for more than PARALLEL_MIN_FILES files.
+    """
+    workers = workers or os.cpu_count() or 1
+    paths = list(overlays)
+    texts = [overlays[path] for path in paths]
+    if workers > 1 and len(paths) > PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # The schema is pickled once per chunk, not once per file
+            results = list(pool.map(lint_file, paths, texts, [schema] * len(paths),
+                                    chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        results = [lint_file(path, text, schema) for path, text in zip(paths, texts)]
+    return [problem for problems in results for problem in problems]
+
+
+def lint(vendor=None, overlays=None, cache=None, strict=False):
+    """Lint a vendor's overlays and log the problems. Returns True if they pass."""
+    vendor = vendor or Vendor()
+    if overlays is None:
+        overlays = read_overlays(vendor.overlay_dir)
+    latest_ini = find_latest_ini(vendor.ini_files)
+    if latest_ini is None:
+        vendor.report_missing_upstream()
+        return False
+    with metrics.stage('lint'):
+        schema = load_schema(latest_ini, cache)
+        problems = lint_overlays(overlays, schema)
+    errors = [problem for problem in problems if problem.severity == 'error']
+    for problem in problems:
+        (logging.error if problem.severity == 'error' else logging.warning)(str(problem))
+    failed = bool(errors) or (strict and bool(problems))
+    logging.info(f'Linted {len(overlays)} overlay files: {len(errors)} errors, '
+                 f'{len(problems) - len(errors)} warnings')
+    return not failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the Smartbox overlays against the upstream bundle.')
+    parser.add_argument('--strict', action='store_true', help='fail on warnings too')
+    args = parser.parse_args(argv)
+    try:
+        if not lint(strict=args.strict):
+            logging.error('Lint failed')
+            sys.exit(1)
+    finally:
+        metrics.write_report()
+
+
+if __name__ == '__main__':
+    main()
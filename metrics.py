@@ -0,0 +1,210 @@
+"""
+Per-stage instrumentation for the build and release scripts.
+
+Every stage of version.py, build.py and release.py runs inside
+`with metrics.stage(name):`, which records its wall time, CPU time
+(including that of worker processes it waited for), bytes read and
+written, and peak resident memory. write_report() saves what was recorded
+in this process to build/metrics.json.
+
+Bytes are counted by the kernel for this process (/proc/self/io, so Linux
+only) and cover file and pipe I/O whether or not it hit the disk; worker
+processes of the offline archive are not included. On Linux the peak
+resident size is reset at the start of each stage so it is that stage's
+own peak; elsewhere it is the peak of the process up to the end of the
+stage.
+
+Stages started from different threads, as scheduler.py runs them, nest
+only within their own thread; each thread's first stage is a top-level
+one. The kernel counters are per process, so the bytes and peak memory of
+stages that overlap include each other's.
+
+Set BUILD_PROFILE=1 to also run every top-level stage under cProfile and
+print the profile of the slowest one; it is saved to
+build/profile-<stage>.prof as well.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_PATH = Path('build/metrics.json')
+PROFILE_ENV = 'BUILD_PROFILE'
+# Lines of the profile printed for the slowest stage
+PROFILE_LINES = 30
+
+_records = []
+# The stages open in each thread
+_local = threading.local()
+_profiles = {}
+_started = datetime.now()
+
+
+def _io_counters():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss():
+    """Reset the kernel's high-water mark of this process' resident size, if possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    """Peak resident size in bytes since the last reset (or process start)."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # Kilobytes on Linux, bytes on macOS
+        scale = 1 if os.uname().sysname == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return None
+
+
+def _cpu_time():
+    cpu = time.process_time()
+    if resource is not None:
+        # Worker processes that have been waited for, such as a finished process pool
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def stage(name):
+    """Record the cost of the enclosed block as stage `name`.
+
+    Yields the stage's record, to which the block can add details (for
+    example cached=True when it found its outputs up to date).
+    """
+    stack = _stack()
+    record = {'name': name, 'depth': len(stack)}
+    _records.append(record)
+    # An inner stage resets the peak, so fold what the outer one saw so far into it
+    if stack:
+        stack[-1]['peak_rss'] = max(stack[-1]['peak_rss'] or 0, _peak_rss() or 0)
+    record['peak_rss'] = None
+    _reset_peak_rss()
+    stack.append(record)
+
+    profile = None
+    if os.environ.get(PROFILE_ENV) and record['depth'] == 0:
+        profile = cProfile.Profile()
+    io_start = _io_counters()
+    cpu_start = _cpu_time()
+    wall_start = time.perf_counter()
+    if profile:
+        profile.enable()
+    try:
+        yield record
+    finally:
+        if profile:
+            profile.disable()
+            _profiles[name] = profile
+        record['wall'] = time.perf_counter() - wall_start
+        record['cpu'] = _cpu_time() - cpu_start
+        io_end = _io_counters()
+        if io_start and io_end:
+            record['bytes_read'] = io_end[0] - io_start[0]
+            record['bytes_written'] = io_end[1] - io_start[1]
+        record['peak_rss'] = max(record['peak_rss'] or 0, _peak_rss() or 0) or None
+        stack.pop()
+        if stack:
+            stack[-1]['peak_rss'] = max(stack[-1]['peak_rss'] or 0, record['peak_rss'] or 0)
+        logging.info(f"Stage {name} took {record['wall']:.3f}s ({record['cpu']:.3f}s CPU)")
+
+
+def reset():
+    """Forget everything recorded, e.g. in a worker process forked from a build."""
+    _records.clear()
+    _stack().clear()
+    _profiles.clear()
+
+
+def take_records():
+    """Return the finished stages recorded so far and forget them, to hand back from a worker."""
+    finished = [record for record in _records if 'wall' in record]
+    reset()
+    return finished
+
+
+def add_records(records, **details):
+    """Add stages recorded in a worker process to this process' report, tagged with details."""
+    for record in records:
+        record.update(details)
+        _records.append(record)
+
+
+def print_slowest_profile(directory=METRICS_PATH.parent):
+    """Print the cProfile profile of the slowest top-level stage and save it to directory."""
+    profiled = [record for record in _records if record['name'] in _profiles and 'wall' in record]
+    if not profiled:
+        return
+    slowest = max(profiled, key=lambda record: record['wall'])
+    profile = _profiles[slowest['name']]
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    print(f"Profile of the slowest stage, {slowest['name']} ({slowest['wall']:.3f}s):")
+    print(output.getvalue())
+    profile_path = Path(directory) / f"profile-{slowest['name']}.prof"
+    profile.dump_stats(profile_path)
+    logging.info(f'Saved profile to {profile_path}')
+
+
+def write_report(path=METRICS_PATH):
+    """Write the stages recorded in this process to build/metrics.json."""
+    finished = [record for record in _records if 'wall' in record]
+    # Stages of vendors built in worker processes ran alongside these, so
+    # they are listed but not added to the totals
+    top_level = [record for record in finished if record['depth'] == 0 and 'vendor' not in record]
+    report = {
+        'started': _started.isoformat(timespec='seconds'),
+        'total': {
+            'wall': sum(record['wall'] for record in top_level),
+            'cpu': sum(record['cpu'] for record in top_level),
+            'bytes_read': sum(record.get('bytes_read', 0) for record in top_level),
+            'bytes_written': sum(record.get('bytes_written', 0) for record in top_level),
+            'peak_rss': max((record['peak_rss'] or 0 for record in top_level), default=0),
+        },
+        'stages': finished,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f'Wrote stage metrics to {path}')
+    if os.environ.get(PROFILE_ENV):
+        print_slowest_profile(path.parent)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the version, build and release steps.
+
+Running version.py, build.py and release.py one after another starts three
+interpreters, and each of them lists prusa-upstream/PrusaResearch, reads the
+Smartbox overlays and reads back what the previous step wrote to build/.
+The Pipeline object runs the same steps in one process instead: the upstream
+directory is listed once, every overlay is read once, and the version info
+and index.idx content are handed from one step to the next in memory. The
+merged configuration is written to build/ once and linked from there.
+
+Other vendor directories of the upstream repository can be built alongside
+PrusaResearch, each with its own overlays (Smartbox/<Vendor>/ unless given):
+
+    python pipeline.py all --vendor Creality --vendor Anker=overlays/anker
+
+Each further vendor is merged and packaged in a worker process while
+PrusaResearch is built in this one, so the build takes as long as the
+slowest vendor rather than all of them together. The release then puts
+every vendor into the one offline archive and vendor_indices.zip.
+
+`all` does not run the steps one after the other but hands their stages to
+scheduler.py, declared with what each reads and writes, so that stages that
+do not depend on each other overlap: the upstream copies are made while the
+version is worked out, the merge and the further vendors run in worker
+processes while the manifest and vendor indices are written, and so on.
+The critical path is logged at the end.
+
+Usage:
+    python pipeline.py lint      # check the overlays, see lint.py
+    python pipeline.py version   # same as version.py
+    python pipeline.py build     # version + build.py
+    python pipeline.py release   # release.py on an existing build/
+    python pipeline.py all       # everything, independent stages at the same time
+    python pipeline.py watch     # rebuild on every change to Smartbox/, see watch.py
+"""
+
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import build
+import lint
+import metrics
+import release
+import version
+import watch
+from cache import CACHE_DIR, BuildCache
+from scheduler import Scheduler, Task
+from vendors import MAIN_VENDOR, Vendor, parse_vendor
+
+
+def build_vendor(name, overlay_dir, version_str):
+    """Build and package one further vendor; runs in a worker process.
+    
+    Returns the stages it recorded, for the parent's metrics report.
+    """
+    # Forget whatever the parent had recorded when this process was forked
+    metrics.reset()
+    vendor = Vendor(name, overlay_dir)
+    if not vendor.upstream_dir.is_dir():
+        logging.error(f'Vendor directory {vendor.upstream_dir} does not exist')
+        sys.exit(1)
+    # A cache of its own, so that vendors built concurrently never write the same file
+    cache = BuildCache(CACHE_DIR / name)
+    overlays = version.read_overlays(vendor.overlay_dir)
+    version.write_vendor_index(version_str, vendor, overlays)
+    build.process_files(version_str, vendor.ini_files, overlays, cache, vendor)
+    release.package_vendor(cache=cache, vendor=vendor)
+    return metrics.take_records()
+
+
+def staged(name, run, *args):
+    """Run a function as metrics stage `name`."""
+    with metrics.stage(name):
+        return run(*args)
+
+
+class Pipeline:
+    """State shared between the steps of one run."""
+
+    def __init__(self, vendors=(), workers=None, previous=None, base_url=None, compresslevel=None):
+        self.vendor = Vendor()
+        self.extra_vendors = []
+        for vendor in vendors:
+            if vendor.name == MAIN_VENDOR:
+                self.vendor = vendor
+            else:
+                self.extra_vendors.append(vendor)
+        self.workers = workers
+        self.previous = previous
+        self.base_url = base_url
+        self.compresslevel = compresslevel
+        self.cache = BuildCache()
+        self.version_info = None
+        self._overlays = None
+
+    @property
+    def upstream_files(self):
+        """Every file in the upstream vendor directory, listed once per run."""
+        return self.vendor.upstream_files
+
+    @property
+    def ini_files(self):
+        return self.vendor.ini_files
+
+    @property
+    def overlays(self):
+        """Text of every overlay file, read once per run."""
+        if self._overlays is None:
+            self._overlays = version.read_overlays(self.vendor.overlay_dir)
+        return self._overlays
+
+    def lint(self):
+        if not lint.lint(self.vendor, self.overlays, self.cache):
+            logging.error('Lint failed')
+            sys.exit(1)
+
+    def version(self):
+        self.version_info = version.main(self.ini_files, self.overlays, self.cache)
+        return self.version_info
+
+    def build(self):
+        if self.version_info is None:
+            self.version()
+        version_str = self.version_info['version']
+        pool = None
+        if self.extra_vendors:
+            workers = min(len(self.extra_vendors), self.workers or os.cpu_count() or 1)
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(build_vendor, vendor.name, str(vendor.overlay_dir), version_str)
+                       for vendor in self.extra_vendors]
+        try:
+            build.process_files(version_str, self.ini_files, self.overlays, self.cache)
+            if pool is not None:
+                for vendor, future in zip(self.extra_vendors, futures):
+                    metrics.add_records(future.result(), vendor=vendor.name)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def release(self):
+        index_content = self.version_info['index'] if self.version_info else None
+        release.main(index_content, self.upstream_files, cache=self.cache, vendors=self.extra_vendors,
+                     previous=self.previous, base_url=self.base_url, compresslevel=self.compresslevel)
+
+    def tasks(self):
+        """The stages of a full run, as scheduler Tasks named after what they read and write."""
+        vendor = self.vendor
+        upstream, overlays = str(vendor.upstream_dir), str(vendor.overlay_dir)
+        copies = str(vendor.build_dir / '*.ini')
+        bundle_dirs = [str(vendor.build_dir)]
+        tasks = [
+            Task('version', self.version, inputs=[upstream, overlays], outputs=version.VERSION_OUTPUTS),
+            Task('copy', build.copy_ini_files, inputs=[upstream], outputs=[copies],
+                 args=lambda results: (self.ini_files, self.cache, vendor)),
+            Task('merge', build.merge_files, kind='cpu',
+                 inputs=['build/version.txt', copies, upstream, overlays],
+                 outputs=[str(vendor.merged_ini), str(vendor.compatibility_path), str(vendor.catalog_path)],
+                 args=lambda results: (results['version']['version'], self.ini_files, self.overlays,
+                                       results['copy'], None, vendor)),
+            Task('assets', release.package_vendor, inputs=[str(vendor.merged_ini), upstream],
+                 outputs=[str(vendor.build_dir)],
+                 args=lambda results: (None, None, self.cache, vendor)),
+            Task('manifest', staged, outputs=['build/manifest.json'],
+                 args=lambda results: ('manifest', release.create_manifest, self.base_url)),
+        ]
+        for extra in self.extra_vendors:
+            bundle_dirs.append(str(extra.build_dir))
+            tasks.append(Task(f'vendor:{extra.name}', build_vendor, kind='cpu',
+                              inputs=['build/version.txt', str(extra.upstream_dir), str(extra.overlay_dir)],
+                              outputs=[str(extra.index_path), str(extra.build_dir)],
+                              args=lambda results, extra=extra: (extra.name, str(extra.overlay_dir),
+                                                                 results['version']['version'])))
+        tasks += [
+            Task('vendor_indices', release.package_vendor_indices,
+                 inputs=['build/index.idx', *(str(extra.index_path) for extra in self.extra_vendors)],
+                 outputs=['build/vendor_indices.zip', 'build/vendor_indices_internal.zip'],
+                 args=lambda results: (results['version']['index'], self.extra_vendors, self.cache)),
+            # Reads the previous offline zip, so it must finish before the new one is written
+            Task('changelog', staged, inputs=[str(vendor.merged_ini), 'build/version.txt'],
+                 outputs=['build/changelog.json'],
+                 args=lambda results: ('changelog', release.write_changelog, None, self.previous, vendor)),
+            # Compresses on a process pool of its own
+            Task('offline_zip', release.package_offline_archive,
+                 inputs=['build/manifest.json', 'build/vendor_indices_internal.zip', 'build/changelog.json',
+                         *bundle_dirs],
+                 outputs=['build/prusa-fff-offline.zip'],
+                 args=lambda results: (vendor, self.extra_vendors, self.cache, self.compresslevel)),
+            Task('validate', release.check_archive, inputs=['build/prusa-fff-offline.zip'],
+                 args=lambda results: (vendor, self.extra_vendors, self.cache)),
+        ]
+        return tasks
+
+    def all(self):
+        Path('build').mkdir(exist_ok=True)
+        # Listed and read here, before the tasks share them between threads
+        self.upstream_files
+        self.overlays
+        results = Scheduler(self.tasks(), processes=self.workers).run()
+        for extra in self.extra_vendors:
+            metrics.add_records(results[f'vendor:{extra.name}'], vendor=extra.name)
+        logging.info('Release build completed successfully')
+
+    def watch(self):
+        if self.version_info is None:
+            self.version()
+        watch.Watcher(self.version_info['version'], self.vendor).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the Smartbox PrusaSlicer configuration bundle.')
+    parser.add_argument('command', choices=['lint', 'version', 'build', 'release', 'all', 'watch'],
+                        help='steps to run')
+    parser.add_argument('--vendor', dest='vendors', action='append', type=parse_vendor, default=[],
+                        metavar='NAME[=OVERLAY_DIR]',
+                        help='also build prusa-upstream/NAME with the overlays in OVERLAY_DIR '
+                             '(default Smartbox/NAME); may be repeated')
+    parser.add_argument('--workers', type=int, help='processes for building further vendors')
+    parser.add_argument('--previous', metavar='ZIP_OR_INI',
+                        help='previous release to list profile changes against '
+                             '(default: found from the latest release tag)')
+    parser.add_argument('--base-url', metavar='URL',
+                        help='where PrusaSlicer downloads bundle updates, e.g. a mirror run with serve.py '
+                             '(default: the latest GitHub release)')
+    parser.add_argument('--compresslevel', type=int, choices=range(10), metavar='0-9',
+                        help='deflate level of the .ini, SVG and STL files in the offline zip '
+                             '(default: zlib\'s, 6); images are always stored')
+    args = parser.parse_args(argv)
+
+    try:
+        pipeline = Pipeline(args.vendors, args.workers, args.previous, args.base_url, args.compresslevel)
+        getattr(pipeline, args.command)()
+    finally:
+        metrics.write_report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Compact in-memory store for many versions of an upstream vendor bundle.
+
+Comparing releases, or checking the overlays against several of them, needs
+dozens of multi-megabyte .ini versions loaded at once. Kept as dicts of
+strings that would take gigabytes, most of it repeated: consecutive
+releases share nearly all of their profiles, and within a release
+thousands of profiles share the same option names and many values.
+
+Each version is parsed with the section model (ini_model.py) into Profile
+records with __slots__. Option names and values are interned, the tuples
+of option names and of values are shared between every profile that has
+the same ones, and a profile that is unchanged from an earlier version is
+the very same object in both. Memory then grows with the content that is
+actually unique, not with the total size of the files.
+"""
+
+import re
+import sys
+from pathlib import Path
+
+from ini_model import IniModel
+from ini_text import parse_version, strip_comments
+
+
+class Profile:
+    """One [type:name] section: its option names and values as shared tuples."""
+
+    __slots__ = ('kind', 'name', 'keys', 'values')
+
+    def __init__(self, kind, name, keys, values):
+        self.kind = kind
+        self.name = name
+        self.keys = keys
+        self.values = values
+
+    @property
+    def key(self):
+        return (self.kind, self.name)
+
+    def items(self):
+        return zip(self.keys, self.values)
+
+    def get(self, option, default=None):
+        for key, value in zip(self.keys, self.values):
+            if key == option:
+                return value
+        return default
+
+    def as_dict(self):
+        return dict(zip(self.keys, self.values))
+
+    def __repr__(self):
+        return f'Profile({self.kind!r}, {self.name!r})'
+
+
+class StoredVersion:
+    """The profiles of one version, in file order, looked up by (type, name)."""
+
+    __slots__ = ('label', 'profiles', '_index')
+
+    def __init__(self, label, profiles):
+        self.label = label
+        self.profiles = profiles
+        self._index = None
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __iter__(self):
+        return iter(self.profiles)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        profile = self.get(key)
+        if profile is None:
+            raise KeyError(key)
+        return profile
+
+    def get(self, key, default=None):
+        # The index is only built for versions that are actually searched
+        if self._index is None:
+            self._index = {profile.key: profile for profile in self.profiles}
+        return self._index.get(key, default)
+
+    def keys(self):
+        return [profile.key for profile in self.profiles]
+
+
+class ProfileStore:
+    """Many versions of a vendor bundle, sharing every repeated string, tuple and profile."""
+
+    def __init__(self):
+        self.versions = {}
+        self._tuples = {}
+        self._profiles = {}
+
+    def _share(self, items):
+        items = tuple(items)
+        return self._tuples.setdefault(items, items)
+
+    def add(self, label, text):
+        """Parse the text of one .ini version and store it under label."""
+        profiles = []
+        for section in IniModel(strip_comments(text)).sections:
+            pairs = list(section.items())
+            keys = self._share(sys.intern(key) for key, _ in pairs)
+            values = self._share(sys.intern(value) for _, value in pairs)
+            identity = (section.kind, section.name, keys, values)
+            profile = self._profiles.get(identity)
+            if profile is None:
+                profile = Profile(sys.intern(section.kind), sys.intern(section.name), keys, values)
+                self._profiles[identity] = profile
+            profiles.append(profile)
+        version = StoredVersion(label, tuple(profiles))
+        self.versions[label] = version
+        return version
+
+    def load(self, path, label=None):
+        """Add one .ini file, labelled by its version (the file name) unless given."""
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return self.add(label or path.stem, f.read())
+
+    def __getitem__(self, label):
+        return self.versions[label]
+
+    def __iter__(self):
+        return iter(self.versions.values())
+
+    def stats(self):
+        """Counts showing how much of the stored content is shared."""
+        return {
+            'versions': len(self.versions),
+            'profiles': sum(len(version) for version in self.versions.values()),
+            'unique_profiles': len(self._profiles),
+            'unique_tuples': len(self._tuples),
+        }
+
+
+def load_upstream(upstream_dir='prusa-upstream/PrusaResearch'):
+    """Load every <version>.ini of a vendor directory into one store, oldest first."""
+    store = ProfileStore()
+    ini_files = [f for f in Path(upstream_dir).glob('*.ini') if re.match(r'\d+\.\d+\.\d+', f.name)]
+    for path in sorted(ini_files, key=lambda f: (parse_version(f), f.name)):
+        store.load(path)
+    return store
@@ -0,0 +1,121 @@
+"""
+Resolution of `inherits = ...` chains between bundle profiles.
+
+PrusaSlicer flattens a profile by applying each parent listed in `inherits`
+in order, later parents overriding earlier ones, and finally the profile's own
+values. Parents are looked up among the sections of the same type, so
+`[filament:Eono PVB @PG]` with `inherits = Eono PVB; *PLAPG*` resolves against
+`[filament:Eono PVB]` and `[filament:*PLAPG*]`.
+"""
+
+# Section types whose presets can inherit from each other
+INHERITING_TYPES = ('print', 'filament', 'printer', 'sla_print', 'sla_material')
+
+
+class InheritanceError(Exception):
+    """Raised when a profile names a missing parent or inherits from itself."""
+
+
+def parse_inherits(value):
+    """Split an `inherits` value into the list of parent names."""
+    return [name.strip() for name in value.split(';') if name.strip()]
+
+
+class ProfileResolver:
+    """Flattens profiles of an IniModel, memoizing every resolved profile.
+
+    The cache is invalidated per section: `invalidate(key)` drops that profile
+    and every profile that inherits from it, directly or indirectly.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._cache = {}
+        self._children = {}
+
+    def resolve(self, key):
+        """Return the flattened options of the profile with the given (type, name) key."""
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        return self._resolve(key, ())
+
+    def _resolve(self, key, chain):
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        if key in chain:
+            cycle = ' -> '.join(name for _, name in chain + (key,))
+            raise InheritanceError(f'Cyclic inheritance in [{key[0]}]: {cycle}')
+        section = self.model.get(key)
+        if section is None:
+            raise InheritanceError(f'Unknown profile [{key[0]}:{key[1]}]')
+
+        own = dict(section.items())
+        flattened = {}
+        for parent in parse_inherits(own.pop('inherits', '')):
+            parent_key = (key[0], parent)
+            if parent_key not in self.model:
+                raise InheritanceError(
+                    f'[{key[0]}:{key[1]}] inherits from unknown profile "{parent}"')
+            flattened.update(self._resolve(parent_key, chain + (key,)))
+            self._children.setdefault(parent_key, set()).add(key)
+        flattened.update(own)
+        self._cache[key] = flattened
+        return flattened
+
+    def invalidate(self, key):
+        """Forget the resolved profile for key and for everything inheriting from it."""
+        pending = [key]
+        while pending:
+            current = pending.pop()
+            self._cache.pop(current, None)
+            pending.extend(self._children.pop(current, ()))
+
+    def resolve_all(self):
+        """Flatten every inheriting profile in the model.
+
+        Returns a (profiles, errors) tuple, where profiles maps each key that
+        resolved to its options and errors lists one message per failure.
+        """
+        profiles = {}
+        errors = []
+        for section in self.model:
+            if section.kind not in INHERITING_TYPES:
+                continue
+            try:
+                profiles[section.key] = self.resolve(section.key)
+            except InheritanceError as e:
+                errors.append(str(e))
+        # A broken parent fails every profile below it with the same message
+        return profiles, list(dict.fromkeys(errors))
+
+    def check_all(self):
+        """Resolve every inheriting profile only to find the errors.
+
+        Unlike resolve_all(), the flattened options of a profile are dropped
+        again unless something has inherited from it so far, so memory is
+        not spent on every leaf profile of the bundle. A parent that comes
+        after its children in the file is resolved again. Returns a
+        (resolved count, errors) tuple.
+        """
+        resolved = 0
+        errors = []
+        for section in self.model:
+            if section.kind not in INHERITING_TYPES:
+                continue
+            try:
+                self.resolve(section.key)
+                resolved += 1
+            except InheritanceError as e:
+                errors.append(str(e))
+            self.release(section.key)
+        return resolved, list(dict.fromkeys(errors))
+
+    def release(self, key):
+        """Drop the flattened options of a profile, unless something inherits from it.
+
+        For passes over every profile that need each one only once.
+        """
+        if key not in self._children:
+            self._cache.pop(key, None)
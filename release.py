@@ -5,130 +5,205 @@ Release script to create a PrusaSlicer offline configuration bundle.
 This script creates a zip file that matches the structure of the official
 prusa-fff-offline.zip file, containing:
 - manifest.json
-- vendor_indices.zip (containing PrusaResearch.idx)
-- PrusaResearch/ directory with all .ini files and assets
+- vendor_indices.zip (containing PrusaResearch.idx, and <Vendor>.idx for
+  any further vendor built by pipeline.py)
+- PrusaResearch/ directory with all .ini files and assets, and the same for
+  every further vendor
 """
 
-import os
+import io
 import json
+import hashlib
 import zipfile
 import logging
+import os
 import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+
+import changelog
+import metrics
+from archive import write_members
+from cache import BuildCache, hash_file
+from fileops import copy_files, describe_copy
+from ini_text import find_latest_ini
+from vendors import Vendor
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def create_manifest():
-    """Create the manifest.json file."""
-    manifest = {
+REPOSITORY_URL = "https://github.com/Smartbox-Assistive-Technology/PrusaSlicer-settings-prusa-fff"
+DOWNLOAD_URL = f"{REPOSITORY_URL}/releases/latest/download"
+# The vendor indices are tiny and written once per release, so they get the
+# strongest deflate level. PrusaSlicer reads bundles with miniz, which only
+# knows deflate, so a stronger codec such as LZMA is not an option.
+STANDALONE_LEVEL = 9
+# Timestamp of the members of vendor_indices.zip unless SOURCE_DATE_EPOCH is
+# set: the earliest a zip can hold, so the same indices give the same bytes
+INDEX_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def manifest_content(base_url=None):
+    """The manifest.json content, downloading from base_url instead of the latest GitHub release if given."""
+    download_url = (base_url or DOWNLOAD_URL).rstrip('/')
+    return {
         "name": "Prusa FFF Smartbox",
         "description": "Smartbox custom Prusa FFF bundle",
         "visibility": "",
         "id": "prusa-fff",
-        "url": "https://github.com/Smartbox-Assistive-Technology/PrusaSlicer-settings-prusa-fff",
-        "index_url": "https://github.com/Smartbox-Assistive-Technology/PrusaSlicer-settings-prusa-fff/releases/latest/download/vendor_indices.zip",
-        "offline_archive_url": "https://github.com/Smartbox-Assistive-Technology/PrusaSlicer-settings-prusa-fff/releases/latest/download/prusa-fff-offline.zip"
+        "url": REPOSITORY_URL,
+        "index_url": f"{download_url}/vendor_indices.zip",
+        "offline_archive_url": f"{download_url}/prusa-fff-offline.zip"
     }
+
+def create_manifest(base_url=None):
+    """Create the manifest.json file.
+    
+    base_url points the bundle at a mirror such as serve.py rather than the
+    GitHub releases.
+    """
+    manifest = manifest_content(base_url)
     
     with open('build/manifest.json', 'w', encoding='utf-8') as f:
         json.dump(manifest, f, separators=(',', ':'))
     
     logging.info('Created manifest.json')
 
-def create_vendor_indices():
-    """Create the vendor_indices.zip file containing PrusaResearch.idx."""
-    # Use the index file from build directory (generated by version.py)
-    index_source = Path('build/index.idx')
-    index_dest = Path('build/PrusaResearch.idx')
-    
-    if not index_source.exists():
-        logging.error(f'Index file {index_source} does not exist')
-        sys.exit(1)
-    
-    # Copy and rename to match expected name
-    with open(index_source, 'r', encoding='utf-8') as src:
-        content = src.read()
+def index_date_time():
+    """Timestamp of the vendor index members: SOURCE_DATE_EPOCH if set, else INDEX_DATE_TIME."""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not epoch:
+        return INDEX_DATE_TIME
+    return max(datetime.fromtimestamp(int(epoch), timezone.utc).timetuple()[:6], INDEX_DATE_TIME)
+
+def create_vendor_indices(index_content=None, vendors=()):
+    """Create the vendor_indices.zip file containing PrusaResearch.idx.
     
-    with open(index_dest, 'w', encoding='utf-8') as dst:
-        dst.write(content)
+    Further vendors (see vendors.py) add their index as <Vendor>.idx.
+    """
+    if index_content is None:
+        # Use the index file from build directory (generated by version.py)
+        index_source = Path('build/index.idx')
+        
+        if not index_source.exists():
+            logging.error(f'Index file {index_source} does not exist')
+            sys.exit(1)
+        
+        with open(index_source, 'r', encoding='utf-8') as src:
+            index_content = src.read()
     
-    # Create the vendor_indices.zip for the offline bundle
-    with zipfile.ZipFile('build/vendor_indices_internal.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.write(index_dest, 'PrusaResearch.idx')
+    indices = [('PrusaResearch', index_content)]
+    for vendor in vendors:
+        with open(vendor.index_path, 'r', encoding='utf-8') as src:
+            indices.append((vendor.name, src.read()))
     
-    # Create the standalone vendor_indices.zip for direct download
-    with zipfile.ZipFile('build/vendor_indices.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.write(index_dest, 'PrusaResearch.idx')
+    # Stored under the names PrusaSlicer expects, straight from memory, with
+    # a fixed timestamp so that an unchanged index leaves the zip, and the
+    # offline archive's cache key, unchanged
+    date_time = index_date_time()
     
-    # Clean up the temporary file
-    index_dest.unlink()
+    # Create the vendor_indices.zip for the offline bundle, and the
+    # standalone vendor_indices.zip for direct download
+    for zip_path in ('build/vendor_indices_internal.zip', 'build/vendor_indices.zip'):
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=STANDALONE_LEVEL) as zf:
+            for name, content in indices:
+                index_info = zipfile.ZipInfo(f'{name}.idx', date_time)
+                index_info.external_attr = 0o644 << 16
+                zf.writestr(index_info, content)
     
     logging.info('Created vendor_indices.zip (standalone and internal versions)')
 
-def copy_prusa_research_files():
-    """Copy all files from PrusaResearch directory to build/PrusaResearch/, using modified .ini if available."""
-    prusa_dir = Path('prusa-upstream/PrusaResearch')
-    build_prusa_dir = Path('build/PrusaResearch')
+def copy_prusa_research_files(upstream_files=None, content=None, vendor=None):
+    """Put the bundle's .ini files in build/PrusaResearch/, using modified .ini if available.
     
-    if not prusa_dir.exists():
-        logging.error(f'PrusaResearch directory does not exist')
-        sys.exit(1)
+    upstream_files is the listing of prusa-upstream/PrusaResearch and content
+    the merged configuration, when the caller already has them. vendor
+    selects another vendor's directories instead (see vendors.py). The
+    other assets are not staged here, create_offline_archive() reads them
+    straight from prusa-upstream/ (see bundle_members()).
+    """
+    vendor = vendor or Vendor()
+    prusa_dir = vendor.upstream_dir
+    build_prusa_dir = vendor.build_dir
+    
+    if upstream_files is None:
+        if not prusa_dir.exists():
+            logging.error(f'{vendor.name} directory does not exist')
+            sys.exit(1)
+        upstream_files = [f for f in prusa_dir.iterdir() if f.is_file()]
     
     # Create build PrusaResearch directory
     build_prusa_dir.mkdir(exist_ok=True)
     
-    copied_files = 0
+    written = None
+    pairs = []
     
-    # First, copy all files except .ini files and index.idx
-    for file_path in prusa_dir.iterdir():
-        if (file_path.is_file() and 
-            file_path.name != 'index.idx' and 
-            not file_path.name.endswith('.ini')):
-            dest_path = build_prusa_dir / file_path.name
-            dest_path.write_bytes(file_path.read_bytes())
-            copied_files += 1
-    
-    # Then, copy the modified PrusaResearch.ini from build/ if it exists, 
+    # Copy the modified PrusaResearch.ini from build/ if it exists, 
     # otherwise copy original .ini files
-    modified_ini = Path('build/PrusaResearch.ini')
-    if modified_ini.exists():
+    modified_ini = vendor.merged_ini
+    if content is not None or modified_ini.exists():
         # Use the modified version and rename it to match the latest version
-        import re
-        ini_files = [f for f in prusa_dir.glob('*.ini') if re.match(r'\d+\.\d+\.\d+\.ini$', f.name)]
-        if ini_files:
-            def parse_version(filename):
-                match = re.match(r'(\d+)\.(\d+)\.(\d+)', filename.name)
-                if match:
-                    return tuple(map(int, match.groups()))
-                return (0, 0, 0)
-            
-            latest_ini = max(ini_files, key=lambda x: parse_version(x))
+        latest_ini = find_latest_ini(upstream_files)
+        if latest_ini and content is not None:
             dest_path = build_prusa_dir / latest_ini.name
-            dest_path.write_bytes(modified_ini.read_bytes())
-            copied_files += 1
-            logging.info(f'Used modified {latest_ini.name} from build/PrusaResearch.ini')
+            # Replace rather than overwrite, it may be a hardlink into prusa-upstream/
+            dest_path.unlink(missing_ok=True)
+            with open(dest_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            written = dest_path
+            logging.info(f'Used merged configuration for {latest_ini.name}')
+        elif latest_ini:
+            # Linked, build.py replaces build/PrusaResearch.ini rather than rewriting it
+            pairs.append((modified_ini, build_prusa_dir / latest_ini.name))
+            logging.info(f'Used modified {latest_ini.name} from {modified_ini}')
     else:
         # Fallback: copy original .ini files
-        for file_path in prusa_dir.glob('*.ini'):
-            dest_path = build_prusa_dir / file_path.name
-            dest_path.write_bytes(file_path.read_bytes())
-            copied_files += 1
+        pairs += [(file_path, build_prusa_dir / file_path.name)
+                  for file_path in upstream_files if file_path.name.endswith('.ini')]
+    
+    stats = copy_files(pairs)
+    copied_files = len(pairs)
+    if written is not None:
+        stats['copied'] += 1
+        stats['bytes'] += written.stat().st_size
+        copied_files += 1
     
-    logging.info(f'Copied {copied_files} files to build/PrusaResearch/')
+    logging.info(f'Copied {copied_files} files to {build_prusa_dir}/: {describe_copy(stats)}')
+
+def bundle_members(vendor):
+    """(path, arcname) of every file of a vendor's directory in the offline zip, sorted by name.
+    
+    The .ini files are those in build/<Vendor>/; every other asset is read
+    straight from prusa-upstream/<Vendor>/ rather than copied into build/
+    first. index.idx is not part of the bundle.
+    """
+    files = {f.name: f for f in vendor.upstream_files
+             if f.name != 'index.idx' and not f.name.endswith('.ini')}
+    files.update((f.name, f) for f in vendor.build_dir.iterdir()
+                 if f.is_file() and f.name.endswith('.ini'))
+    return [(files[name], f'{vendor.name}/{name}') for name in sorted(files)]
+
+def create_offline_archive(compresslevel=None, workers=None, vendors=()):
+    """Create the final prusa-fff-offline.zip file.
 
-def create_offline_archive():
-    """Create the final prusa-fff-offline.zip file."""
+    The output is identical whatever the number of workers; workers=1
+    compresses serially. Members unchanged since the previous
+    build/prusa-fff-offline.zip are copied from it still compressed.
+    compresslevel is the deflate level of the .ini files and other
+    compressible members; images are stored (see archive.py). The
+    directories of further vendors follow PrusaResearch/.
+    """
     build_dir = Path('build')
+    vendors = [Vendor(), *vendors]
     
     # Check that all required components exist
     required_files = [
         'build/manifest.json',
         'build/vendor_indices_internal.zip',
-        'build/PrusaResearch'
+        *(vendor.build_dir for vendor in vendors)
     ]
     
     for required_file in required_files:
@@ -136,28 +211,70 @@ def create_offline_archive():
             logging.error(f'Required component {required_file} does not exist')
             sys.exit(1)
     
-    # Create the zip file
-    zip_path = 'build/prusa-fff-offline.zip'
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # Add manifest.json
-        zf.write('build/manifest.json', 'manifest.json')
-        
+    # Members in a fixed order so that the serial and parallel modes, and
+    # repeated runs, produce the same archive
+    members = [
+        ('build/manifest.json', 'manifest.json'),
         # Add vendor_indices.zip (using internal version)
-        zf.write('build/vendor_indices_internal.zip', 'vendor_indices.zip')
-        
-        # Add all PrusaResearch files
-        prusa_build_dir = Path('build/PrusaResearch')
-        for file_path in prusa_build_dir.iterdir():
-            if file_path.is_file():
-                arc_name = f'PrusaResearch/{file_path.name}'
-                zf.write(file_path, arc_name)
+        ('build/vendor_indices_internal.zip', 'vendor_indices.zip'),
+    ]
+    # Add all PrusaResearch files, then those of the other vendors
+    for vendor in vendors:
+        members += bundle_members(vendor)
+    
+    # The new archive is written aside and only replaces the last one once
+    # it is complete: until then unchanged members are copied from the last
+    # one without recompressing, and a failed build leaves it in place
+    zip_path = 'build/prusa-fff-offline.zip'
+    partial = Path(f'build/prusa-fff-offline.{os.getpid()}.part')
+    
+    # Create the zip file, deflating members on `workers` processes
+    try:
+        with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+            stats = write_members(zf, members, compresslevel, workers, zip_path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, zip_path)
+    logging.info(f"Reused {stats['reused']} compressed members, compressed {stats['compressed']}, "
+                 f"stored {stats['stored']}")
     
     # Get file size for logging
     file_size = Path(zip_path).stat().st_size
     logging.info(f'Created {zip_path} ({file_size:,} bytes)')
 
-def validate_archive():
-    """Validate the created archive matches expected structure."""
+def check_member(zf, name, digest=False):
+    """Stream a member through decompression so zipfile verifies its CRC.
+
+    Returns the sha256 hex digest of the contents when digest is True.
+    """
+    sha = hashlib.sha256() if digest else None
+    with zf.open(name) as f:
+        while chunk := f.read(1024 * 1024):
+            if sha:
+                sha.update(chunk)
+    return sha.hexdigest() if sha else None
+
+def check_members(zf, names, workers=None):
+    """Verify the CRCs of many members in parallel. Returns a list of error messages."""
+    def check(name):
+        try:
+            check_member(zf, name)
+        except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+            return f'{name}: {e}'
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [error for error in pool.map(check, names) if error]
+
+def validate_archive(upstream_files=None, vendors=()):
+    """Validate the created archive matches expected structure and contents.
+    
+    Every member, including those of the nested vendor_indices.zip, is
+    decompressed in memory to verify its CRC, and the merged ini in the
+    bundle must match build/PrusaResearch.ini. Further vendors are checked
+    the same way.
+    """
+    vendors = [Vendor(upstream_files=upstream_files), *vendors]
     zip_path = 'build/prusa-fff-offline.zip'
     
     if not Path(zip_path).exists():
@@ -178,58 +295,167 @@ def validate_archive():
             logging.error(f'Missing required entries: {missing_entries}')
             return False
         
-        # Check PrusaResearch directory exists
+        # Check every vendor directory exists
+        for vendor in vendors:
+            if not any(e.startswith(f'{vendor.name}/') for e in entries):
+                logging.error(f'No {vendor.name}/ entries found in archive')
+                return False
         prusa_entries = [e for e in entries if e.startswith('PrusaResearch/')]
-        if not prusa_entries:
-            logging.error('No PrusaResearch/ entries found in archive')
+        
+        # Check every member decompresses to its recorded CRC
+        errors = check_members(zf, zf.namelist())
+        if errors:
+            for error in errors:
+                logging.error(f'Corrupt archive member {error}')
             return False
         
-        # Validate vendor_indices.zip contains PrusaResearch.idx
+        # Validate vendor_indices.zip contains PrusaResearch.idx (and the
+        # index of every other vendor), opening it straight from memory
         try:
-            vendor_zip_data = zf.read('vendor_indices.zip')
-            with zipfile.ZipFile(os.path.join(os.path.dirname(__file__), 'temp_vendor.zip'), 'w') as temp_f:
-                temp_f.writestr('vendor_indices.zip', vendor_zip_data)
-            
-            # This is a workaround - create temp file to check contents
-            temp_path = Path('temp_vendor_indices.zip')
-            temp_path.write_bytes(vendor_zip_data)
-            
-            with zipfile.ZipFile(temp_path, 'r') as vendor_zf:
-                vendor_entries = vendor_zf.namelist()
-                if 'PrusaResearch.idx' not in vendor_entries:
-                    logging.error('PrusaResearch.idx not found in vendor_indices.zip')
-                    temp_path.unlink()
+            with zipfile.ZipFile(io.BytesIO(zf.read('vendor_indices.zip'))) as vendor_zf:
+                for vendor in vendors:
+                    if f'{vendor.name}.idx' not in vendor_zf.namelist():
+                        logging.error(f'{vendor.name}.idx not found in vendor_indices.zip')
+                        return False
+                errors = check_members(vendor_zf, vendor_zf.namelist())
+                if errors:
+                    logging.error(f'Corrupt vendor_indices.zip member {errors[0]}')
                     return False
-            
-            temp_path.unlink()
-            
-        except Exception as e:
+        except zipfile.BadZipFile as e:
             logging.error(f'Error validating vendor_indices.zip: {e}')
             return False
         
+        # The bundle must carry exactly the merged configuration
+        for vendor in vendors:
+            modified_ini = vendor.merged_ini
+            latest_ini = find_latest_ini(vendor.upstream_files)
+            if modified_ini.exists() and latest_ini:
+                ini_entry = f'{vendor.name}/{latest_ini.name}'
+                if ini_entry not in entries:
+                    logging.error(f'Merged configuration {ini_entry} not found in archive')
+                    return False
+                if check_member(zf, ini_entry, digest=True) != hash_file(modified_ini):
+                    logging.error(f'{ini_entry} in archive does not match {modified_ini}')
+                    return False
+        
         logging.info(f'Archive validation successful: {len(entries)} total entries, {len(prusa_entries)} PrusaResearch files')
         return True
 
-def main():
-    """Main release process."""
+def package_vendor(upstream_files=None, content=None, cache=None, vendor=None):
+    """Fill build/<Vendor>/ with the vendor's assets and merged .ini, unless it is up to date."""
+    vendor = vendor or Vendor(upstream_files=upstream_files)
+    cache = cache or BuildCache()
+    with metrics.stage('assets') as record:
+        ini_files = [f for f in vendor.upstream_files if f.name.endswith('.ini')]
+        modified_ini = [vendor.merged_ini] if vendor.merged_ini.exists() else []
+        assets_key = cache.key('assets', ini_files + modified_ini)
+        asset_outputs = [vendor.build_dir / f.name for f in ini_files]
+        record['cached'] = content is None and cache.fresh('assets', assets_key, asset_outputs)
+        if not record['cached']:
+            copy_prusa_research_files(vendor.upstream_files or None, content, vendor)
+            # The copy stage puts the upstream file back over the merged one
+            # when it runs again, which the recorded hashes catch
+            cache.store('assets', assets_key, asset_outputs)
+
+def package_vendor_indices(index_content=None, vendors=(), cache=None):
+    """Create vendor_indices.zip, unless the indices in it are unchanged."""
+    cache = cache or BuildCache()
+    with metrics.stage('vendor_indices') as record:
+        vendor_indices = [vendor.index_path for vendor in vendors]
+        if index_content is None:
+            vendor_key = cache.key('vendor_indices', ['build/index.idx', *vendor_indices])
+        else:
+            vendor_key = cache.key('vendor_indices', vendor_indices, [index_content])
+        vendor_outputs = ['build/vendor_indices.zip', 'build/vendor_indices_internal.zip']
+        record['cached'] = cache.fresh('vendor_indices', vendor_key, vendor_outputs)
+        if not record['cached']:
+            create_vendor_indices(index_content, vendors)
+            cache.store('vendor_indices', vendor_key, vendor_outputs)
+
+def package_offline_archive(main_vendor=None, vendors=(), cache=None, compresslevel=None):
+    """Create prusa-fff-offline.zip, unless every member is unchanged."""
+    main_vendor = main_vendor or Vendor()
+    cache = cache or BuildCache()
+    with metrics.stage('offline_zip') as record:
+        archive_inputs = ['build/manifest.json', 'build/vendor_indices_internal.zip']
+        for vendor in (main_vendor, *vendors):
+            archive_inputs += [path for path, _ in bundle_members(vendor)]
+        archive_key = cache.key('offline_zip', archive_inputs, [str(compresslevel)])
+        record['cached'] = cache.fresh('offline_zip', archive_key, ['build/prusa-fff-offline.zip'])
+        if not record['cached']:
+            create_offline_archive(compresslevel, vendors=vendors)
+            cache.store('offline_zip', archive_key, ['build/prusa-fff-offline.zip'])
+
+def check_archive(main_vendor=None, vendors=(), cache=None):
+    """Validate the offline archive, failing the release if it is broken.
+    
+    A broken archive is dropped from the cache, so that the next run builds
+    it again rather than skipping straight to the same failure.
+    """
+    main_vendor = main_vendor or Vendor()
+    with metrics.stage('validate'):
+        valid = validate_archive(main_vendor.upstream_files, vendors)
+    if not valid:
+        if cache is not None:
+            cache.forget('offline_zip')
+        logging.error('Archive validation failed')
+        sys.exit(1)
+
+def write_changelog(content=None, previous=None, vendor=None):
+    """Compare the merged configuration with the previous release, see changelog.py."""
+    vendor = vendor or Vendor()
+    if content is None:
+        if not vendor.merged_ini.exists():
+            logging.warning(f'{vendor.merged_ini} does not exist, skipping the profile changelog')
+            return
+        with open(vendor.merged_ini, 'r', encoding='utf-8') as f:
+            content = f.read()
+    with open('build/version.txt', 'r') as f:
+        version = f.read().strip()
+    
+    result = changelog.generate(version, content, previous)
+    changelog.update_release_notes(result)
+
+def main(index_content=None, upstream_files=None, content=None, cache=None, vendors=(), previous=None,
+         base_url=None, compresslevel=None):
+    """Main release process.
+    
+    When run after build.py in the same process (see pipeline.py), the
+    index.idx content, the upstream listing and the merged configuration are
+    passed in instead of being read back from disk. vendors are further
+    vendors whose bundles pipeline.py has already built and packaged; they
+    are added to the vendor indices and the offline archive. previous is the
+    offline zip or .ini of the release to list profile changes against,
+    found automatically when not given. base_url is where the bundle will be
+    downloaded from, if not the GitHub releases. compresslevel is the
+    deflate level of the offline archive, zlib's default if not given.
+    """
     logging.info('Starting release build process')
     
     # Create build directory
     Path('build').mkdir(exist_ok=True)
     
     try:
-        # Create all components
-        create_manifest()
-        create_vendor_indices()
-        copy_prusa_research_files()
+        cache = cache or BuildCache()
         
-        # Create final archive
-        create_offline_archive()
+        # Create all components, skipping those whose inputs are unchanged
+        with metrics.stage('manifest'):
+            create_manifest(base_url)
+        
+        package_vendor_indices(index_content, vendors, cache)
+        
+        main_vendor = Vendor(upstream_files=upstream_files)
+        package_vendor(content=content, cache=cache, vendor=main_vendor)
+        
+        # Before the offline zip, while build/ still holds the last one
+        with metrics.stage('changelog'):
+            write_changelog(content, previous, main_vendor)
+        
+        # Create final archive from whatever is now in build/
+        package_offline_archive(main_vendor, vendors, cache, compresslevel)
         
         # Validate the result
-        if not validate_archive():
-            logging.error('Archive validation failed')
-            sys.exit(1)
+        check_archive(main_vendor, vendors, cache)
         
         logging.info('Release build completed successfully')
         logging.info('Output files:')
@@ -237,10 +463,14 @@ def main():
         logging.info('  - build/vendor_indices.zip (vendor indices)')  
         logging.info('  - build/PrusaResearch.ini (standalone configuration)')
         logging.info('  - build/manifest.json (bundle manifest)')
+        logging.info('  - build/changelog.json (profile changes since the previous release)')
         
     except Exception as e:
         logging.error(f'Release build failed: {e}')
         sys.exit(1)
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        metrics.write_report()
@@ -0,0 +1,187 @@
+"""
+Dependency-graph scheduler for the stages of a pipeline run.
+
+Run in order, the version, build and release stages leave most of the
+machine idle: copying the upstream .ini files does not wait for the git
+history, and the manifest waits for nothing at all. Here each stage is a
+Task that names what it reads and what it writes; a task depends on the
+tasks whose outputs it reads, and starts as soon as they have finished.
+
+    tasks = [
+        Task('version', generate_version, outputs=['build/version.txt']),
+        Task('copy', copy_upstream, outputs=['build/PrusaResearch/*.ini']),
+        Task('merge', merge_files, inputs=['build/version.txt', 'build/PrusaResearch/*.ini'],
+             kind='cpu', args=lambda results: (results['version'],)),
+    ]
+    results = Scheduler(tasks).run()
+
+Inputs and outputs are only names; an input that no task writes is taken
+to be there already. `io` tasks run on a thread pool, `cpu` tasks on a
+process pool so that they do not hold the GIL against the others. A cpu
+task's function and arguments must therefore be picklable: a module-level
+function, called with plain values, whose effects are the files it writes
+and whatever it returns. `args` is called with the results of the tasks
+finished so far when the task is started, so it can hand on what an
+earlier task returned.
+
+Once every task has finished, the critical path is logged: the chain of
+tasks, each gated by the one before it, that decided how long the run took.
+The first failing task stops the run: nothing new is started, the tasks
+already running are waited for, and its exception is raised again.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import metrics
+
+KINDS = ('io', 'cpu')
+
+
+class Task:
+    """One stage: its function, the names it reads and writes, and whether it is I/O or CPU bound."""
+
+    def __init__(self, name, run, inputs=(), outputs=(), kind='io', args=None):
+        if kind not in KINDS:
+            raise ValueError(f'Task {name} has kind {kind!r}, not one of {", ".join(KINDS)}')
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.kind = kind
+        self.args = args
+        # Seconds since the start of the run
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return f'Task({self.name!r}, {self.kind})'
+
+
+def _run_in_process(run, args):
+    """Run a cpu task in a worker process, handing back the metrics stages it recorded."""
+    metrics.reset()
+    result = run(*args)
+    return result, metrics.take_records()
+
+
+def _process_context():
+    # Worker processes are started while the thread pool is busy, and
+    # forking a process with running threads can leave it with locks held
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+
+class Scheduler:
+    """Runs Tasks as soon as the tasks they depend on have finished."""
+
+    def __init__(self, tasks, threads=None, processes=None):
+        self.tasks = {}
+        producers = {}
+        for task in tasks:
+            if task.name in self.tasks:
+                raise ValueError(f'Two tasks are called {task.name}')
+            self.tasks[task.name] = task
+            for output in task.outputs:
+                if output in producers:
+                    raise ValueError(f'{output} is written by both {producers[output]} and {task.name}')
+                producers[output] = task.name
+        self.dependencies = {
+            task.name: {producers[name] for name in task.inputs if name in producers} - {task.name}
+            for task in self.tasks.values()
+        }
+        self.order = self._sort()
+        self.threads = threads
+        self.processes = processes or os.cpu_count() or 1
+        self.results = {}
+
+    def _sort(self):
+        """Task names in an order where each comes after its dependencies; fails on a cycle."""
+        order = []
+        remaining = {name: set(dependencies) for name, dependencies in self.dependencies.items()}
+        while remaining:
+            ready = sorted(name for name, dependencies in remaining.items() if not dependencies)
+            if not ready:
+                raise ValueError(f"Tasks depend on each other in a cycle: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+            order += ready
+        return order
+
+    def run(self):
+        """Run every task and return {task name: what it returned}."""
+        start = time.perf_counter()
+        waiting = list(self.order)
+        running = {}
+        failure = None
+        threads = ThreadPoolExecutor(max_workers=self.threads)
+        processes = None
+        if any(task.kind == 'cpu' for task in self.tasks.values()):
+            processes = ProcessPoolExecutor(max_workers=self.processes, mp_context=_process_context())
+        try:
+            while waiting or running:
+                if failure is None:
+                    for name in [name for name in waiting if self.dependencies[name] <= self.results.keys()]:
+                        waiting.remove(name)
+                        task = self.tasks[name]
+                        args = task.args(self.results) if task.args else ()
+                        task.started = time.perf_counter() - start
+                        if task.kind == 'cpu':
+                            future = processes.submit(_run_in_process, task.run, args)
+                        else:
+                            future = threads.submit(task.run, *args)
+                        running[future] = task
+                elif not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    task.finished = time.perf_counter() - start
+                    try:
+                        result = future.result()
+                    except BaseException as e:
+                        logging.error(f'Task {task.name} failed after {task.finished - task.started:.3f}s')
+                        failure = failure or e
+                        continue
+                    if task.kind == 'cpu':
+                        result, records = result
+                        metrics.add_records(records)
+                    self.results[task.name] = result
+        finally:
+            threads.shutdown()
+            if processes is not None:
+                processes.shutdown()
+        if failure is not None:
+            raise failure
+        self.log_critical_path(time.perf_counter() - start)
+        return self.results
+
+    def critical_path(self):
+        """The finished tasks that decided the run's length, first to last.
+
+        Starts from the task that finished last and walks back through the
+        dependency that finished last before it.
+        """
+        finished = [task for task in self.tasks.values() if task.finished is not None]
+        if not finished:
+            return []
+        task = max(finished, key=lambda task: task.finished)
+        path = [task]
+        while self.dependencies[task.name]:
+            task = max((self.tasks[name] for name in self.dependencies[task.name]),
+                       key=lambda task: task.finished)
+            path.append(task)
+        return path[::-1]
+
+    def log_critical_path(self, elapsed):
+        path = self.critical_path()
+        steps = ' -> '.join(f'{task.name} ({task.finished - task.started:.3f}s)' for task in path)
+        busy = sum(task.finished - task.started for task in self.tasks.values())
+        logging.info(f'Ran {len(self.tasks)} tasks in {elapsed:.3f}s ({busy:.3f}s of work)')
+        logging.info(f'Critical path: {steps}')
@@ -0,0 +1,136 @@
+"""
+Persistent index of the sections of the upstream vendor .ini files.
+
+Finding out whether upstream has a given profile, or where `[printer:*common*]`
+is, should not mean reading and parsing a multi-megabyte file. The first time
+an upstream .ini is looked at, its sections are indexed by (type, name) with
+their byte offset and length in the file and a hash of their content below
+the header, and the index is saved next to the build cache:
+
+    build/.cache/sections/<sha256 of the .ini>.json
+
+Because the sidecar is named after the file's hash, an .ini that changes
+simply gets a new one, built lazily on its first lookup; an unchanged one
+is only stat()ed when a BuildCache is at hand, see BuildCache.file_hash().
+Lookups are dictionary lookups, and a section's text is read straight from
+its offset.
+
+Offsets are of the original file, comments included. The content hash is
+of the raw bytes too, so it finds sections copied verbatim, such as a
+profile upstream renamed without changing it.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+from pathlib import Path
+
+from cache import CACHE_DIR, hash_file, read_sidecar, write_sidecar
+from ini_model import SECTION_HEADER_BYTES_RE, section_key
+
+INDEX_DIR = CACHE_DIR / 'sections'
+# Bump when the sidecar format changes
+INDEX_FORMAT = 1
+
+
+def content_digest(body):
+    """Hash of a section's bytes below its header line, ignoring trailing blank lines."""
+    return hashlib.blake2b(body.rstrip(), digest_size=16).hexdigest()
+
+
+def section_body(data, start=0, end=None):
+    """The part of data[start:end] after its first line, the section header."""
+    end = len(data) if end is None else end
+    newline = data.find(b'\n', start, end)
+    return data[newline + 1:end] if newline != -1 else b''
+
+
+class SectionIndex:
+    """(type, name) -> (offset, length, content hash) of every section of one .ini file."""
+
+    def __init__(self, path, sections):
+        self.path = Path(path)
+        self.sections = sections
+        self._digests = None
+
+    def __len__(self):
+        return len(self.sections)
+
+    def __contains__(self, key):
+        return key in self.sections
+
+    def get(self, key, default=None):
+        """(offset, length, content hash) of a section, or default if the file lacks it."""
+        return self.sections.get(key, default)
+
+    def keys(self, kind=None):
+        """Keys of the sections, in file order, of one type if given."""
+        return [key for key in self.sections if kind is None or key[0] == kind]
+
+    def find_digest(self, digest):
+        """Keys of the sections with the given content hash."""
+        if self._digests is None:
+            self._digests = {}
+            for key, (_, _, section_digest) in self.sections.items():
+                self._digests.setdefault(section_digest, []).append(key)
+        return self._digests.get(digest, [])
+
+    def read(self, key):
+        """Text of one section, read from its offset without loading the rest of the file."""
+        offset, length, _ = self.sections[key]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length).decode('utf-8')
+
+
+def build_sections(path):
+    """Index the sections of an .ini file; the first of duplicate sections wins."""
+    sections = {}
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return sections
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            headers = list(SECTION_HEADER_BYTES_RE.finditer(data))
+            for i, match in enumerate(headers):
+                end = headers[i + 1].start() if i + 1 < len(headers) else len(data)
+                key = section_key(match.group(1).decode('utf-8'))
+                if key not in sections:
+                    digest = content_digest(section_body(data, match.start(), end))
+                    sections[key] = (match.start(), end - match.start(), digest)
+    return sections
+
+
+def _read_sidecar(sidecar):
+    data = read_sidecar(sidecar, INDEX_FORMAT)
+    if data is None:
+        return None
+    return {(kind, name): (offset, length, digest) for kind, name, offset, length, digest in data['sections']}
+
+
+def _write_sidecar(sidecar, path, sections):
+    write_sidecar(sidecar, INDEX_FORMAT, {
+        'file': str(path),
+        'sections': [[kind, name, *entry] for (kind, name), entry in sections.items()],
+    })
+
+
+_loaded = {}
+
+
+def load_index(path, cache=None):
+    """The SectionIndex of an .ini file, from its sidecar, which is built first if missing."""
+    path = Path(path)
+    digest = cache.file_hash(path) if cache else hash_file(path)
+    index = _loaded.get((path, digest))
+    if index is not None:
+        return index
+    sidecar = INDEX_DIR / f'{digest}.json'
+    sections = _read_sidecar(sidecar)
+    if sections is None:
+        sections = build_sections(path)
+        _write_sidecar(sidecar, path, sections)
+        logging.info(f'Indexed {len(sections)} sections of {path} in {sidecar}')
+    index = SectionIndex(path, sections)
+    _loaded[(path, digest)] = index
+    return index
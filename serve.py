@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Serve the bundle in build/ to PrusaSlicer over HTTP, as a local mirror.
+
+    python pipeline.py all --base-url http://mirror.local:8000
+    python serve.py --port 8000 --base-url http://mirror.local:8000
+
+Every file in build/ (except the cache) is served with a strong ETag, the
+hash of its contents, and `Cache-Control: no-cache`, so a client that
+polls for updates revalidates with If-None-Match and gets an empty 304
+until the bundle actually changes. Byte ranges (Range, If-Range) let an
+interrupted download of the offline zip resume. Text files (.ini, .idx,
+.json, ...) are gzipped once per version and sent compressed to clients
+that accept it; the zips are sent as they are.
+
+/manifest.json is generated with its download URLs pointing at this server
+(--base-url, or the address it listens on, with the machine's host name for
+a wildcard address such as 0.0.0.0), unlike the
+build/manifest.json in the offline zip, which follows --base-url of the
+build. Nothing here needs network access beyond the listening socket, so
+it can be tried against localhost.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import re
+import socket
+import sys
+import threading
+from email.utils import formatdate
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from cache import CHUNK_SIZE, hash_file
+from release import manifest_content
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+BUILD_DIR = Path('build')
+# Types worth gzipping; zips and images are already compressed
+COMPRESSIBLE = {'.ini', '.idx', '.json', '.md', '.txt', '.svg'}
+CONTENT_TYPES = {'.ini': 'text/plain; charset=utf-8', '.idx': 'text/plain; charset=utf-8',
+                 '.md': 'text/markdown; charset=utf-8'}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class Artifact:
+    """One servable representation: a file in build/ or generated bytes, with its ETag."""
+
+    def __init__(self, path=None, data=None, content_type=None):
+        self.path = path
+        self.data = data
+        if path is not None:
+            stat = path.stat()
+            self.stamp = (stat.st_size, stat.st_mtime_ns)
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+            digest = hash_file(path)
+        else:
+            self.stamp = None
+            self.size = len(data)
+            self.mtime = None
+            digest = hashlib.sha256(data).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+        suffix = path.suffix if path is not None else '.json'
+        self.content_type = content_type or CONTENT_TYPES.get(suffix) or \
+            mimetypes.guess_type(f'x{suffix}')[0] or 'application/octet-stream'
+        self.compressible = suffix in COMPRESSIBLE
+        self._gzipped = None
+        self._lock = threading.Lock()
+
+    def gzipped(self):
+        """The gzip representation, compressed on first use."""
+        with self._lock:
+            if self._gzipped is None:
+                data = self.data if self.data is not None else self.path.read_bytes()
+                # mtime=0 so the same content always gives the same bytes
+                body = gzip.compress(data, compresslevel=9, mtime=0)
+                self._gzipped = Artifact(data=body, content_type=self.content_type)
+                # A strong ETag has to differ between representations
+                self._gzipped.etag = self.etag[:-1] + '-gzip"'
+                self._gzipped.mtime = self.mtime
+            return self._gzipped
+
+    def open(self):
+        if self.data is not None:
+            return _BytesReader(self.data)
+        return open(self.path, 'rb')
+
+
+class _BytesReader:
+    """Minimal file object over bytes, so both kinds of artifact are sent the same way."""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def seek(self, pos):
+        self._pos = pos
+
+    def read(self, size):
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class ArtifactCache:
+    """Artifacts by path, hashed again only when a file's size or mtime changes."""
+
+    def __init__(self, root=BUILD_DIR):
+        self.root = Path(root).resolve()
+        self._artifacts = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url_path):
+        """The file under root for a request path, or None for anything else."""
+        parts = [part for part in unquote(url_path).split('/') if part]
+        if not parts or any(part in ('.', '..') or part.startswith('.') for part in parts):
+            return None
+        path = self.root.joinpath(*parts)
+        return path if path.is_file() else None
+
+    def get(self, path):
+        stat = path.stat()
+        with self._lock:
+            artifact = self._artifacts.get(path)
+        if artifact is None or artifact.stamp != (stat.st_size, stat.st_mtime_ns):
+            artifact = Artifact(path)
+            with self._lock:
+                self._artifacts[path] = artifact
+        return artifact
+
+
+def parse_range(header, size):
+    """(start, end) of a single `bytes=` range, inclusive; None to send it all, False if unsatisfiable.
+
+    Several ranges in one request are answered with the whole file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def etag_matches(header, etag):
+    """True if an If-None-Match header lists the ETag (weak comparison, as RFC 9110 asks)."""
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+def accepts_gzip(header):
+    for coding in (header or '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            quality = params.strip()
+            return not re.match(r'^q=0(\.0*)?$', quality.replace(' ', ''))
+    return False
+
+
+class BundleHandler(BaseHTTPRequestHandler):
+    """GET and HEAD for the files of build/."""
+
+    server_version = 'SmartboxBundle/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def log_message(self, format, *args):
+        logging.info(f'{self.address_string()} {format % args}')
+
+    def manifest(self):
+        # Never from the Host header: any client could point the URLs elsewhere
+        data = json.dumps(manifest_content(self.server.base_url), separators=(',', ':')).encode('utf-8')
+        return Artifact(data=data, content_type='application/json')
+
+    def serve(self, send_body):
+        url_path = urlsplit(self.path).path
+        if url_path == '/manifest.json':
+            artifact = self.manifest()
+        else:
+            path = self.server.artifacts.resolve(url_path)
+            if path is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            try:
+                artifact = self.server.artifacts.get(path)
+            except FileNotFoundError:
+                # Replaced by a build between resolving and hashing it
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and if_range and if_range.strip() != artifact.etag:
+            range_header = None
+        # Ranges are of the file itself, so only whole responses are gzipped
+        encoding = None
+        if not range_header and artifact.compressible and accepts_gzip(self.headers.get('Accept-Encoding')):
+            artifact = artifact.gzipped()
+            encoding = 'gzip'
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, artifact.etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_common_headers(artifact, encoding)
+            self.end_headers()
+            return
+
+        start, end = 0, artifact.size - 1
+        status = HTTPStatus.OK
+        if range_header:
+            byte_range = parse_range(range_header, artifact.size)
+            if byte_range is False:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{artifact.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_common_headers(artifact, encoding)
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{artifact.size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if send_body and end >= start:
+            self.send_body(artifact, start, end - start + 1)
+
+    def send_common_headers(self, artifact, encoding):
+        self.send_header('ETag', artifact.etag)
+        self.send_header('Content-Type', artifact.content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        # Clients may keep a copy but have to revalidate it, which costs a 304
+        self.send_header('Cache-Control', 'no-cache')
+        if artifact.compressible or encoding:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if artifact.mtime is not None:
+            self.send_header('Last-Modified', formatdate(artifact.mtime, usegmt=True))
+
+    def send_body(self, artifact, start, length):
+        with artifact.open() as f:
+            f.seek(start)
+            while length > 0:
+                chunk = f.read(min(CHUNK_SIZE, length))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+
+def bound_url(address):
+    """http:// URL of a bound (host, port), naming this machine if it listens on every address."""
+    host, port = address[:2]
+    if host in ('0.0.0.0', '::', ''):
+        host = socket.gethostname()
+    elif ':' in host:
+        host = f'[{host}]'
+    return f'http://{host}:{port}'
+
+
+class BundleServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, build_dir=BUILD_DIR, base_url=None):
+        super().__init__(address, BundleHandler)
+        self.artifacts = ArtifactCache(build_dir)
+        self.base_url = base_url or bound_url(self.server_address)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the bundle in build/ to PrusaSlicer.')
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--directory', type=Path, default=BUILD_DIR, help='directory to serve')
+    parser.add_argument('--base-url', help='URL clients reach this server at, for /manifest.json '
+                                           '(default: the address it listens on)')
+    args = parser.parse_args(argv)
+
+    if not args.directory.is_dir():
+        logging.error(f'{args.directory} does not exist, build the bundle first')
+        sys.exit(1)
+    server = BundleServer((args.host, args.port), args.directory, args.base_url)
+    logging.info(f'Serving {args.directory}/ on http://{args.host}:{server.server_address[1]}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info('Stopped')
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import zipfile
+
+from archive import write_members
+
+
+def build(tmp_path, name, members, compresslevel, previous=None):
+    path = tmp_path / name
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        stats = write_members(zf, members, compresslevel, workers=1, previous=previous)
+    return path.read_bytes(), stats
+
+
+def ini_members(tmp_path):
+    members = []
+    for i in range(3):
+        path = tmp_path / f'{i}.ini'
+        path.write_text(''.join(f'key{n} = value {n * i}\n' for n in range(2000)), encoding='utf-8')
+        members.append((path, path.name))
+    return members
+
+
+def test_reuse_only_at_the_same_level(tmp_path):
+    members = ini_members(tmp_path)
+
+    default, _ = build(tmp_path, 'default.zip', members, None)
+    fast, stats = build(tmp_path, 'fast.zip', members, 1, previous=tmp_path / 'default.zip')
+    assert stats['reused'] == 0
+    assert fast != default
+
+    scratch, _ = build(tmp_path, 'scratch.zip', members, 1)
+    assert fast == scratch
+    again, stats = build(tmp_path, 'again.zip', members, 1, previous=tmp_path / 'fast.zip')
+    assert stats['reused'] == 3
+    assert again == scratch
+
+
+def test_reused_members_read_back(tmp_path):
+    members = ini_members(tmp_path)
+    build(tmp_path, 'first.zip', members, None)
+    _, stats = build(tmp_path, 'second.zip', members, None, previous=tmp_path / 'first.zip')
+    assert stats['reused'] == 3
+    with zipfile.ZipFile(tmp_path / 'second.zip') as zf:
+        assert zf.testzip() is None
+        for path, arcname in members:
+            assert zf.read(arcname) == path.read_bytes()
+
+
+class _Writer:
+    """A member writer without the private _compressor attribute."""
+
+    def __init__(self, dest):
+        self._dest = dest
+
+    def write(self, data):
+        return self._dest.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._dest.__exit__(*exc)
+
+
+def test_precompressed_fallback(tmp_path, monkeypatch):
+    members = ini_members(tmp_path)
+    first, _ = build(tmp_path, 'first.zip', members, None)
+
+    open_member = zipfile.ZipFile.open
+    monkeypatch.setattr(zipfile.ZipFile, 'open',
+                        lambda self, name, mode='r', **kwargs: _Writer(open_member(self, name, mode, **kwargs))
+                        if mode == 'w' else open_member(self, name, mode, **kwargs))
+    second, stats = build(tmp_path, 'second.zip', members, None, previous=tmp_path / 'first.zip')
+    assert stats['reused'] == 3
+    assert second == first
@@ -0,0 +1,26 @@
+from cache import BuildCache
+
+
+def test_replaced_output_is_a_miss(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    source = tmp_path / 'source.ini'
+    output = tmp_path / 'output.ini'
+    source.write_text('a = 1\n', encoding='utf-8')
+    output.write_text('merged\n', encoding='utf-8')
+    key = cache.key('assets', [source])
+    cache.store('assets', key, [output])
+    assert BuildCache(tmp_path / 'cache').fresh('assets', key, [output])
+
+    # Another stage puts something else in its place
+    output.write_text('upstream\n', encoding='utf-8')
+    assert not BuildCache(tmp_path / 'cache').fresh('assets', key, [output])
+
+
+def test_forget(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    cache.store('offline_zip', 'key')
+    cache.store('merge', 'other')
+    cache.forget('offline_zip')
+    reloaded = BuildCache(tmp_path / 'cache')
+    assert not reloaded.fresh('offline_zip', 'key')
+    assert reloaded.fresh('merge', 'other')
@@ -0,0 +1,42 @@
+from compatibility import CompatibilityMatrix
+from ini_model import IniModel
+
+BUNDLE = '''[printer:*common*]
+printer_notes = PRINTER_VENDOR_PRUSA3D
+
+[printer:Single]
+inherits = *common*
+nozzle_diameter = 0.4
+printer_model = MK4S
+
+[printer:Multi]
+inherits = *common*
+nozzle_diameter = 0.4,0.4,0.4,0.4,0.4
+printer_model = XL5
+
+[printer:Bare]
+nozzle_diameter = 0.6
+
+[filament:Single only]
+compatible_printers_condition = num_extruders == 1
+
+[filament:By preset]
+compatible_printers_condition = printer_preset == "Multi"
+
+[filament:By model]
+compatible_printers_condition = printer_model == "MK4S" or printer_notes =~ /.*PRUSA3D.*/
+
+[filament:Typo]
+compatible_printers_condition = nozle_diameter[0] == 0.4
+'''
+
+
+def test_conditions():
+    matrix = CompatibilityMatrix.evaluate(IniModel(BUNDLE))
+    assert matrix.printers_for('Single only') == ['Single', 'Bare']
+    assert matrix.printers_for('By preset') == ['Multi']
+    # Bare sets neither option, which reads as empty rather than failing
+    assert matrix.printers_for('By model') == ['Single', 'Multi']
+    assert matrix.printers_for('Typo') == []
+    assert len(matrix.errors) == 1
+    assert 'unknown option nozle_diameter' in matrix.errors[0]
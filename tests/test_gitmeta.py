@@ -0,0 +1,51 @@
+import subprocess
+
+import gitmeta
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', *args], cwd=repo, text=True,
+                                   env={'GIT_CONFIG_GLOBAL': '/dev/null', 'GIT_CONFIG_NOSYSTEM': '1',
+                                        'GIT_AUTHOR_NAME': 'a', 'GIT_AUTHOR_EMAIL': 'a@example.com',
+                                        'GIT_COMMITTER_NAME': 'a', 'GIT_COMMITTER_EMAIL': 'a@example.com',
+                                        'PATH': '/usr/bin:/bin:/usr/local/bin'}).strip()
+
+
+def commit(repo, message, date):
+    git(repo, 'commit', '--allow-empty', '-q', '-m', message, f'--date={date}')
+
+
+def test_tags_as_describe_picks_them(tmp_path):
+    git(tmp_path, 'init', '-q', '-b', 'main')
+    commit(tmp_path, 'first', '2024-01-01T00:00:00')
+    git(tmp_path, 'tag', 'v2.0.0')
+    git(tmp_path, 'checkout', '-q', '-b', 'side')
+    for n in range(3):
+        commit(tmp_path, f'side {n}', f'2024-01-0{n + 2}T00:00:00')
+    git(tmp_path, 'tag', 'v2.1.0-rc')
+    git(tmp_path, 'checkout', '-q', 'main')
+    commit(tmp_path, 'main', '2024-02-01T00:00:00')
+    git(tmp_path, 'tag', 'v2.0.1')
+    commit(tmp_path, 'later', '2024-02-02T00:00:00')
+    git(tmp_path, 'merge', '-q', '--no-ff', '-m', 'merge', 'side')
+
+    meta = gitmeta.collect(count=2, start=tmp_path)
+    assert meta['commit_count'] == git(tmp_path, 'rev-list', '--count', 'HEAD')
+    assert meta['latest_tag'] == git(tmp_path, 'describe', '--tags', '--abbrev=0')
+    assert meta['current_tag'] is None
+    assert [c['message'] for c in meta['recent_commits']] == ['merge', 'later']
+    assert meta['commit_hash'] == git(tmp_path, 'rev-parse', '--short', 'HEAD')
+    assert sorted(meta['tags']) == ['v2.0.0', 'v2.0.1', 'v2.1.0-rc']
+
+    git(tmp_path, 'tag', 'v2.2.0')
+    meta = gitmeta.collect(start=tmp_path)
+    assert meta['current_tag'] == meta['latest_tag'] == 'v2.2.0'
+
+
+def test_untagged_and_outside_git(tmp_path):
+    assert gitmeta.collect(start=tmp_path) is None
+    git(tmp_path, 'init', '-q')
+    commit(tmp_path, 'first', '2024-01-01T00:00:00')
+    meta = gitmeta.collect(start=tmp_path)
+    assert meta['commit_count'] == '1'
+    assert meta['latest_tag'] is None and meta['current_tag'] is None
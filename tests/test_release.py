@@ -0,0 +1,42 @@
+import zipfile
+
+import pytest
+
+import release
+
+
+def test_vendor_indices_are_reproducible(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    (tmp_path / 'build').mkdir()
+    release.create_vendor_indices('min_slic3r_version = 2.6.0\n2.5.11 Smartbox\n')
+    first = (tmp_path / 'build' / 'vendor_indices.zip').read_bytes()
+    (tmp_path / 'build' / 'vendor_indices.zip').unlink()
+    release.create_vendor_indices('min_slic3r_version = 2.6.0\n2.5.11 Smartbox\n')
+    assert (tmp_path / 'build' / 'vendor_indices.zip').read_bytes() == first
+
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    release.create_vendor_indices('min_slic3r_version = 2.6.0\n2.5.11 Smartbox\n')
+    with zipfile.ZipFile(tmp_path / 'build' / 'vendor_indices.zip') as zf:
+        assert zf.getinfo('PrusaResearch.idx').date_time == (2023, 11, 14, 22, 13, 20)
+
+
+def test_failed_archive_keeps_the_last_one(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    build = tmp_path / 'build'
+    (build / 'PrusaResearch').mkdir(parents=True)
+    (build / 'PrusaResearch' / '2.0.0.ini').write_text('[vendor]\nname = Prusa Research\n', encoding='utf-8')
+    (build / 'manifest.json').write_text('{}', encoding='utf-8')
+    (build / 'vendor_indices_internal.zip').write_bytes(b'')
+    release.create_offline_archive(workers=1)
+    archive = (build / 'prusa-fff-offline.zip').read_bytes()
+
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(release, 'write_members', fail)
+    with pytest.raises(OSError):
+        release.create_offline_archive(workers=1)
+    assert (build / 'prusa-fff-offline.zip').read_bytes() == archive
+    assert sorted(path.name for path in build.iterdir()) == [
+        'PrusaResearch', 'manifest.json', 'prusa-fff-offline.zip', 'vendor_indices_internal.zip']
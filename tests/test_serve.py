@@ -0,0 +1,95 @@
+import gzip
+import http.client
+import json
+import threading
+
+import pytest
+
+from serve import BundleServer
+
+INI = ''.join(f'key{n} = value {n}\n' for n in range(500)).encode('utf-8')
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'PrusaResearch').mkdir()
+    (tmp_path / 'PrusaResearch' / '2.0.0.ini').write_bytes(INI)
+    (tmp_path / 'prusa-fff-offline.zip').write_bytes(bytes(range(256)) * 4)
+    (tmp_path / '.cache').mkdir()
+    (tmp_path / '.cache' / 'stages.json').write_text('{}', encoding='utf-8')
+    (tmp_path.parent / 'secret.txt').write_text('secret', encoding='utf-8')
+    server = BundleServer(('127.0.0.1', 0), tmp_path)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_etag_and_not_modified(server):
+    response, body = get(server, '/prusa-fff-offline.zip')
+    assert response.status == 200
+    assert body == bytes(range(256)) * 4
+    etag = response.getheader('ETag')
+    assert etag.startswith('"')
+
+    response, body = get(server, '/prusa-fff-offline.zip', {'If-None-Match': etag})
+    assert response.status == 304
+    assert body == b''
+
+
+def test_ranges(server):
+    response, body = get(server, '/prusa-fff-offline.zip', {'Range': 'bytes=10-19'})
+    assert response.status == 206
+    assert response.getheader('Content-Range') == 'bytes 10-19/1024'
+    assert body == bytes(range(10, 20))
+
+    response, body = get(server, '/prusa-fff-offline.zip', {'Range': 'bytes=-4'})
+    assert response.status == 206
+    assert body == bytes(range(252, 256))
+
+    response, _ = get(server, '/prusa-fff-offline.zip', {'Range': 'bytes=2000-'})
+    assert response.status == 416
+    assert response.getheader('Content-Range') == 'bytes */1024'
+
+
+def test_gzip(server):
+    response, body = get(server, '/PrusaResearch/2.0.0.ini', {'Accept-Encoding': 'gzip'})
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(body) == INI
+    gzip_etag = response.getheader('ETag')
+
+    response, body = get(server, '/PrusaResearch/2.0.0.ini', {'Accept-Encoding': 'gzip;q=0'})
+    assert response.getheader('Content-Encoding') is None
+    assert body == INI
+    assert response.getheader('ETag') != gzip_etag
+
+    # Zips are sent as they are
+    response, _ = get(server, '/prusa-fff-offline.zip', {'Accept-Encoding': 'gzip'})
+    assert response.getheader('Content-Encoding') is None
+
+
+@pytest.mark.parametrize('path', ['/../secret.txt', '/%2e%2e/secret.txt', '/PrusaResearch/..%2f..%2fsecret.txt',
+                                  '/.cache/stages.json', '/missing.zip'])
+def test_outside_the_bundle_is_not_found(server, path):
+    response, _ = get(server, path)
+    assert response.status == 404
+
+
+def test_manifest_ignores_the_host_header(server):
+    response, body = get(server, '/manifest.json', {'Host': 'attacker.example'})
+    assert response.status == 200
+    manifest = json.loads(body)
+    host, port = server.server_address[:2]
+    assert manifest['offline_archive_url'] == f'http://{host}:{port}/prusa-fff-offline.zip'
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from ini_text import strip_comments, strip_comments_bytes
+
+
+def baseline_strip_comments(text):
+    """The line-by-line implementation strip_comments() replaced, kept as the reference."""
+    lines = []
+    for line in text.splitlines():
+        if 'colour' in line.lower():
+            # Preserve lines containing 'color' as is
+            lines.append(line.rstrip())
+            continue
+
+        # Find position of first # that isn't escaped
+        comment_pos = -1
+        i = 0
+        while i < len(line):
+            if line[i] == '#' and (i == 0 or line[i-1] != '\\'):
+                comment_pos = i
+                break
+            i += 1
+
+        if comment_pos != -1:
+            # Take only the part before the comment and strip whitespace
+            stripped_line = line[:comment_pos].rstrip()
+            lines.append(stripped_line)
+        else:
+            # No comment found, preserve the line as is
+            lines.append(line.rstrip())
+
+    return '\n'.join(lines)
+
+
+CASES = [
+    '',
+    '\n',
+    '\n\n\n',
+    'key = value',
+    'key = value\n',
+    'key = value\n\n\n',
+    '# a comment\nkey = value # trailing\n',
+    '#\n##\n   # indented\n',
+    'filament_colour = #FF8000\n',
+    'extruder_colour = "#FFFFFF;#000000" # not stripped\n',
+    'FILAMENT_COLOUR = #123456  \n',
+    'name = a\\#b # comment\n',
+    '\\# escaped at the start\n',
+    'end_gcode = M104 S0 \\\\# two backslashes\n',
+    'key = value   \t\n',
+    'crlf = 1\r\nnext = 2 # x\r\n',
+    'mixed = 1\rcr = 2\nlf = 3\r\n',
+    'nel = 1\x85next = 2 # x\x85',
+    'sep = 1\u2028para = 2\u2029end # x',
+    'vt = 1\x0bff = 2\x0cfs = 3\x1cgs = 4\x1drs = 5\x1e',
+    '[filament:Generic PLA]\ninherits = *common*\n# tuned\ntemperature = 215 ; note\n\n',
+    '   \n\t\n  # only whitespace and comments  \n',
+    'unicode = température # ünïcödé\n',
+]
+
+
+@pytest.mark.parametrize('text', CASES)
+def test_matches_baseline(text):
+    expected = baseline_strip_comments(text)
+    assert strip_comments(text) == expected
+    assert bytes(strip_comments_bytes(text.encode('utf-8'))) == expected.encode('utf-8')
+
+
+def test_random_corpus_matches_baseline():
+    rng = random.Random(20250101)
+    pieces = ['key', ' = ', 'value', '#', '\\', '\\#', ' ', '\t', '\n', '\r\n', '\r', '\x85',
+              '\u2028', '\u2029', '\x0b', '\x0c', '\x1c', 'colour', 'COLOUR', ';', 'é', '"']
+    for _ in range(5000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randrange(0, 40)))
+        expected = baseline_strip_comments(text)
+        assert strip_comments(text) == expected, repr(text)
+        assert bytes(strip_comments_bytes(text.encode('utf-8'))) == expected.encode('utf-8'), repr(text)
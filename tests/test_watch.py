@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from watch import LiveMerge
+
+UPSTREAM = '''[vendor]
+name = Prusa Research
+config_version = 1.0.0
+
+[filament:*common*]
+filament_type = PLA
+
+[filament:Old]
+inherits = *common*
+temperature = 200
+
+[printer:*common*]
+printer_model = MK4S
+
+[printer:Printer]
+inherits = *common*
+nozzle_diameter = 0.4
+'''
+REMOVAL = '[filament:Old]\ninherits = *common*\ntemperature = 200\n'
+REPLACEMENT = '[filament:Old]\ninherits = *common*\ntemperature = 210\n'
+ADDITION = '[filament:New]\ninherits = *common*\ntemperature = {}\n'
+
+RM = Path('Smartbox/old.rm.ini')
+ADD = Path('Smartbox/old.add.ini')
+OTHER = Path('Smartbox/new.add.ini')
+
+
+def test_failed_removal_blocks_later_rebuilds(tmp_path):
+    latest_ini = tmp_path / '1.0.0.ini'
+    latest_ini.write_text(UPSTREAM, encoding='utf-8')
+    merge = LiveMerge(latest_ini, '1.0.1')
+    overlays = {RM: REMOVAL, ADD: REPLACEMENT, OTHER: ADDITION.format(220)}
+    model = merge.apply(overlays, set(overlays))
+    assert model is not None and not model.duplicates
+
+    # A removal that no longer matches upstream fails the rebuild...
+    overlays[RM] = REMOVAL.replace('200', '999')
+    assert merge.apply(overlays, {RM}) is None
+
+    # ...and every rebuild after it until it is fixed, whatever changed
+    overlays[OTHER] = ADDITION.format(230)
+    assert merge.apply(overlays, {OTHER}) is None
+
+    overlays[RM] = REMOVAL
+    model = merge.apply(overlays, {RM})
+    assert model is not None and not model.duplicates
+    assert model.get(('filament', 'New')).get('temperature') == '230'
@@ -0,0 +1,70 @@
+"""
+Where each vendor bundle's inputs and outputs live.
+
+The upstream repository ships one directory per vendor (PrusaResearch,
+Creality, ...). PrusaResearch with the Smartbox/ overlays is the main
+bundle: it decides the version, and its outputs stay where CI expects them
+(build/PrusaResearch.ini, build/index.idx, ...). Further vendors, each with
+its own overlay directory, keep their merged .ini and index under
+build/vendors/<Vendor>/. Every vendor's bundle directory, build/<Vendor>/,
+goes into the one offline archive.
+"""
+
+import logging
+from pathlib import Path
+
+MAIN_VENDOR = 'PrusaResearch'
+MAIN_OVERLAY_DIR = Path('Smartbox')
+UPSTREAM_ROOT = Path('prusa-upstream')
+BUILD_ROOT = Path('build')
+
+
+class Vendor:
+    """Paths of one vendor bundle."""
+
+    def __init__(self, name=MAIN_VENDOR, overlay_dir=None, upstream_files=None):
+        self.name = name
+        if overlay_dir is None:
+            # Overlays for other vendors live in Smartbox/<Vendor>/
+            overlay_dir = MAIN_OVERLAY_DIR if name == MAIN_VENDOR else MAIN_OVERLAY_DIR / name
+        self.overlay_dir = Path(overlay_dir)
+        self.upstream_dir = UPSTREAM_ROOT / name
+        self.build_dir = BUILD_ROOT / name
+        self.output_dir = BUILD_ROOT if name == MAIN_VENDOR else BUILD_ROOT / 'vendors' / name
+        self.merged_ini = self.output_dir / f'{name}.ini'
+        self.index_path = self.output_dir / 'index.idx'
+        self.compatibility_path = self.output_dir / 'compatibility.json'
+        self.catalog_path = self.output_dir / 'profiles.sqlite'
+        self._upstream_files = upstream_files
+
+    def __repr__(self):
+        return f'Vendor({self.name!r}, {str(self.overlay_dir)!r})'
+
+    def report_missing_upstream(self):
+        """Log that the vendor has no upstream x.y.z.ini, usually a submodule that was never checked out."""
+        logging.error(f'Upstream {self.name} bundle not found in {self.upstream_dir}; '
+                      f'run git submodule update --init')
+
+    @property
+    def is_main(self):
+        return self.name == MAIN_VENDOR
+
+    @property
+    def upstream_files(self):
+        """Every file in the upstream vendor directory, listed once."""
+        if self._upstream_files is None:
+            if self.upstream_dir.exists():
+                self._upstream_files = sorted(f for f in self.upstream_dir.iterdir() if f.is_file())
+            else:
+                self._upstream_files = []
+        return self._upstream_files
+
+    @property
+    def ini_files(self):
+        return [f for f in self.upstream_files if f.suffix == '.ini']
+
+
+def parse_vendor(spec):
+    """Parse a NAME or NAME=OVERLAY_DIR command line argument."""
+    name, _, overlay_dir = spec.partition('=')
+    return Vendor(name, overlay_dir or None)
@@ -4,47 +4,42 @@ Version generation for Smartbox PrusaSlicer configurations.
 Generates semantic versions and release notes based on git history and Smartbox filaments.
 """
 
-import subprocess
 import sys
 import json
 import re
 from datetime import datetime
 from pathlib import Path
 
-def get_git_info():
-    """Get git information for versioning."""
-    try:
-        # Get current commit hash
-        commit_hash = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], 
-                                             text=True).strip()
-        
-        # Get commit count
-        commit_count = subprocess.check_output(['git', 'rev-list', '--count', 'HEAD'], 
-                                              text=True).strip()
-        
-        # Check if we're on a tag
-        try:
-            current_tag = subprocess.check_output(['git', 'describe', '--exact-match', '--tags'], 
-                                                 text=True, stderr=subprocess.DEVNULL).strip()
-        except subprocess.CalledProcessError:
-            current_tag = None
-        
-        # Get latest tag for version bumping
-        try:
-            latest_tag = subprocess.check_output(['git', 'describe', '--tags', '--abbrev=0'], 
-                                                text=True, stderr=subprocess.DEVNULL).strip()
-        except subprocess.CalledProcessError:
-            latest_tag = "v9.2.0"  # Default starting version
-        
-        return {
-            'commit_hash': commit_hash,
-            'commit_count': commit_count,
-            'current_tag': current_tag,
-            'latest_tag': latest_tag
-        }
-    except subprocess.CalledProcessError as e:
-        print(f"Git command failed: {e}")
+import gitmeta
+import metrics
+from cache import BuildCache
+from section_index import load_index
+
+VERSION_OUTPUTS = ['build/version.txt', 'build/release_notes.md', 'build/version_info.json', 'build/index.idx']
+
+def get_git_info(git_meta=None):
+    """Get git information for versioning.
+    
+    git_meta is the result of gitmeta.collect(), which gathers this and the
+    tag set and recent commits in a single git call.
+    """
+    if git_meta is None:
+        git_meta = gitmeta.collect()
+    if git_meta is None:
+        print("Git command failed: no git history available")
         return None
+    
+    return {
+        'commit_hash': git_meta['commit_hash'],
+        'commit_count': git_meta['commit_count'],
+        'current_tag': git_meta['current_tag'],
+        # Latest tag for version bumping, or the default starting version
+        'latest_tag': git_meta['latest_tag'] or "v9.2.0"
+    }
+
+def get_git_state():
+    """Get HEAD and every tag with the commit it points at, read straight from .git."""
+    return gitmeta.state(gitmeta.read_refs())
 
 def parse_version(version_str):
     """Parse a version string like 'v9.3.0' into (9, 3, 0)."""
@@ -58,7 +53,7 @@ def parse_version(version_str):
     except (ValueError, IndexError):
         return (9, 2, 0)  # Default fallback
 
-def generate_version(git_info=None, prusa_base_version=None):
+def generate_version(git_info=None, prusa_base_version=None, tags=None):
     """Generate the next version number based on existing tags and Prusa version."""
     if not git_info:
         git_info = get_git_info()
@@ -70,28 +65,21 @@ def generate_version(git_info=None, prusa_base_version=None):
             return tag_version
     
     # Get all existing 2.x.x tags to find the highest version
-    try:
-        all_tags = subprocess.check_output(['git', 'tag', '-l'], text=True).strip().split('\n')
-        smartbox_tags = []
-        
-        for tag in all_tags:
-            clean_tag = tag.lstrip('v')
-            if re.match(r'^2\.\d+\.\d+$', clean_tag):
-                try:
-                    parts = clean_tag.split('.')
-                    version_tuple = (int(parts[0]), int(parts[1]), int(parts[2]))
-                    smartbox_tags.append(version_tuple)
-                except (ValueError, IndexError):
-                    continue
-        
-        if smartbox_tags:
-            # Get the highest existing version and increment patch
-            latest_version = max(smartbox_tags)
-            major, minor, patch = latest_version
-            return f"{major}.{minor}.{patch + 1}"
-    
-    except subprocess.CalledProcessError:
-        pass
+    if tags is None:
+        refs = gitmeta.read_refs()
+        tags = gitmeta.tag_names(refs) if refs else []
+    
+    smartbox_tags = []
+    for tag in tags:
+        clean_tag = tag.lstrip('v')
+        if re.match(r'^2\.\d+\.\d+$', clean_tag):
+            parts = clean_tag.split('.')
+            smartbox_tags.append((int(parts[0]), int(parts[1]), int(parts[2])))
+    
+    if smartbox_tags:
+        # Get the highest existing version and increment patch
+        major, minor, patch = max(smartbox_tags)
+        return f"{major}.{minor}.{patch + 1}"
     
     # Fallback: base on Prusa version if no existing tags found
     if not prusa_base_version:
@@ -106,18 +94,33 @@ def generate_version(git_info=None, prusa_base_version=None):
     else:
         return "2.4.0"
 
-def get_smartbox_filaments():
-    """Get list of current Smartbox filaments from add/rm files."""
-    smartbox_dir = Path('Smartbox')
+def read_overlays(overlay_dir='Smartbox'):
+    """Read every Smartbox overlay file once, returning {path: text} in path order."""
+    overlays = {}
+    for path in sorted(Path(overlay_dir).glob('*.ini')):
+        with open(path, 'r', encoding='utf-8') as f:
+            overlays[path] = f.read()
+    return overlays
+
+def get_smartbox_filaments(overlays=None, upstream_ini=None):
+    """Get list of current Smartbox filaments from add/rm files.
+    
+    With upstream_ini, the upstream .ini the overlays apply to, each
+    filament is also looked up in its section index (see section_index.py),
+    warning about removals of filaments upstream lacks and additions of
+    ones it already has.
+    """
+    if overlays is None:
+        overlays = read_overlays()
     added_filaments = set()
     removed_filaments = set()
     replaced_filaments = set()
     
     # Process .add.ini files
-    for add_file in smartbox_dir.glob('*.add.ini'):
-        with open(add_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
+    for add_file, content in overlays.items():
+        if not add_file.name.endswith('.add.ini'):
+            continue
+        
         # Extract primary filament names (not variants with @)
         filament_matches = re.findall(r'^\[filament:([^\]@]+)\]', content, re.MULTILINE)
         for match in filament_matches:
@@ -126,10 +129,10 @@ def get_smartbox_filaments():
                 added_filaments.add(filament_name)
     
     # Process .rm.ini files  
-    for rm_file in smartbox_dir.glob('*.rm.ini'):
-        with open(rm_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
+    for rm_file, content in overlays.items():
+        if not rm_file.name.endswith('.rm.ini'):
+            continue
+        
         # Extract filament names that are being removed/replaced
         filament_matches = re.findall(r'^\[filament:([^\]@]+)\]', content, re.MULTILINE)
         for match in filament_matches:
@@ -143,17 +146,31 @@ def get_smartbox_filaments():
                     added_filaments.remove(filament_name)
                     removed_filaments.remove(filament_name)
     
+    if upstream_ini is not None:
+        index = load_index(upstream_ini)
+        for filament_name in sorted(removed_filaments | replaced_filaments):
+            if ('filament', filament_name) not in index:
+                print(f"Warning: removed filament {filament_name} is not in {upstream_ini}")
+        for filament_name in sorted(added_filaments):
+            if ('filament', filament_name) in index:
+                print(f"Warning: added filament {filament_name} is already in {upstream_ini}, "
+                      f"remove it there in a .rm.ini to replace it")
+    
     return {
         'added': sorted(list(added_filaments)),
         'removed': sorted(list(removed_filaments)),
         'replaced': sorted(list(replaced_filaments))
     }
 
-def get_prusa_base_version():
+def find_upstream_ini(ini_files, prusa_base_version):
+    """The upstream .ini of the Prusa base version, or None if it is not among ini_files."""
+    return next((f for f in ini_files or [] if f.name == f'{prusa_base_version}.ini'), None)
+
+def get_prusa_base_version(ini_files=None):
     """Get the base Prusa configuration version we're extending."""
     # Find the highest numbered .ini file
-    prusa_dir = Path('prusa-upstream/PrusaResearch')
-    ini_files = list(prusa_dir.glob('*.ini'))
+    if ini_files is None:
+        ini_files = list(Path('prusa-upstream/PrusaResearch').glob('*.ini'))
     
     # Parse version numbers and find the latest
     versions = []
@@ -176,8 +193,8 @@ def get_prusa_base_version():
     
     return "2.3.0"  # Fallback
 
-def generate_index_idx(version, filaments, prusa_base_version):
-    """Generate the index.idx file content."""
+def generate_index_idx(version, filaments, prusa_base_version, upstream_index='prusa-upstream/PrusaResearch/index.idx'):
+    """Generate the index.idx file content, keeping the entries of the upstream index."""
     lines = []
     
     # Add minimum slicer version
@@ -198,7 +215,7 @@ def generate_index_idx(version, filaments, prusa_base_version):
     lines.append(f"{version} Smartbox custom configuration bundle based on Prusa {prusa_base_version}. {filament_summary}.")
     
     # Read existing index.idx and add all other entries (except our custom ones)
-    index_file = Path('prusa-upstream/PrusaResearch/index.idx')
+    index_file = Path(upstream_index)
     if index_file.exists():
         with open(index_file, 'r', encoding='utf-8') as f:
             existing_lines = f.readlines()
@@ -211,26 +228,29 @@ def generate_index_idx(version, filaments, prusa_base_version):
     
     return '\n'.join(lines) + '\n'
 
-def get_last_commits(count=5):
+def write_vendor_index(version, vendor, overlays=None):
+    """Generate and save index.idx for a vendor other than PrusaResearch, returning its content.
+    
+    The version itself always comes from the main bundle, see generate().
+    """
+    if overlays is None:
+        overlays = read_overlays(vendor.overlay_dir)
+    with metrics.stage('index'):
+        base_version = get_prusa_base_version(vendor.ini_files)
+        filaments = get_smartbox_filaments(overlays, find_upstream_ini(vendor.ini_files, base_version))
+        index_content = generate_index_idx(version, filaments, base_version, vendor.upstream_dir / 'index.idx')
+        vendor.output_dir.mkdir(parents=True, exist_ok=True)
+        with open(vendor.index_path, 'w', encoding='utf-8') as f:
+            f.write(index_content)
+    return index_content
+
+def get_last_commits(count=5, git_meta=None):
     """Get recent commit messages for release notes."""
-    try:
-        # Get last few commits with format: hash|date|message
-        cmd = ['git', 'log', f'-{count}', '--pretty=format:%h|%ci|%s']
-        output = subprocess.check_output(cmd, text=True).strip()
-        
-        commits = []
-        for line in output.split('\n'):
-            if '|' in line:
-                hash_part, date_part, message = line.split('|', 2)
-                commits.append({
-                    'hash': hash_part,
-                    'date': date_part.split()[0],  # Just the date part
-                    'message': message
-                })
-        
-        return commits
-    except subprocess.CalledProcessError:
+    if git_meta is None:
+        git_meta = gitmeta.collect(count)
+    if git_meta is None:
         return []
+    return git_meta['recent_commits'][:count]
 
 def generate_release_notes(version, filaments, prusa_base_version, recent_commits):
     """Generate release notes based on current state."""
@@ -309,13 +329,14 @@ def generate_release_notes(version, filaments, prusa_base_version, recent_commit
     
     return '\n'.join(notes)
 
-def main():
-    """Main function to generate version and release notes."""
-    git_info = get_git_info()
-    prusa_base_version = get_prusa_base_version()
-    version = generate_version(git_info, prusa_base_version)
-    filaments = get_smartbox_filaments()
-    recent_commits = get_last_commits()
+def write_version_info(ini_files=None, overlays=None):
+    """Generate the version, index.idx and release notes and save them to build/."""
+    git_meta = gitmeta.collect()
+    git_info = get_git_info(git_meta)
+    prusa_base_version = get_prusa_base_version(ini_files)
+    version = generate_version(git_info, prusa_base_version, git_meta['tags'] if git_meta else None)
+    filaments = get_smartbox_filaments(overlays, find_upstream_ini(ini_files, prusa_base_version))
+    recent_commits = get_last_commits(git_meta=git_meta)
     
     # Generate index.idx content
     index_content = generate_index_idx(version, filaments, prusa_base_version)
@@ -348,6 +369,55 @@ def main():
     with open('build/index.idx', 'w') as f:
         f.write(index_content)
     
+    result['index'] = index_content
+    return result
+
+def generate(ini_files=None, overlays=None, cache=None):
+    """Generate version information, or load it from build/ if its inputs are unchanged.
+    
+    ini_files and overlays let a caller that has already listed the upstream
+    .ini files and read the Smartbox overlays pass them in. The returned
+    dict also carries the index.idx content under 'index'.
+    """
+    with metrics.stage('version') as record:
+        prusa_dir = Path('prusa-upstream/PrusaResearch')
+        if ini_files is None:
+            ini_files = list(prusa_dir.glob('*.ini'))
+        if overlays is None:
+            overlays = read_overlays()
+        
+        # Everything the version depends on: git HEAD and tags, the Smartbox
+        # overlays and the upstream index and .ini file names
+        cache = cache or BuildCache()
+        git_state = get_git_state()
+        inputs = list(overlays)
+        if (prusa_dir / 'index.idx').exists():
+            inputs.append(prusa_dir / 'index.idx')
+        ini_names = sorted(f.name for f in ini_files)
+        version_key = cache.key('version', inputs, [git_state, *ini_names])
+        
+        if git_state is not None and cache.fresh('version', version_key, VERSION_OUTPUTS):
+            with open('build/version_info.json', 'r') as f:
+                result = json.load(f)
+            with open('build/index.idx', 'r') as f:
+                result['index'] = f.read()
+            record['cached'] = True
+            return result
+        
+        record['cached'] = False
+        result = write_version_info(ini_files, overlays)
+        if git_state is not None:
+            cache.store('version', version_key)
+        return result
+
+def main(ini_files=None, overlays=None, cache=None):
+    """Main function to generate version and release notes."""
+    result = generate(ini_files, overlays, cache)
+    
+    version = result['version']
+    filaments = result['filaments']
+    prusa_base_version = result['prusa_base_version']
+    
     # Summary for display
     all_filaments = filaments['added'] + filaments['replaced']
     
@@ -380,4 +450,7 @@ def main():
     return result
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        metrics.write_report()
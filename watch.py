@@ -0,0 +1,233 @@
+"""
+Watch mode: rebuild the bundle within a second of saving an overlay.
+
+    python pipeline.py watch
+
+After one full build, the stripped upstream configuration stays parsed in
+memory as a single live IniModel, together with a ProfileResolver holding
+every resolved profile. Smartbox/ and prusa-upstream/PrusaResearch are
+polled for changed files. When overlays change, only they are re-applied:
+the sections a changed .rm.ini removed before are put back and its new ones
+removed, the blocks of the changed .add.ini files are replaced, and only the
+profiles inheriting from a section that was touched are resolved again.
+Any change upstream reloads everything.
+
+Each rebuild writes the merged .ini files and index.idx as build.py and
+version.py would, and refreshes vendor_indices.zip and the offline zip,
+which copies every member that did not change from the previous one. A
+broken overlay (a removal that does not match, an unknown parent) is
+reported and leaves the outputs as they were until it is fixed, as does an
+added filament that no printer would offer. build/profiles.sqlite is left
+to full builds; writing it takes longer than the rest of a rebuild.
+"""
+
+import logging
+import time
+
+import build
+import release
+import version
+from build import remove_sections
+from compatibility import CompatibilityMatrix, check_overlays
+from fileops import copy_file
+from ini_model import IniModel, format_key
+from ini_text import read_stripped, strip_comments
+from profiles import ProfileResolver
+from vendors import Vendor
+
+# Seconds between two scans for changed files
+POLL_INTERVAL = 0.2
+# Separator build.py puts after every addition file
+ADDITION_SEPARATOR = '\n\n\n\n\n'
+
+
+class LiveMerge:
+    """The merged configuration, kept in memory and updated one overlay at a time."""
+
+    def __init__(self, latest_ini, version_str):
+        self.model = IniModel(read_stripped(latest_ini))
+        vendor = self.model.get(('vendor', ''))
+        if vendor is None or not vendor.set('config_version', version_str):
+            logging.warning('config_version not found in content')
+        self.resolver = ProfileResolver(self.model)
+        self.matrix = None
+        # Sections removed by each .rm.ini and the parsed block of each .add.ini
+        self.removals = {}
+        self.additions = {}
+        # .rm.ini files that did not apply, tried again on every apply()
+        self.failed = set()
+
+    def apply(self, overlays, changed):
+        """Re-apply the overlay files in changed (added, edited or deleted).
+
+        overlays maps every current overlay path to its text. Returns the
+        merged model, or None after logging why it could not be built.
+        Overlays that failed before are re-applied too, so that nothing is
+        written until they are fixed.
+        """
+        changed = set(changed) | self.failed
+        problems = []
+        touched = set()
+        # Removals only ever apply to upstream sections, so the additions
+        # are taken out while they are redone and put back afterwards
+        self.model.remove_inserts()
+
+        rm_files = sorted(path for path in changed if path.name.endswith('.rm.ini'))
+        for path in rm_files:
+            for section in self.removals.pop(path, ()):
+                self.model.restore(section)
+                touched.add(section.key)
+        for path in rm_files:
+            self.failed.discard(path)
+            if path not in overlays:
+                continue
+            removals = IniModel(strip_comments(overlays[path]))
+            sections = [self.model.get(section.key) for section in removals.sections]
+            file_problems = remove_sections(self.model, removals)
+            if file_problems:
+                problems += [f'{path}: {problem}' for problem in file_problems]
+                self.failed.add(path)
+            else:
+                self.removals[path] = sections
+                touched.update(section.key for section in sections)
+
+        for path in sorted(path for path in changed if path.name.endswith('.add.ini')):
+            block = self.additions.pop(path, None)
+            if block is not None:
+                touched.update(section.key for section in block.sections)
+            content = strip_comments(overlays[path]) if path in overlays else ''
+            if content.strip():
+                block = IniModel(content + ADDITION_SEPARATOR)
+                self.additions[path] = block
+                touched.update(section.key for section in block.sections)
+        for path in sorted(self.additions):
+            self.model.insert_before(('printer', '*common*'), self.additions[path])
+
+        for key in touched:
+            self.resolver.invalidate(key)
+        _, errors = self.resolver.resolve_all()
+        if not problems and not errors:
+            self.matrix = CompatibilityMatrix.evaluate(self.model, self.resolver)
+            problems = check_overlays(self.matrix, overlays)
+        for problem in problems + errors:
+            logging.error(problem)
+        if problems or errors:
+            return None
+        for key in self.model.duplicates:
+            logging.warning(f'Duplicate section {format_key(key)} in merged configuration')
+        return self.model
+
+
+def scan(paths):
+    """(mtime, size) of every file among paths, to spot changes between two scans."""
+    state = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        state[path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+class Watcher:
+    """Polls the overlays and the upstream directory and rebuilds on every change."""
+
+    def __init__(self, version_str, vendor=None, interval=POLL_INTERVAL):
+        self.version = version_str
+        self.vendor = vendor or Vendor()
+        self.interval = interval
+        self.merge = None
+        self.overlays = {}
+        self.index_content = None
+
+    def scan_overlays(self):
+        return scan(self.vendor.overlay_dir.glob('*.ini'))
+
+    def scan_upstream(self):
+        if not self.vendor.upstream_dir.is_dir():
+            return {}
+        return scan(self.vendor.upstream_dir.iterdir())
+
+    def reload(self):
+        """Parse the upstream configuration again and apply every overlay to it."""
+        self.vendor = Vendor(self.vendor.name, self.vendor.overlay_dir)
+        latest_ini = build.find_latest_ini(self.vendor.ini_files)
+        if latest_ini is None:
+            self.vendor.report_missing_upstream()
+            return None, True
+        build.copy_upstream_ini_files(self.vendor.ini_files, self.vendor.build_dir)
+        self.merge = LiveMerge(latest_ini, self.version)
+        self.overlays = version.read_overlays(self.vendor.overlay_dir)
+        return self.merge.apply(self.overlays, set(self.overlays)), True
+
+    def update(self, changed):
+        """Read the changed overlays and re-apply just those."""
+        if self.merge is None:
+            # Nothing to apply them to until upstream is back
+            return None, False
+        for path in changed:
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.overlays[path] = f.read()
+            else:
+                self.overlays.pop(path, None)
+        self.overlays = dict(sorted(self.overlays.items()))
+        return self.merge.apply(self.overlays, changed), False
+
+    def write(self, model, upstream_changed):
+        """Write everything in build/ that depends on the merged configuration."""
+        build.write_merged(model, self.version, self.vendor)
+        self.merge.matrix.write(self.vendor.compatibility_path)
+        if upstream_changed:
+            release.copy_prusa_research_files(self.vendor.upstream_files, vendor=self.vendor)
+        else:
+            latest_ini = self.vendor.build_dir / build.find_latest_ini(self.vendor.ini_files).name
+            copy_file(self.vendor.merged_ini, latest_ini)
+
+        filaments = version.get_smartbox_filaments(self.overlays)
+        base_version = version.get_prusa_base_version(self.vendor.ini_files)
+        index_content = version.generate_index_idx(self.version, filaments, base_version,
+                                                   self.vendor.upstream_dir / 'index.idx')
+        if index_content != self.index_content:
+            with open(self.vendor.index_path, 'w', encoding='utf-8') as f:
+                f.write(index_content)
+            release.create_vendor_indices(index_content)
+            self.index_content = index_content
+        release.create_offline_archive()
+
+    def rebuild(self, changed=None):
+        started = time.perf_counter()
+        if changed is None:
+            model, upstream_changed = self.reload()
+        else:
+            model, upstream_changed = self.update(changed)
+        if model is None:
+            logging.error('Build failed, the outputs were left unchanged')
+            return
+        self.write(model, upstream_changed)
+        logging.info(f'Rebuilt in {time.perf_counter() - started:.3f}s')
+
+    def run(self):
+        """Build once, then rebuild on every change until interrupted."""
+        overlays = self.scan_overlays()
+        upstream = self.scan_upstream()
+        release.create_manifest()
+        self.rebuild()
+        logging.info(f'Watching {self.vendor.overlay_dir}/ and {self.vendor.upstream_dir}/, press Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(self.interval)
+                new_overlays = self.scan_overlays()
+                new_upstream = self.scan_upstream()
+                if new_upstream != upstream:
+                    logging.info(f'{self.vendor.upstream_dir} changed, reloading')
+                    self.rebuild()
+                elif new_overlays != overlays:
+                    changed = {path for path in overlays.keys() | new_overlays.keys()
+                               if overlays.get(path) != new_overlays.get(path)}
+                    logging.info(f"Changed: {', '.join(sorted(path.name for path in changed))}")
+                    self.rebuild(changed)
+                overlays, upstream = new_overlays, new_upstream
+        except KeyboardInterrupt:
+            logging.info('Stopped watching')